@@ -1,45 +1,16 @@
-import psycopg2
-from dash import Dash
-import dash_core_components as dcc
-import dash_html_components as html
-from dash.dependencies import Input, Output
-from django_plotly_dash import DjangoDash
-
-# Используйте DjangoDash вместо обычного Dash
-app = DjangoDash('search_dash')  # Имя должно совпадать с именем, указанным в шаблоне
-
-# Лейаут и коллбеки
-app.layout = html.Div([
-    html.H1("Поиск периодов по планетам"),
-    dcc.Dropdown(
-        id='planet-condition-dropdown',
-        options=[{'label': 'Planet 1', 'value': 'P1'}, {'label': 'Planet 2', 'value': 'P2'}],
-        value=[],
-        multi=True
-    ),
-    html.Div(id='output')
-])
-
-@app.callback(
-    Output('output', 'children'),
-    [Input('planet-condition-dropdown', 'value')]
-)
-def update_output(selected_planets):
-    if selected_planets:
-        return f'Вы выбрали: {", ".join(selected_planets)}'
-    return "Выберите планету"
+import uuid
 
+from dash import dcc, html
+from dash.dependencies import ALL, Input, Output, State
+from django_plotly_dash import DjangoDash
 
+from search.periods import format_period_bound, period_days
+from search.queries import normalize_conditions
+from search.streaming import conditions_from_normalized, get_cached_periods
 
-# Подключение к базе данных
-def get_db_connection():
-    conn = psycopg2.connect(
-        dbname="planetary_market_data",
-        user="user",  # Замените на реальное имя пользователя
-        password="",  # Замените на пароль пользователя
-        host="localhost"
-    )
-    return conn
+# Используйте DjangoDash вместо обычного Dash. Модуль импортируется при первом обращении
+# к приложению (dash_app.registry.load_dash_app), а не при загрузке URLconf
+app = DjangoDash('search_dash')  # Имя должно совпадать с именем, указанным в шаблоне
 
 
 # Обозначения планет
@@ -87,7 +58,11 @@ app.layout = html.Div([
 
     html.Button('Найти периоды', id='search-button', n_clicks=0),
 
-    html.Div(id='output-periods')
+    html.Div(id='output-periods'),
+
+    # Условия поиска, результат которого еще не в кэше: его порциями выводит клиентский коллбек через ws/search/
+    dcc.Store(id='search-spec'),
+    dcc.Store(id='search-stream')
 ])
 
 
@@ -126,42 +101,140 @@ def generate_planet_conditions(selected_planets):
 
 
 
-def search_periods(n_clicks, zodiac_values, retrograde_values, selected_planets):
-    if n_clicks == 0:
-        return ""
+# Больше периодов не выводится, чтобы ответ коллбека оставался небольшим
+MAX_PERIODS_SHOWN = 500
 
-    if not selected_planets:
-        return "Пожалуйста, выберите планеты и их условия."
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    planets_data = {}
-
-    # Создаем условия для каждой выбранной планеты
-    for i, planet in enumerate(selected_planets):
-        selected_zodiac = zodiac_values[i]
-        retrograde = retrograde_values[i]
-
-        query = f"SELECT date, zodiac_sign, retrograde FROM planetary_positions WHERE planet = '{planet}' AND zodiac_sign = '{selected_zodiac}'"
-
-        if 'R' in retrograde:
-            query += " AND retrograde = '(R)'"
-        else:
-            query += " AND (retrograde != '(R)' OR retrograde IS NULL)"
-
-        cursor.execute(query)
-        result = cursor.fetchall()
 
-        if result:
-            planets_data[planet] = result
-
-    conn.close()
+def render_periods(periods):
+    output = [html.P(f"Найдено периодов: {len(periods)}")]
+    for start, end in periods[:MAX_PERIODS_SHOWN]:
+        days = round(period_days(start, end), 1)
+        output.append(html.P(f"{format_period_bound(start)} — {format_period_bound(end)} ({days:g} дн.)"))
+    if len(periods) > MAX_PERIODS_SHOWN:
+        output.append(html.P(f"... и еще {len(periods) - MAX_PERIODS_SHOWN}"))
+    return output
 
-    # Формируем вывод
-    output = []
-    for planet, data in planets_data.items():
-        for start, sign, retrograde in data:
-            output.append(html.P(f"{planet} в знаке {sign}: {start}"))
 
-    return output
+# Поиск периодов по условиям из динамических полей (ALL). Результат из кэша (по набору условий
+# и версии данных) выводится сразу; иначе условия передаются клиентскому коллбеку, который
+# получает слитые периоды порциями через websocket и выводит их по мере поступления
+@app.callback(
+    [Output('output-periods', 'children'),
+     Output('search-spec', 'data')],
+    [Input('search-button', 'n_clicks'),
+     Input({'type': 'zodiac-dropdown', 'index': ALL}, 'value'),
+     Input({'type': 'retrograde-checklist', 'index': ALL}, 'value')],
+    [State({'type': 'zodiac-dropdown', 'index': ALL}, 'id'),
+     State({'type': 'retrograde-checklist', 'index': ALL}, 'id')]
+)
+def search_periods(n_clicks, zodiac_values, retrograde_values, zodiac_ids, retrograde_ids):
+    if not n_clicks:
+        return "", None
+
+    if not zodiac_ids:
+        return "Пожалуйста, выберите планеты и их условия.", None
+
+    retrograde_by_planet = {
+        component_id['index']: value or [] for component_id, value in zip(retrograde_ids, retrograde_values)
+    }
+    conditions = [
+        {'planet': component_id['index'], 'zodiac_sign': sign,
+         'retrograde': 'R' if 'R' in retrograde_by_planet.get(component_id['index'], []) else ''}
+        for component_id, sign in zip(zodiac_ids, zodiac_values)
+        if sign
+    ]
+    if not conditions:
+        return "Выберите знак зодиака хотя бы для одной планеты.", None
+
+    normalized = normalize_conditions(conditions)
+    if not normalized:
+        return "Периодов не найдено.", None
+
+    periods = get_cached_periods(normalized)
+    if periods is not None:
+        return (render_periods(periods) if periods else "Периодов не найдено."), None
+
+    # Контейнеры, которые заполняет клиентский коллбек; новый поиск заменяет их и отменяет старый
+    placeholder = [html.P("Поиск...", id='search-stream-status'), html.Div(id='search-stream-results')]
+    spec = {'id': uuid.uuid4().hex, 'conditions': conditions_from_normalized(normalized),
+            'max_shown': MAX_PERIODS_SHOWN}
+    return placeholder, spec
+
+
+app.clientside_callback(
+    """
+    function (spec) {
+        const stream = window.periodSearchStream = window.periodSearchStream || {socket: null, id: null, pending: null};
+        stream.id = spec ? spec.id : null;
+        if (!spec) {
+            if (stream.socket && stream.socket.readyState === WebSocket.OPEN) {
+                stream.socket.send(JSON.stringify({type: 'cancel'}));
+            }
+            return window.dash_clientside.no_update;
+        }
+
+        let shown = 0;
+        const message = {type: 'search', id: spec.id, conditions: spec.conditions};
+        stream.onmessage = function (data) {
+            if (data.id !== stream.id) {
+                return;  // Порции отмененного поиска
+            }
+            const status = document.getElementById('search-stream-status');
+            const results = document.getElementById('search-stream-results');
+            if (!status || !results) {
+                return;
+            }
+            if (data.type === 'periods') {
+                data.periods.forEach(function (period) {
+                    if (shown++ < spec.max_shown) {
+                        // Даты — границы включительно, моменты индекса событий — полуинтервал
+                        const span = (Date.parse(period[1]) - Date.parse(period[0])) / 86400000;
+                        const days = period[0].length > 10 ? span.toFixed(1) : Math.round(span) + 1;
+                        const item = document.createElement('p');
+                        item.textContent = period[0] + ' — ' + period[1] + ' (' + days + ' дн.)';
+                        results.appendChild(item);
+                    }
+                });
+                status.textContent = 'Поиск... найдено периодов: ' + shown;
+            } else if (data.type === 'summary') {
+                status.textContent = data.count ? 'Найдено периодов: ' + data.count : 'Периодов не найдено.';
+                if (data.count > spec.max_shown) {
+                    const more = document.createElement('p');
+                    more.textContent = '... и еще ' + (data.count - spec.max_shown);
+                    results.appendChild(more);
+                }
+            } else if (data.type === 'error') {
+                status.textContent = 'Ошибка поиска: ' + data.error;
+            }
+        };
+
+        if (stream.socket && stream.socket.readyState === WebSocket.OPEN) {
+            stream.socket.send(JSON.stringify(message));  // Сервер отменяет предыдущий поиск
+        } else {
+            stream.pending = message;
+            if (!stream.socket || stream.socket.readyState > WebSocket.OPEN) {
+                const scheme = window.location.protocol === 'https:' ? 'wss://' : 'ws://';
+                stream.socket = new WebSocket(scheme + window.location.host + '/ws/search/');
+                stream.socket.onopen = function () {
+                    if (stream.pending) {
+                        stream.socket.send(JSON.stringify(stream.pending));
+                        stream.pending = null;
+                    }
+                };
+                stream.socket.onmessage = function (event) {
+                    stream.onmessage(JSON.parse(event.data));
+                };
+                stream.socket.onerror = function () {
+                    const status = document.getElementById('search-stream-status');
+                    if (status) {
+                        status.textContent = 'Потоковая выдача недоступна (нужен ASGI-сервер).';
+                    }
+                };
+            }
+        }
+        return window.dash_clientside.no_update;
+    }
+    """,
+    Output('search-stream', 'data'),
+    [Input('search-spec', 'data')]
+)
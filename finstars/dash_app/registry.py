@@ -0,0 +1,24 @@
+"""
+Ленивая регистрация приложений Dash.
+
+Модуль с приложением DjangoDash импортируется не при загрузке URLconf, а при первом
+обращении к приложению по имени: django_plotly_dash вызывает load_dash_app
+(PLOTLY_DASH['stateless_loader']), если приложения еще нет в реестре.
+"""
+from importlib import import_module
+
+# Имя приложения (как в {% plotly_app name=... %}) -> модуль, который его создает
+DASH_APP_MODULES = {
+    'search_dash': 'dash_app.dash_apps',
+}
+
+
+def load_dash_app(name):
+    module_name = DASH_APP_MODULES.get(name)
+    if module_name is None:
+        return None
+
+    from django_plotly_dash.dash_wrapper import usable_apps
+
+    import_module(module_name)
+    return usable_apps.get(name)
@@ -1,3 +1,74 @@
-from django.test import TestCase
+import datetime
+import os
+import subprocess
+import sys
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from search.queries import normalize_conditions
+
+from . import dash_apps
+from .registry import load_dash_app
+
+MARS_IDS = ([{'type': 'zodiac-dropdown', 'index': 'Ma'}], [{'type': 'retrograde-checklist', 'index': 'Ma'}])
+
+
+class SearchCallbackTests(SimpleTestCase):
+    def search(self, sign='3', retrograde=None):
+        return dash_apps.search_periods(1, [sign], [retrograde or []], *MARS_IDS)
+
+    def test_cached_periods_are_rendered(self):
+        periods = [(datetime.date(2024, 1, 1), datetime.date(2024, 1, 10))]
+        with mock.patch('dash_app.dash_apps.get_cached_periods', return_value=periods) as get_cached_periods:
+            output, spec = self.search(retrograde=['R'])
+
+        get_cached_periods.assert_called_once_with(
+            normalize_conditions([{'planet': 'Ma', 'zodiac_sign': '3', 'retrograde': 'R'}]))
+        self.assertIsNone(spec)
+        self.assertEqual([paragraph.children for paragraph in output],
+                         ['Найдено периодов: 1', '2024-01-01 — 2024-01-10 (10 дн.)'])
+
+    def test_uncached_search_goes_to_stream(self):
+        with mock.patch('dash_app.dash_apps.get_cached_periods', return_value=None):
+            output, spec = self.search()
+
+        self.assertEqual(spec['conditions'], [{'planet': 'Ma', 'zodiac_sign': '3', 'retrograde': ''}])
+        self.assertEqual(spec['max_shown'], dash_apps.MAX_PERIODS_SHOWN)
+        self.assertEqual(output[0].id, 'search-stream-status')
+
+    def test_no_sign_selected(self):
+        with mock.patch('dash_app.dash_apps.get_cached_periods') as get_cached_periods:
+            output, spec = self.search(sign=None)
+
+        get_cached_periods.assert_not_called()
+        self.assertEqual((output, spec), ("Выберите знак зодиака хотя бы для одной планеты.", None))
+
+
+# Загрузка URLconf в отдельном процессе: в этом процессе dash уже импортирован тестами
+URLCONF_IMPORTS = '''
+import sys
+import django
+django.setup()
+from django.urls import get_resolver, resolve
+get_resolver().url_patterns
+resolve('/search/')
+print('dash' in sys.modules, 'dash_app.dash_apps' in sys.modules)
+'''
+
+
+class LazyDashTests(SimpleTestCase):
+    def load_urlconf(self, dash_enabled):
+        env = dict(os.environ, FINSTARS_DASH=dash_enabled)
+        result = subprocess.run([sys.executable, '-c', URLCONF_IMPORTS], env=env, cwd=settings.BASE_DIR,
+                                capture_output=True, text=True, check=True)
+        return result.stdout.split()
+
+    def test_dash_is_not_imported_when_disabled(self):
+        self.assertEqual(self.load_urlconf('0'), ['False', 'False'])
+
+    def test_dash_app_module_is_loaded_on_first_use(self):
+        self.assertEqual(self.load_urlconf('1')[1], 'False')
+        self.assertIs(load_dash_app('search_dash'), dash_apps.app)
+        self.assertIsNone(load_dash_app('unknown'))
@@ -13,4 +13,16 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'finstars.settings')
 
-application = get_asgi_application()
+# Django инициализируется до импорта consumers (они используют модели и настройки)
+django_asgi_application = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from channels.security.websocket import AllowedHostsOriginValidator  # noqa: E402
+
+from search.routing import websocket_urlpatterns  # noqa: E402
+
+application = ProtocolTypeRouter({
+    'http': django_asgi_application,
+    # Потоковая выдача результатов поиска (search.consumers)
+    'websocket': AllowedHostsOriginValidator(URLRouter(websocket_urlpatterns)),
+})
@@ -0,0 +1,98 @@
+"""
+Асинхронный доступ к базе для async-представлений.
+
+В PostgreSQL запросы идут через AsyncConnectionPool (psycopg_pool): корутина ждет ответа базы,
+не занимая поток, и один ASGI-воркер обслуживает много запросов одновременно. Пул создается
+на каждый цикл событий (пулы psycopg к нему привязаны). Для других баз (SQLite в разработке)
+запрос выполняется обычным курсором Django в потоке через sync_to_async.
+"""
+import asyncio
+import time
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+
+from .profiling import record_query
+
+_pools = weakref.WeakKeyDictionary()
+
+# Ключи OPTIONS, которые разбирает сам Django, а не libpq
+DJANGO_ONLY_OPTIONS = ('pool', 'isolation_level', 'server_side_binding', 'assume_role', 'prepare_threshold')
+
+
+def get_conninfo():
+    """
+    Строка подключения с теми же параметрами, что у синхронных соединений Django:
+    OPTIONS (sslmode, options, service и т. п.) передаются как есть
+    """
+    from psycopg.conninfo import make_conninfo
+
+    database = settings.DATABASES['default']
+    params = {key: value for key, value in database.get('OPTIONS', {}).items() if key not in DJANGO_ONLY_OPTIONS}
+    params.update({
+        'dbname': database.get('NAME'),
+        'user': database.get('USER'),
+        'password': database.get('PASSWORD'),
+        'host': database.get('HOST'),
+        'port': database.get('PORT'),
+        'client_encoding': 'UTF8',
+    })
+    return make_conninfo(**{key: str(value) for key, value in params.items() if value})
+
+
+def is_async_pool_available():
+    if connection.vendor != 'postgresql':
+        return False
+    try:
+        import psycopg_pool  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+async def get_async_pool():
+    """Пул текущего цикла событий; открывается при первом обращении"""
+    from psycopg_pool import AsyncConnectionPool
+
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = AsyncConnectionPool(
+            get_conninfo(),
+            min_size=getattr(settings, 'DATABASE_POOL_MIN_SIZE', 2),
+            max_size=getattr(settings, 'DATABASE_POOL_MAX_SIZE', 10),
+            open=False,
+        )
+        _pools[loop] = pool
+        await pool.open()
+    return pool
+
+
+def _fetch_all_sync(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+async def fetch_all(sql, params=()):
+    """Все строки запроса (плейсхолдеры %s, как в курсоре Django)"""
+    if not is_async_pool_available():
+        return await sync_to_async(_fetch_all_sync)(sql, params)
+
+    pool = await get_async_pool()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cursor:
+            # Курсор psycopg не проходит через execute_wrappers Django — время учитывается здесь
+            started = time.perf_counter()
+            try:
+                await cursor.execute(sql, params)
+                return await cursor.fetchall()
+            finally:
+                record_query(time.perf_counter() - started)
+
+
+async def fetch_one(sql, params=()):
+    rows = await fetch_all(sql, params)
+    return rows[0] if rows else None
@@ -0,0 +1,51 @@
+"""
+Асинхронный HTTP-клиент для внешних API в async-представлениях (пара к finstars.http_client).
+
+Клиент httpx держит keep-alive соединения в пуле; он создается на каждый цикл событий.
+Таймауты, число повторов и задержка между ними берутся из тех же настроек, что и у
+синхронной сессии (HTTP_TIMEOUT, HTTP_RETRIES, HTTP_BACKOFF_FACTOR, HTTP_POOL_SIZE).
+"""
+import asyncio
+import weakref
+
+import httpx
+from django.conf import settings
+
+from .http_client import RETRY_STATUSES
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        connect_timeout, read_timeout = getattr(settings, 'HTTP_TIMEOUT', (5, 30))
+        pool_size = getattr(settings, 'HTTP_POOL_SIZE', 10)
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+        _clients[loop] = client
+    return client
+
+
+async def get_json(url, params=None):
+    """
+    GET с повторами временных ошибок (соединение, 429, 5xx) и экспоненциальной задержкой.
+    Ошибки — httpx.HTTPError.
+    """
+    retries = getattr(settings, 'HTTP_RETRIES', 3)
+    backoff_factor = getattr(settings, 'HTTP_BACKOFF_FACTOR', 0.5)
+    client = get_async_client()
+
+    for attempt in range(retries + 1):
+        try:
+            response = await client.get(url, params=params)
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                response.raise_for_status()
+                return response.json()
+        except httpx.TransportError:
+            if attempt == retries:
+                raise
+        await asyncio.sleep(backoff_factor * (2 ** attempt))
@@ -0,0 +1,113 @@
+"""
+Параллельная загрузка независимых источников данных (база, yfinance, Open-Meteo).
+
+Источники запускаются в общем пуле потоков; каждый ждется не дольше своего таймаута,
+отсчитанного с момента, когда источник получил поток (ожидание в очереди пула в таймаут
+не входит, но ограничено FETCH_QUEUE_TIMEOUT). Ошибка или таймаут одного источника не мешают
+остальным: его результат просто отсутствует, а причина попадает в errors.
+"""
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'FETCH_MAX_WORKERS', 8),
+                thread_name_prefix='fetch',
+            )
+        return _executor
+
+
+def _run_source(state, function, args):
+    state['started_at'] = time.monotonic()
+    state['started'].set()
+    try:
+        return function(*args)
+    finally:
+        # Соединения с базой, открытые в рабочем потоке, возвращаются (в пул) сразу
+        connections.close_all()
+
+
+def fetch_concurrently(sources, timeout=None):
+    """
+    sources — {имя: (функция, аргументы)} или {имя: (функция, аргументы, таймаут)}.
+    Возвращает (results, errors): {имя: результат} для успешных источников
+    и {имя: исключение} для упавших или не уложившихся в таймаут.
+    """
+    default_timeout = timeout if timeout is not None else getattr(settings, 'FETCH_TIMEOUT', 30)
+    executor = get_executor()
+
+    queue_deadline = time.monotonic() + getattr(settings, 'FETCH_QUEUE_TIMEOUT', 30)
+    futures = {}
+    for name, source in sources.items():
+        function, args = source[0], source[1]
+        source_timeout = source[2] if len(source) > 2 else default_timeout
+        state = {'started': threading.Event(), 'started_at': None}
+        # Контекст вызывающего потока (замер запроса, см. finstars.profiling) переносится в рабочий
+        context = contextvars.copy_context()
+        futures[name] = (executor.submit(context.run, _run_source, state, function, args), state, source_timeout)
+
+    results, errors = {}, {}
+    for name, (future, state, source_timeout) in futures.items():
+        try:
+            if not state['started'].wait(max(queue_deadline - time.monotonic(), 0)):
+                if future.cancel():
+                    logger.warning("Source %s did not get a worker in time", name)
+                    errors[name] = TimeoutError()
+                    continue
+                # Поток достался источнику в последний момент
+                state['started'].wait()
+            # Таймаут отсчитывается от старта самого источника, поэтому очередь пула его не съедает
+            remaining = max(state['started_at'] + source_timeout - time.monotonic(), 0)
+            results[name] = future.result(timeout=remaining)
+        except TimeoutError as e:
+            future.cancel()
+            errors[name] = e
+            logger.warning("Source %s timed out after %ss", name, source_timeout)
+        except Exception as e:
+            errors[name] = e
+            logger.warning("Source %s failed: %s", name, e)
+
+    return results, errors
+
+
+async def gather_sources(sources, timeout=None):
+    """
+    fetch_concurrently для async-представлений: sources — {имя: (корутинная функция, аргументы[, таймаут])},
+    все источники ожидаются одновременно в цикле событий. Возвращает (results, errors).
+    """
+    default_timeout = timeout if timeout is not None else getattr(settings, 'FETCH_TIMEOUT', 30)
+
+    async def run(name, source):
+        source_timeout = source[2] if len(source) > 2 else default_timeout
+        return await asyncio.wait_for(source[0](*source[1]), timeout=source_timeout)
+
+    names = list(sources)
+    outcomes = await asyncio.gather(*(run(name, sources[name]) for name in names), return_exceptions=True)
+
+    results, errors = {}, {}
+    for name, outcome in zip(names, outcomes):
+        if isinstance(outcome, asyncio.TimeoutError):
+            errors[name] = outcome
+            logger.warning("Source %s timed out", name)
+        elif isinstance(outcome, Exception):
+            errors[name] = outcome
+            logger.warning("Source %s failed: %s", name, outcome)
+        else:
+            results[name] = outcome
+    return results, errors
@@ -0,0 +1,118 @@
+"""
+Общий кэш результатов, вычисляемых по эфемеридам и котировкам: годовые тайлы графика (graph.tiles),
+готовые фигуры (graph.views) и результаты поиска периодов (search.streaming).
+
+Ключи содержат версию данных: после загрузки новых данных старые записи просто перестают читаться.
+Версию увеличивают загрузчики и пересборки (bump_data_version) — в том числе когда меняются
+значения за уже загруженные даты, что по числу строк и последней дате не заметить.
+Модуль не зависит от приложений проекта, поэтому его импортируют и search, и graph.
+"""
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+from django.db import connection, transaction
+
+from .async_db import fetch_one
+
+FIGURE_CACHE_ALIAS = 'figures'
+
+VERSION_QUERY = '''
+    SELECT
+        (SELECT COUNT(*) FROM planetary_positions),
+        (SELECT MAX(date) FROM planetary_positions),
+        (SELECT COUNT(*) FROM market_data),
+        (SELECT MAX(date) FROM market_data),
+        (SELECT COUNT(*) FROM planetary_events),
+        (SELECT MAX(moment) FROM planetary_events),
+        (SELECT COALESCE(SUM(version), 0) FROM data_versions);
+'''
+
+BUMP_VERSION_QUERY = '''
+    INSERT INTO data_versions (name, version) VALUES (%s, 1)
+    ON CONFLICT (name) DO UPDATE SET version = data_versions.version + 1;
+'''
+
+_version = None
+_version_checked_at = 0.0
+_version_lock = threading.Lock()
+
+
+def get_tile_cache():
+    try:
+        return caches[FIGURE_CACHE_ALIAS]
+    except InvalidCacheBackendError:
+        return None
+
+
+def get_ephemeris_file_stamp():
+    """
+    mtime и размер EPHEMERIS_FILE: поиск и график читают файл, если он есть,
+    поэтому новый экспорт тоже меняет версию. Без файла — пустые значения.
+    """
+    path = getattr(settings, 'EPHEMERIS_FILE', None)
+    try:
+        stat = os.stat(path) if path else None
+    except OSError:
+        stat = None
+    return ('', '') if stat is None else (stat.st_mtime_ns, stat.st_size)
+
+
+def format_version(row):
+    # Момент события содержит пробел, недопустимый в ключах memcached
+    return '-'.join(str(value) for value in row).replace(' ', 'T')
+
+
+def get_data_version():
+    """
+    Версия данных для ключей кэша. Сверяется с базой не чаще, чем раз в
+    FIGURE_CACHE_VERSION_CHECK_INTERVAL секунд, — остальные запросы базу не трогают.
+    """
+    global _version, _version_checked_at
+
+    check_interval = getattr(settings, 'FIGURE_CACHE_VERSION_CHECK_INTERVAL', 60)
+    if _version is not None and time.monotonic() - _version_checked_at < check_interval:
+        return _version
+
+    with _version_lock:
+        if _version is None or time.monotonic() - _version_checked_at >= check_interval:
+            with connection.cursor() as cursor:
+                cursor.execute(VERSION_QUERY)
+                _version = format_version(tuple(cursor.fetchone()) + get_ephemeris_file_stamp())
+            _version_checked_at = time.monotonic()
+        return _version
+
+
+async def get_data_version_async():
+    """get_data_version для async-представлений: проверка версии идет через асинхронный пул"""
+    global _version, _version_checked_at
+
+    check_interval = getattr(settings, 'FIGURE_CACHE_VERSION_CHECK_INTERVAL', 60)
+    if _version is not None and time.monotonic() - _version_checked_at < check_interval:
+        return _version
+
+    row = await fetch_one(VERSION_QUERY)
+    with _version_lock:
+        _version = format_version(tuple(row) + get_ephemeris_file_stamp())
+        _version_checked_at = time.monotonic()
+        return _version
+
+
+def bump_data_version(name):
+    """
+    Увеличивает версию таблицы name (search.models.DataVersion) в текущей транзакции.
+    Другие процессы заметят ее при следующей сверке, этот — сразу после коммита.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(BUMP_VERSION_QUERY, [name])
+    transaction.on_commit(reset_data_version)
+
+
+def reset_data_version():
+    """Заставляет следующий запрос перепроверить версию данных (например, после загрузки)"""
+    global _version
+    with _version_lock:
+        _version = None
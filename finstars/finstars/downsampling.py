@@ -0,0 +1,101 @@
+"""
+Прореживание длинных рядов для графиков методом Largest-Triangle-Three-Buckets (LTTB).
+
+Из каждой корзины выбирается точка, образующая наибольший треугольник с уже выбранной
+точкой предыдущей корзины и средним следующей, — форма ряда (пики и провалы) сохраняется
+при числе точек порядка ширины графика в пикселях.
+"""
+import datetime
+
+import numpy as np
+
+
+def _as_float(values):
+    """Числа -> float64, даты (date, datetime64, строки 'YYYY-MM-DD') -> мс от эпохи, None -> NaN"""
+    values = np.asarray(values)
+    if values.dtype.kind in 'OUS':
+        sample = next((value for value in values if value is not None), None)
+        if not isinstance(sample, (datetime.date, np.datetime64, str)):
+            # Числа, в том числе Decimal из PostgreSQL
+            return np.array([np.nan if value is None else float(value) for value in values], dtype=np.float64)
+        values = np.array([np.datetime64('NaT') if value is None else value for value in values],
+                          dtype='datetime64[ms]')
+
+    if values.dtype.kind == 'M':
+        result = values.astype('datetime64[ms]').astype(np.int64).astype(np.float64)
+        result[np.isnat(values)] = np.nan
+        return result
+    return values.astype(np.float64)
+
+
+def lttb_indices(x, y, max_points):
+    """
+    Индексы точек, оставляемых LTTB (по возрастанию). x — числа или даты, y — числа (None/NaN
+    пропускаются). Если точек не больше max_points, возвращаются все индексы.
+    """
+    if max_points is None or len(x) <= max_points or max_points < 3:
+        return np.arange(len(x))
+
+    x = _as_float(x)
+    y = _as_float(y)
+    finite = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    count = len(finite)
+    if count <= max_points:
+        return finite
+    x, y = x[finite], y[finite]
+
+    # Первая и последняя точки всегда остаются, остальные делятся на max_points - 2 корзины.
+    # Границы корзин как в эталонном LTTB: floor(i * every) + 1
+    buckets_count = max_points - 2
+    every = (count - 2) / buckets_count
+    edges = np.floor(np.arange(buckets_count + 1) * every).astype(np.int64) + 1
+    starts, ends = edges[:-1], edges[1:]
+    widths = ends - starts
+    max_width = int(widths.max())
+
+    # Корзины переменной ширины укладываются в матрицу, лишние ячейки маскируются
+    columns = np.arange(max_width)
+    bucket_index = np.minimum(starts[:, None] + columns, count - 1)
+    valid = columns < widths[:, None]
+    bucket_x = x[bucket_index]
+    bucket_y = y[bucket_index]
+
+    # Среднее каждой корзины — "третья вершина" для предыдущей корзины
+    sums_x = np.where(valid, bucket_x, 0.0).sum(axis=1)
+    sums_y = np.where(valid, bucket_y, 0.0).sum(axis=1)
+    # Для последней корзины — среднее хвоста после нее (обычно одна последняя точка,
+    # но при округлении floor в хвост попадает и предпоследняя, как в эталоне)
+    average_x = np.append(sums_x[1:] / widths[1:], x[ends[-1]:].mean())
+    average_y = np.append(sums_y[1:] / widths[1:], y[ends[-1]:].mean())
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, count - 1
+    previous = 0
+    for bucket in range(buckets_count):
+        # Удвоенная площадь треугольника для всех точек корзины сразу
+        areas = np.abs(
+            (x[previous] - average_x[bucket]) * (bucket_y[bucket] - y[previous])
+            - (x[previous] - bucket_x[bucket]) * (average_y[bucket] - y[previous])
+        )
+        areas[~valid[bucket]] = -1.0
+        previous = int(bucket_index[bucket, int(areas.argmax())])
+        selected[bucket + 1] = previous
+
+    return finite[selected]
+
+
+def downsample(x, y, max_points):
+    """(x, y), прореженные до max_points точек методом LTTB"""
+    indices = lttb_indices(x, y, max_points)
+    return [x[i] for i in indices], [y[i] for i in indices]
+
+
+def parse_max_points(value, default=None):
+    """Параметр max_points из запроса: целое >= 3, '0' — без прореживания, иначе default"""
+    try:
+        max_points = int(value)
+    except (TypeError, ValueError):
+        return default
+    if max_points == 0:
+        return None
+    return max(max_points, 3)
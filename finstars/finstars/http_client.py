@@ -0,0 +1,53 @@
+"""
+Общая HTTP-сессия для внешних API (Open-Meteo и т. п.).
+
+Сессия держит keep-alive соединения в пуле, поэтому повторные запросы к тому же хосту
+не тратят время на TCP/TLS-рукопожатие. Временные ошибки (соединение, 429, 5xx)
+повторяются с экспоненциальной задержкой, у каждого запроса есть таймаут.
+"""
+import threading
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def build_session():
+    retry = Retry(
+        total=getattr(settings, 'HTTP_RETRIES', 3),
+        backoff_factor=getattr(settings, 'HTTP_BACKOFF_FACTOR', 0.5),
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=('GET',),
+        respect_retry_after_header=True,
+    )
+    pool_size = getattr(settings, 'HTTP_POOL_SIZE', 10)
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """Сессия, общая для всех потоков процесса (пул соединений requests потокобезопасен)"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = build_session()
+        return _session
+
+
+def get_json(url, params=None, timeout=None):
+    """GET с таймаутом (connect, read) из settings.HTTP_TIMEOUT; ошибки — requests.exceptions.RequestException"""
+    if timeout is None:
+        timeout = getattr(settings, 'HTTP_TIMEOUT', (5, 30))
+    response = get_session().get(url, params=params, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
@@ -0,0 +1,178 @@
+"""
+Замер этапов запроса для RequestProfilingMiddleware.
+
+Представление размечает этапы:
+
+    with profile_phase('figure'):
+        fig = build_market_planet_figure(...)
+
+Этапы с одинаковым именем суммируются. Вне запроса (команды, оболочка) разметка ничего не делает.
+Текущий замер хранится в contextvar, поэтому он виден и в потоках sync_to_async, и в задачах asyncio.
+Запросы к базе через курсор Django считаются обертками execute_wrappers, которые ставятся
+на каждое новое соединение (и на уже открытые в начале замера); запросы через асинхронный пул
+записывает finstars.async_db.
+"""
+import contextvars
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+_current_profile = contextvars.ContextVar('request_profile', default=None)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.query_count = 0
+        self.query_time = 0.0
+        # Этапы async-представлений могут выполняться в нескольких потоках одновременно
+        self._lock = threading.Lock()
+
+    def add_phase(self, name, duration):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + duration
+
+    def add_query(self, duration):
+        with self._lock:
+            self.query_count += 1
+            self.query_time += duration
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def start_profile():
+    """Начинает замер запроса; возвращает (profile, token для finish_profile)"""
+    install_query_counters()
+    profile = RequestProfile()
+    return profile, _current_profile.set(profile)
+
+
+def finish_profile(token):
+    _current_profile.reset(token)
+
+
+def get_current_profile():
+    return _current_profile.get()
+
+
+@contextmanager
+def profile_phase(name):
+    """Замер этапа текущего запроса"""
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_phase(name, time.perf_counter() - started)
+
+
+def record_query(duration):
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.add_query(duration)
+
+
+def count_query(execute, sql, params, many, context):
+    """Обертка курсора Django: время и число запросов текущего запроса"""
+    if _current_profile.get() is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record_query(time.perf_counter() - started)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+connection_created.connect(install_query_counter)
+
+
+def install_query_counters():
+    """
+    Обертка для соединений потока, открытых до импорта модуля (сигнал connection_created
+    их уже не застал): например, соединение проверок при запуске или тестовой базы
+    """
+    for connection in connections.all(initialized_only=True):
+        install_query_counter(None, connection)
+
+
+class StackSampler:
+    """
+    Семплирующий профилировщик одного потока: фоновый поток раз в interval секунд
+    снимает стек через sys._current_frames. Накладные расходы не зависят от числа вызовов
+    в профилируемом коде, поэтому его можно включать на рабочем сервере.
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = 0
+        self.functions = Counter()
+        self.leaves = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+
+            code = frame.f_code
+            self.leaves[(code.co_filename, code.co_firstlineno, code.co_name)] += 1
+
+            # Функция считается один раз за снимок, даже если она рекурсивна
+            seen = set()
+            while frame is not None:
+                code = frame.f_code
+                seen.add((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            self.functions.update(seen)
+            self.samples += 1
+
+    def report(self, limit=15, root=None):
+        """
+        Функции, выполнявшиеся в момент снимка (собственное время), и функции проекта
+        из root, бывшие в стеке (время вместе с вложенными вызовами), по доле снимков
+        """
+        if not self.samples:
+            return 'no samples'
+
+        def format_function(function, count):
+            filename, lineno, name = function
+            if root and filename.startswith(root):
+                filename = filename[len(root):].lstrip('/')
+            return f'{count / self.samples:7.1%}  {filename}:{lineno} {name}'
+
+        lines = [f'{self.samples} samples every {self.interval * 1000:g} ms', 'self:']
+        lines.extend(format_function(function, count) for function, count in self.leaves.most_common(limit))
+        if root:
+            project = Counter({function: count for function, count in self.functions.items()
+                               if function[0].startswith(root)})
+            lines.append('total (project):')
+            lines.extend(format_function(function, count) for function, count in project.most_common(limit))
+        return '\n'.join(lines)
@@ -0,0 +1,84 @@
+import logging
+import threading
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .profiling import StackSampler, finish_profile, start_profile
+
+logger = logging.getLogger('finstars.profiling')
+
+
+class RequestProfilingMiddleware:
+    """
+    Замер запроса: этапы, размеченные в представлении через profile_phase, число и время
+    запросов к базе, размер ответа. Результат уходит в заголовок Server-Timing
+    (PROFILING_SERVER_TIMING) и в лог finstars.profiling: одна строка key=value на запрос,
+    те же данные словарем в record.profile. Запросы дольше PROFILING_SLOW_REQUEST_MS
+    логируются с уровнем WARNING, а при PROFILING_SAMPLER — с отчетом семплирующего профилировщика.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        profile, token = start_profile()
+        # Семплируется только поток запроса, поэтому профилировщик работает в синхронной ветке
+        sampler = (StackSampler(threading.get_ident(), settings.PROFILING_SAMPLE_INTERVAL).start()
+                   if settings.PROFILING_SAMPLER else None)
+        try:
+            response = self.get_response(request)
+        finally:
+            finish_profile(token)
+            if sampler:
+                sampler.stop()
+
+        self.finish(request, response, profile, sampler)
+        return response
+
+    async def __acall__(self, request):
+        profile, token = start_profile()
+        try:
+            response = await self.get_response(request)
+        finally:
+            finish_profile(token)
+
+        self.finish(request, response, profile)
+        return response
+
+    def finish(self, request, response, profile, sampler=None):
+        total = profile.elapsed()
+        size = None if response.streaming else len(response.content)
+
+        if settings.PROFILING_SERVER_TIMING:
+            metrics = [f'{name};dur={duration * 1000:.1f}' for name, duration in profile.phases.items()]
+            metrics.append(f'db;dur={profile.query_time * 1000:.1f};desc="{profile.query_count} queries"')
+            metrics.append(f'total;dur={total * 1000:.1f}')
+            response.headers['Server-Timing'] = ', '.join(metrics)
+
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'db_queries': profile.query_count,
+            'db_ms': round(profile.query_time * 1000, 1),
+            'bytes': size,
+        }
+        record.update((f'{name}_ms', round(duration * 1000, 1)) for name, duration in profile.phases.items())
+        message = ' '.join(f'{key}={value}' for key, value in record.items())
+
+        if total * 1000 < settings.PROFILING_SLOW_REQUEST_MS:
+            logger.info(message, extra={'profile': record})
+        elif sampler is not None:
+            logger.warning('slow request %s\n%s', message, sampler.report(root=str(settings.BASE_DIR)),
+                           extra={'profile': record})
+        else:
+            logger.warning('slow request %s', message, extra={'profile': record})
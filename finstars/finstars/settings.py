@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -30,6 +31,10 @@ ALLOWED_HOSTS = ['.ngrok-free.app', '127.0.0.1', 'localhost']
 
 # Application definition
 
+# django_plotly_dash импортирует dash (около 0,5 с и десятки МБ) уже при django.setup().
+# Воркеры, которые не обслуживают /dash_app/, запускаются с FINSTARS_DASH=0
+DASH_ENABLED = os.environ.get('FINSTARS_DASH', '1') != '0'
+
 INSTALLED_APPS = [
     'django.contrib.admin',
     'django.contrib.auth',
@@ -46,10 +51,19 @@ INSTALLED_APPS = [
     'main',
     'weather',
 ]
+if not DASH_ENABLED:
+    INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in ('django_plotly_dash', 'dash_app')]
+
+# Приложения Dash регистрируются при первом обращении (dash_app.registry)
+PLOTLY_DASH = {
+    'stateless_loader': 'dash_app.registry.load_dash_app',
+}
 # Отключаем защиту для eval
 CSP_SCRIPT_SRC = ("'self'", "'unsafe-eval'")
 
 MIDDLEWARE = [
+    # Первым, чтобы замер охватывал весь запрос
+    'finstars.profiling_middleware.RequestProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,11 +93,17 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'finstars.wsgi.application'
+# Websocket потоковой выдачи поиска (search.consumers) работает только под ASGI
+ASGI_APPLICATION = 'finstars.asgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Размер пула соединений к PostgreSQL (на процесс)
+DATABASE_POOL_MIN_SIZE = int(os.environ.get('DATABASE_POOL_MIN_SIZE', 2))
+DATABASE_POOL_MAX_SIZE = int(os.environ.get('DATABASE_POOL_MAX_SIZE', 10))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -92,7 +112,131 @@ DATABASES = {
         'PASSWORD': '',
         'HOST': 'localhost',
         'PORT': '5432',
+        # Проверять соединение перед повторным использованием
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+try:
+    # Пул соединений Django (нужен psycopg 3 с psycopg_pool): соединения живут между запросами.
+    # Проверку перед выдачей Django передает пулу сам по CONN_HEALTH_CHECKS — ключ 'check' здесь не нужен
+    import psycopg_pool  # noqa: F401
+
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': DATABASE_POOL_MIN_SIZE,
+            'max_size': DATABASE_POOL_MAX_SIZE,
+        },
     }
+except ImportError:
+    # Без psycopg_pool — постоянные соединения на поток
+    DATABASES['default']['CONN_MAX_AGE'] = 600
+
+# Источник для поиска периодов: 'index' — EphemerisIndex в памяти процесса (search/ephemeris.py),
+# 'sql' — единый запрос к planetary_positions (search/queries.py),
+# 'events' — индекс ингрессий и стоянок (search/events.py): периоды с точностью до минут
+SEARCH_BACKEND = 'index'
+
+# Как часто (в секундах) EphemerisIndex проверяет, не изменилась ли таблица planetary_positions
+EPHEMERIS_INDEX_CHECK_INTERVAL = 60
+
+# Бинарный файл эфемерид, общий для всех воркеров (создается manage.py export_ephemeris).
+# Если файла нет, EphemerisIndex загружается из базы
+EPHEMERIS_FILE = BASE_DIR / 'ephemeris.bin'
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Годовые тайлы и готовые фигуры графика планет и рынка, результаты поиска периодов (finstars/data_cache.py).
+    # LocMemCache вытесняет давно не читавшиеся записи при превышении MAX_ENTRIES
+    'figures': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'figures',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 2000,
+            'CULL_FREQUENCY': 10,
+        },
+    },
+}
+
+# Как часто (в секундах) кэш графика сверяет версию данных: версии таблиц в data_versions (их увеличивают
+# загрузчики и пересборки), число строк planetary_positions, market_data, planetary_events и файл EPHEMERIS_FILE
+FIGURE_CACHE_VERSION_CHECK_INTERVAL = 60
+
+
+# Сколько точек длинного ряда отдавать графикам по умолчанию (прореживание LTTB, finstars/downsampling.py).
+# Страницы передают max_points по ширине графика
+CHART_MAX_POINTS = 2000
+
+# Параллельная загрузка независимых источников данных (finstars/concurrency.py):
+# число потоков и таймаут источника по умолчанию в секундах (от старта источника)
+FETCH_MAX_WORKERS = 8
+FETCH_TIMEOUT = 30
+# Сколько секунд источник может ждать свободный поток пула, прежде чем считаться не уложившимся
+FETCH_QUEUE_TIMEOUT = 30
+
+# Локальное хранилище рядов yfinance/Open-Meteo (weather.timeseries): загрузчик для каждого
+# источника (для офлайн-работы заменяется на weather.fetchers.CsvFetcher) и число последних дней,
+# которые считаются неокончательными и запрашиваются заново
+TIMESERIES_FETCHERS = {
+    'yfinance': 'weather.fetchers.fetch_yfinance',
+    'open-meteo': 'weather.fetchers.fetch_open_meteo',
+}
+TIMESERIES_REFRESH_DAYS = 7
+# Корутинные загрузчики для async-представлений (источники без них загружаются в потоке)
+TIMESERIES_ASYNC_FETCHERS = {
+    'open-meteo': 'weather.fetchers.afetch_open_meteo',
+}
+
+# Общая HTTP-сессия для внешних API (finstars.http_client): таймаут (connect, read) в секундах,
+# повторы временных ошибок с экспоненциальной задержкой и размер пула keep-alive соединений
+HTTP_TIMEOUT = (5, 30)
+HTTP_RETRIES = 3
+HTTP_BACKOFF_FACTOR = 0.5
+HTTP_POOL_SIZE = 10
+# Длинные диапазоны архива Open-Meteo запрашиваются кусками по столько дней
+OPEN_METEO_CHUNK_DAYS = 3660
+
+# Корреляции погоды и рынка (weather.correlation): скользящие корреляции сетки больше
+# порога (точки x тикеры x наблюдения) считаются в пуле из стольких потоков
+CORRELATION_PARALLEL_THRESHOLD = 2_000_000
+CORRELATION_MAX_THREADS = 4
+# Ограничения одного запроса корреляций: длина диапазона в днях и число пар точка x тикер
+CORRELATION_MAX_DAYS = 366 * 30
+CORRELATION_MAX_PAIRS = 200
+
+# Базовая линия бенчмарков (manage.py benchmark_suite --save-baseline); зависит от машины и данных
+BENCHMARK_BASELINE_FILE = BASE_DIR / 'benchmark_baseline.json'
+
+# Замер запросов (finstars.profiling_middleware): заголовок Server-Timing с этапами и временем базы.
+# Заголовок виден любому клиенту и раскрывает время запросов к базе, поэтому по умолчанию только при DEBUG
+PROFILING_SERVER_TIMING = DEBUG
+# Запросы дольше этого (мс) логируются с уровнем WARNING
+PROFILING_SLOW_REQUEST_MS = 1000
+# Семплирующий профилировщик синхронных запросов: отчет прикладывается к логу медленного запроса
+PROFILING_SAMPLER = False
+PROFILING_SAMPLE_INTERVAL = 0.005  # секунды между снимками стека
+
+# Бюджет холодного старта воркера (manage.py import_report --check)
+STARTUP_TIME_BUDGET_MS = 1200
+STARTUP_RSS_BUDGET_MB = 120
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # Строка key=value на каждый запрос
+        'finstars.profiling': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
 }
 
 
@@ -1,4 +1,5 @@
 
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 
@@ -6,9 +7,14 @@ urlpatterns = [
     path('', include('main.urls')),
     path('admin/', admin.site.urls),
     path('search/', include('search.urls')),  # Добавляем этот маршрут
-    path('dash_app/', include('dash_app.urls')),
     path('search/', include('search.urls')),  # Добавляем путь к нашему приложению
     path('graph/', include('graph.urls')),  # Подключаем маршруты из приложения market_data
     path('weather/', include('weather.urls')),
 ]
 
+if settings.DASH_ENABLED:
+    urlpatterns += [
+        path('dash_app/', include('dash_app.urls')),
+        # Макет и коллбеки приложений Dash (django_plotly_dash)
+        path('django_plotly_dash/', include('django_plotly_dash.urls')),
+    ]
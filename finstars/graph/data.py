@@ -0,0 +1,185 @@
+# Загрузка данных для графика планет и рынка из базы или файла эфемерид
+import os
+from collections import namedtuple
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+
+from finstars.async_db import fetch_all, fetch_one
+
+from search.ephemeris import get_ephemeris_index
+from search.events import get_event_index
+from search.models import PlanetaryEvent, PlanetaryPeriod
+from search.periods import Run, rows_to_columns, runs_from_columns, to_date
+
+CHART_PLANETS = ('Sa', 'Gu', 'Ma', 'Sk', 'Bu', 'Ra')
+
+PLANET_PLACEHOLDERS = ', '.join(['%s'] * len(CHART_PLANETS))
+
+PERIODS_EXIST_QUERY = 'SELECT EXISTS (SELECT 1 FROM planetary_periods)'
+
+EVENTS_EXIST_QUERY = 'SELECT EXISTS (SELECT 1 FROM planetary_events)'
+
+PERIODS_QUERY = f'''
+    SELECT planet, zodiac_sign, retrograde, start_date, end_date, start_degrees, end_degrees
+    FROM planetary_periods
+    WHERE planet IN ({PLANET_PLACEHOLDERS}) AND end_date >= %s AND start_date <= %s
+    ORDER BY planet, start_date;
+'''
+
+POSITIONS_QUERY = f'''
+    SELECT date, planet, zodiac_sign, degrees_in_sign, retrograde
+    FROM planetary_positions
+    WHERE date BETWEEN %s AND %s
+    AND planet IN ({PLANET_PLACEHOLDERS})
+    ORDER BY planet, date;
+'''
+
+DEGREES_QUERY = f'''
+    SELECT date, planet, degrees_in_sign
+    FROM planetary_positions
+    WHERE date BETWEEN %s AND %s
+    AND planet IN ({PLANET_PLACEHOLDERS})
+    ORDER BY planet, date;
+'''
+
+MARKET_QUERY = '''
+    SELECT date, close_price
+    FROM market_data
+    WHERE date BETWEEN %s AND %s AND close_price != 0
+    ORDER BY date;
+'''
+
+# Градусы по дням: values[planet][i] — градус в день origin + i (NaN, если строки за день нет)
+DailyDegrees = namedtuple('DailyDegrees', ['origin', 'values'])
+
+
+def interpolate_degrees(run, date):
+    """Градус внутри периода по линейной интерполяции между его границами"""
+    if run.start_degrees is None or run.end_degrees is None:
+        return None
+    start_degrees, end_degrees = float(run.start_degrees), float(run.end_degrees)
+    total_days = (run.end_date - run.start_date).days
+    if total_days == 0:
+        return start_degrees
+    fraction = (date - run.start_date).days / total_days
+    return start_degrees + (end_degrees - start_degrees) * fraction
+
+
+def clip_run(run, start_date, end_date):
+    """Период, обрезанный по диапазону; градусы на новых границах интерполируются"""
+    clipped_start = max(run.start_date, start_date)
+    clipped_end = min(run.end_date, end_date)
+    if clipped_start == run.start_date and clipped_end == run.end_date:
+        return run
+    return run._replace(
+        start_date=clipped_start,
+        end_date=clipped_end,
+        start_degrees=interpolate_degrees(run, clipped_start),
+        end_degrees=interpolate_degrees(run, clipped_end),
+    )
+
+
+def load_planet_runs(start_date, end_date):
+    """
+    Периоды планет, пересекающие диапазон: из отображенного в память файла эфемерид (EPHEMERIS_FILE),
+    иначе из индекса событий planetary_events или из таблицы planetary_periods.
+    Если таблицы еще не построены, периоды собираются из дневных строк planetary_positions.
+    """
+    if settings.EPHEMERIS_FILE and os.path.exists(settings.EPHEMERIS_FILE):
+        return get_ephemeris_index().runs(CHART_PLANETS, start_date, end_date)
+
+    if PlanetaryEvent.objects.exists():
+        # Градусы на границах — из дневных строк, а не интерполяция между событиями
+        degrees = load_daily_degrees(start_date, end_date)
+        return get_event_index().runs(CHART_PLANETS, start_date, end_date, degrees.values)
+
+    if PlanetaryPeriod.objects.exists():
+        rows = PlanetaryPeriod.objects.filter(
+            planet__in=CHART_PLANETS,
+            end_date__gte=start_date,
+            start_date__lte=end_date,
+        ).order_by('planet', 'start_date').values_list(*Run._fields)
+        return [Run(*row) for row in rows]
+
+    with connection.cursor() as cursor:
+        cursor.execute(POSITIONS_QUERY, (start_date, end_date) + CHART_PLANETS)
+
+        # Строки сразу раскладываются по столбцам NumPy, границы периодов ищутся векторно
+        return runs_from_columns(rows_to_columns(cursor.fetchall()))
+
+
+def load_market_data(start_date, end_date):
+    """Цены закрытия [(date, close_price), ...] за диапазон"""
+    with connection.cursor() as cursor:
+        cursor.execute(MARKET_QUERY, (start_date, end_date))
+
+        return cursor.fetchall()
+
+
+def degrees_from_rows(rows, start_date, end_date):
+    """DailyDegrees диапазона из строк (date, planet, degrees_in_sign)"""
+    days = (end_date - start_date).days + 1
+    values = {}
+    if not rows:
+        return DailyDegrees(start_date, values)
+
+    dates, planets, degrees = zip(*rows)
+    offsets = (np.array(dates, dtype='datetime64[D]') - np.datetime64(start_date, 'D')).astype(np.int64)
+    planets = np.array(planets)
+    # float64, как в search.periods.rows_to_columns: подпись '%.2f' совпадает со значением из базы
+    degrees = np.array([np.nan if value is None else float(value) for value in degrees], dtype=np.float64)
+    for planet in np.unique(planets):
+        selected = planets == planet
+        values[str(planet)] = np.full(days, np.nan)
+        values[str(planet)][offsets[selected]] = degrees[selected]
+    return DailyDegrees(start_date, values)
+
+
+def load_daily_degrees(start_date, end_date):
+    """Градусы планет графика за каждый день диапазона (для подсказок) — из файла эфемерид или planetary_positions"""
+    if settings.EPHEMERIS_FILE and os.path.exists(settings.EPHEMERIS_FILE):
+        return DailyDegrees(start_date, get_ephemeris_index().daily_degrees(CHART_PLANETS, start_date, end_date))
+
+    with connection.cursor() as cursor:
+        cursor.execute(DEGREES_QUERY, (start_date, end_date) + CHART_PLANETS)
+
+        return degrees_from_rows(cursor.fetchall(), start_date, end_date)
+
+
+async def load_planet_runs_async(start_date, end_date):
+    """load_planet_runs для async-представлений: запросы к базе идут через асинхронный пул"""
+    if settings.EPHEMERIS_FILE and os.path.exists(settings.EPHEMERIS_FILE):
+        # Файл отображен в память — база не нужна, но первая загрузка индекса идет в потоке
+        index = await sync_to_async(get_ephemeris_index)()
+        return index.runs(CHART_PLANETS, start_date, end_date)
+
+    if (await fetch_one(EVENTS_EXIST_QUERY))[0]:
+        index = await sync_to_async(get_event_index)()
+        degrees = await load_daily_degrees_async(start_date, end_date)
+        return index.runs(CHART_PLANETS, start_date, end_date, degrees.values)
+
+    if (await fetch_one(PERIODS_EXIST_QUERY))[0]:
+        rows = await fetch_all(PERIODS_QUERY, CHART_PLANETS + (start_date, end_date))
+        return [
+            Run(planet, sign, bool(retrograde), to_date(start), to_date(end), start_degrees, end_degrees)
+            for planet, sign, retrograde, start, end, start_degrees, end_degrees in rows
+        ]
+
+    rows = await fetch_all(POSITIONS_QUERY, (start_date, end_date) + CHART_PLANETS)
+    return runs_from_columns(rows_to_columns(rows))
+
+
+async def load_market_data_async(start_date, end_date):
+    return await fetch_all(MARKET_QUERY, (start_date, end_date))
+
+
+async def load_daily_degrees_async(start_date, end_date):
+    if settings.EPHEMERIS_FILE and os.path.exists(settings.EPHEMERIS_FILE):
+        index = await sync_to_async(get_ephemeris_index)()
+        return DailyDegrees(start_date, index.daily_degrees(CHART_PLANETS, start_date, end_date))
+
+    rows = await fetch_all(DEGREES_QUERY, (start_date, end_date) + CHART_PLANETS)
+    return degrees_from_rows(rows, start_date, end_date)
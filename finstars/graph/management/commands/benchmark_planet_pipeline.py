@@ -0,0 +1,72 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+
+from graph.data import CHART_PLANETS
+from graph.views import get_planet_segments
+from search.periods import build_runs, rows_to_columns, runs_from_columns
+from search.synthetic import generate_position_rows
+
+
+def generate_rows(years):
+    """Синтетические дневные строки planetary_positions графика, отсортированные по планете и дате"""
+    return generate_position_rows(years, planets=CHART_PLANETS)
+
+
+def per_row_pipeline(rows):
+    """
+    Построчный конвейер: свертка строк в периоды циклом Python (build_runs)
+    и подписи границ через strftime на каждую границу. Результат тот же, что у columnar_pipeline.
+    """
+    segments = []
+    for run in build_runs(rows):
+        retrograde_marker = "(R)" if run.retrograde else ""
+        segment_dates = [run.start_date] if run.start_date == run.end_date else [run.start_date, run.end_date]
+        degrees = [run.start_degrees, run.end_degrees]
+        hover_texts = [
+            f"{segment_date.strftime('%d-%m-%Y')}, {run.planet} {run.zodiac_sign} {retrograde_marker}, "
+            f"{'' if value is None else format(value, '.2f')}"
+            for segment_date, value in zip(segment_dates, degrees)
+        ]
+        segments.append((run.planet, run.zodiac_sign, run.retrograde, segment_dates, hover_texts))
+    return segments
+
+
+def columnar_pipeline(rows):
+    """Текущий конвейер: столбцы NumPy, векторный поиск границ, подписи одной операцией"""
+    return get_planet_segments(runs_from_columns(rows_to_columns(rows)))
+
+
+class Command(BaseCommand):
+    help = "Сравнивает время и пиковую память построчного и столбцового конвейера plot_planets"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--years', type=float, nargs='+', default=[10, 50, 100])
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        for years in options['years']:
+            rows = generate_rows(years)
+            self.stdout.write(f"{years:g} years, {len(rows)} rows:")
+            results = {}
+            for name, pipeline in (('per-row', per_row_pipeline), ('columnar', columnar_pipeline)):
+                seconds, peak, results[name] = self.measure(pipeline, rows, options['repeat'])
+                self.stdout.write(f"  {name:>9}: {seconds * 1000:9.1f} ms, peak {peak / 2 ** 20:7.1f} MiB, "
+                                  f"{len(results[name])} segments")
+            # Сравнивать время имеет смысл только для одинакового результата
+            if results['per-row'] != results['columnar']:
+                raise CommandError(f"{years:g} years: per-row and columnar segments differ")
+
+    def measure(self, pipeline, rows, repeat):
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            segments = pipeline(rows)
+            best = min(best, time.perf_counter() - started)
+
+        tracemalloc.start()
+        pipeline(rows)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return best, peak, segments
@@ -0,0 +1,186 @@
+import json
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+import plotly.graph_objs as go
+import plotly.offline as pyo
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory, override_settings
+
+from graph.serialization import figure_to_json
+from graph.tiles import get_range_data
+from graph.views import build_market_planet_figure, plot_planets
+from search.ephemeris import reset_ephemeris_index
+from search.events import reset_event_index
+from search.models import PlanetaryPeriod
+from search.views import find_intersections, get_intersecting_periods, search_periods
+
+# Условия поиска для search_periods: по одному знаку на планету
+SEARCH_CONDITIONS = {'zodiac_Sa': '1', 'zodiac_Gu': '5', 'retrograde_Gu': 'R'}
+
+# Для пересечений: периоды планет в огненных знаках
+INTERSECTION_PLANETS = ('Sa', 'Gu', 'Ma', 'Sk', 'Bu')
+INTERSECTION_SIGNS = ('1', '5', '9')
+
+# Диапазон графика, на котором меряются plot_planets и сериализация фигуры
+CHART_YEARS = 10
+
+
+def dataset_signature():
+    """Объем и границы данных: с базовой линией сравниваются только замеры на тех же данных"""
+    with connection.cursor() as cursor:
+        cursor.execute('''
+            SELECT (SELECT COUNT(*) FROM planetary_positions), (SELECT MIN(date) FROM planetary_positions),
+                   (SELECT MAX(date) FROM planetary_positions), (SELECT COUNT(*) FROM market_data)
+        ''')
+        positions, first_date, last_date, market = cursor.fetchone()
+    return f'{positions}:{first_date}:{last_date}:{market}'
+
+
+class Command(BaseCommand):
+    help = ("Бенчмарки горячих путей поиска и графика на данных из базы (см. generate_synthetic_data): "
+            "время, пропускная способность и пиковая память; сравнение с сохраненной базовой линией")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--baseline', default=getattr(settings, 'BENCHMARK_BASELINE_FILE', None),
+                            help='JSON-файл базовой линии')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Записать результаты как новую базовую линию')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Допустимое ухудшение времени и памяти (0.25 = 25%%)')
+        parser.add_argument('--only', nargs='+', help='Запустить только эти бенчмарки')
+
+    def handle(self, *args, **options):
+        signature = dataset_signature()
+        if signature.startswith('0:'):
+            raise CommandError('planetary_positions is empty; run generate_synthetic_data first')
+        self.stdout.write(f"Dataset {signature}")
+
+        results = {}
+        for name, prepare in self.get_cases():
+            if options['only'] and name not in options['only']:
+                continue
+            function, items, unit = prepare()
+            seconds, peak = self.measure(function, options['repeat'])
+            results[name] = {'seconds': seconds, 'peak_bytes': peak, 'items': items, 'unit': unit}
+            self.stdout.write(f"  {name:<28} {seconds * 1000:9.2f} ms  {items / seconds:12.0f} {unit}/s  "
+                              f"peak {peak / 2 ** 20:7.2f} MiB")
+
+        baseline_path = options['baseline']
+        if not baseline_path:
+            return
+        if options['save_baseline']:
+            with open(baseline_path, 'w', encoding='utf-8') as file:
+                json.dump({'dataset': signature, 'results': results}, file, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Baseline saved to {baseline_path}"))
+            return
+
+        self.compare(baseline_path, signature, results, options['tolerance'])
+
+    def compare(self, baseline_path, signature, results, tolerance):
+        try:
+            with open(baseline_path, encoding='utf-8') as file:
+                baseline = json.load(file)
+        except FileNotFoundError:
+            self.stdout.write(f"No baseline at {baseline_path}; run with --save-baseline to create it")
+            return
+
+        if baseline['dataset'] != signature:
+            raise CommandError(f"Baseline was recorded on dataset {baseline['dataset']}, not {signature}")
+
+        regressions = []
+        for name, result in results.items():
+            expected = baseline['results'].get(name)
+            if expected is None:
+                self.stdout.write(f"  {name}: not in baseline, not compared")
+                continue
+            for metric in ('seconds', 'peak_bytes'):
+                if result[metric] > expected[metric] * (1 + tolerance):
+                    regressions.append(f"{name} {metric}: {result[metric]:.6g} > {expected[metric]:.6g}")
+
+        if regressions:
+            raise CommandError('Regressions against baseline:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"No regressions against {baseline_path} (tolerance {tolerance:.0%})"))
+
+    def measure(self, function, repeat):
+        """Лучшее время из repeat запусков (после прогревочного) и пиковая память отдельного запуска"""
+        function()
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            function()
+            best = min(best, time.perf_counter() - started)
+
+        tracemalloc.start()
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return best, peak
+
+    def get_cases(self):
+        return [
+            ('find_intersections', self.prepare_find_intersections),
+            ('get_intersecting_periods', self.prepare_intersecting_periods),
+            ('search_periods[index]', lambda: self.prepare_search_periods('index')),
+            ('search_periods[sql]', lambda: self.prepare_search_periods('sql')),
+            ('search_periods[events]', lambda: self.prepare_search_periods('events')),
+            ('plot_planets', self.prepare_plot_planets),
+            ('figure_to_json', self.prepare_figure_to_json),
+            ('pyo.plot', self.prepare_pyo_plot),
+        ]
+
+    def load_periods_lists(self):
+        rows = (PlanetaryPeriod.objects
+                .filter(planet__in=INTERSECTION_PLANETS, zodiac_sign__in=INTERSECTION_SIGNS)
+                .order_by('planet', 'start_date')
+                .values_list('planet', 'start_date', 'end_date'))
+        lists = {planet: [] for planet in INTERSECTION_PLANETS}
+        for planet, start_date, end_date in rows:
+            lists[planet].append((start_date, end_date))
+        if not any(lists.values()):
+            raise CommandError('planetary_periods is empty; run build_planetary_periods first')
+        return list(lists.values())
+
+    def prepare_find_intersections(self):
+        first, second = self.load_periods_lists()[:2]
+        return (lambda: find_intersections(first, second)), len(first) + len(second), 'periods'
+
+    def prepare_intersecting_periods(self):
+        periods_lists = self.load_periods_lists()
+        return (lambda: get_intersecting_periods(periods_lists),
+                sum(map(len, periods_lists)), 'periods')
+
+    def prepare_search_periods(self, backend):
+        request = RequestFactory().get('/search/', SEARCH_CONDITIONS)
+        reset_ephemeris_index()
+        reset_event_index()
+
+        def run():
+            with override_settings(SEARCH_BACKEND=backend):
+                search_periods(request)
+        return run, 1, 'requests'
+
+    def chart_range(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT MIN(date) FROM planetary_positions')
+            start_date = cursor.fetchone()[0]
+        if isinstance(start_date, str):
+            start_date = date.fromisoformat(start_date)
+        return start_date, start_date + timedelta(days=int(CHART_YEARS * 365.25) - 1)
+
+    def prepare_plot_planets(self):
+        start_date, end_date = self.chart_range()
+        runs, _, degrees, _ = get_range_data(start_date, end_date)
+        return (lambda: plot_planets(start_date, end_date, go.Figure(), runs=runs, degrees=degrees)), len(runs), 'segments'
+
+    def prepare_figure_to_json(self):
+        fig = build_market_planet_figure(*self.chart_range())
+        return (lambda: figure_to_json(fig)), len(fig.data), 'traces'
+
+    def prepare_pyo_plot(self):
+        fig = build_market_planet_figure(*self.chart_range())
+        return (lambda: pyo.plot(fig, output_type='div', include_plotlyjs=False)), len(fig.data), 'traces'
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from search.bulk_load import CHUNK_SIZE, BulkLoader, iter_file_chunks
+
+KEY_COLUMNS = ['date']
+VALUE_COLUMNS = ['close_price']
+
+
+class Command(BaseCommand):
+    help = ("Потоковая загрузка котировок (CSV или Parquet со столбцами date, close_price) "
+            "в market_data: новые и изменившиеся даты")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к .csv или .parquet файлу')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        loader = BulkLoader('market_data', KEY_COLUMNS, VALUE_COLUMNS, progress=self.report_progress)
+        try:
+            stats = loader.load(iter_file_chunks(options['path'], loader.columns, options['chunk_size']))
+        except (OSError, ValueError, ImportError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"market_data: {stats['inserted']} inserted, {stats['updated']} updated "
+            f"of {stats['staged']} rows ({stats['duplicates']} repeated keys) in {stats['seconds']:.1f}s"))
+
+    def report_progress(self, rows, rows_per_second):
+        self.stdout.write(f"  staged {rows} rows ({rows_per_second:.0f} rows/s)")
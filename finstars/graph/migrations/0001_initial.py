@@ -0,0 +1,61 @@
+from django.db import migrations, models
+
+
+def create_market_data(apps, schema_editor):
+    """
+    market_data заполняется вне Django, поэтому таблица создается, только если ее нет
+    (например, в чистой SQLite-базе). В существующую таблицу добавляются недостающие id и индексы.
+    """
+    model = apps.get_model('graph', 'MarketData')
+    connection = schema_editor.connection
+    table = model._meta.db_table
+
+    with connection.cursor() as cursor:
+        if table not in connection.introspection.table_names(cursor):
+            schema_editor.create_model(model)
+            return
+
+        columns = {column.name for column in connection.introspection.get_table_description(cursor, table)}
+        constraints = connection.introspection.get_constraints(cursor, table)
+
+        if 'id' not in columns and connection.vendor == 'postgresql':
+            schema_editor.execute(f'ALTER TABLE {table} ADD COLUMN id BIGSERIAL PRIMARY KEY')
+        for index in model._meta.indexes:
+            if index.name not in constraints:
+                schema_editor.add_index(model, index)
+
+
+def drop_market_data_indexes(apps, schema_editor):
+    model = apps.get_model('graph', 'MarketData')
+    for index in model._meta.indexes:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {index.name}')
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='MarketData',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('date', models.DateField()),
+                        ('close_price', models.FloatField()),
+                    ],
+                    options={
+                        'db_table': 'market_data',
+                        'indexes': [
+                            models.Index(fields=['date'], include=['close_price'], name='market_data_date_idx'),
+                        ],
+                    },
+                ),
+            ],
+        ),
+        migrations.RunPython(create_market_data, drop_market_data_indexes),
+    ]
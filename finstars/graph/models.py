@@ -1,3 +1,15 @@
 from django.db import models
 
-# Create your models here.
+
+class MarketData(models.Model):
+    date = models.DateField()  # Торговый день
+    close_price = models.FloatField()  # Цена закрытия S&P 500
+
+    class Meta:
+        db_table = 'market_data'
+        indexes = [
+            models.Index(fields=['date'], include=['close_price'], name='market_data_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date}: {self.close_price}"
@@ -0,0 +1,85 @@
+import base64
+import datetime
+import json
+
+import numpy as np
+
+# Массивы трасс, которые кодируются бинарно (typed arrays plotly.js >= 2.28)
+ENCODED_KEYS = ('x', 'y')
+
+
+def _to_float_array(values):
+    """
+    Числа и даты -> float64 (даты в миллисекундах от эпохи, как их понимает ось type='date'),
+    None -> NaN (разрыв линии). Возвращает None, если массив нельзя закодировать.
+    """
+    if isinstance(values, np.ndarray):
+        if values.dtype.kind in 'iuf':
+            return values.astype(np.float64)
+        if values.dtype.kind == 'M':
+            return values.astype('datetime64[ms]').astype(np.float64)
+        values = values.tolist()
+
+    result = np.empty(len(values), dtype=np.float64)
+    kind = None
+    for i, value in enumerate(values):
+        if value is None:
+            result[i] = np.nan
+            continue
+
+        if isinstance(value, (datetime.date, datetime.datetime, np.datetime64)):
+            value_kind = 'date'
+            value = np.datetime64(value, 'ms').astype(np.int64)
+        elif isinstance(value, (int, float, np.number)) and not isinstance(value, bool):
+            value_kind = 'number'
+        else:
+            return None
+
+        if kind is not None and kind != value_kind:
+            return None
+        kind = value_kind
+        result[i] = value
+
+    return result
+
+
+def encode_typed_array(values):
+    array = _to_float_array(values)
+    if array is None:
+        return None
+    return {'dtype': 'f8', 'bdata': base64.b64encode(array.tobytes()).decode('ascii')}
+
+
+def encode_trace(trace):
+    """Заменяет массивы x/y трассы (словаря) бинарными, если их можно закодировать"""
+    for key in ENCODED_KEYS:
+        values = trace.get(key)
+        if values is None or isinstance(values, dict) or len(values) == 0:
+            continue
+        encoded = encode_typed_array(values)
+        if encoded is not None:
+            trace[key] = encoded
+    return trace
+
+
+def figure_to_json(fig):
+    """
+    Компактный JSON фигуры для Plotly.react: числовые массивы и даты x/y передаются
+    бинарно (base64 float64), без переводов строк и пробелов.
+    """
+    # Кодировщик plotly тянет за собой валидаторы и narwhals — импорт при первой сериализации
+    from plotly.utils import PlotlyJSONEncoder
+
+    figure = fig.to_plotly_json()
+    for trace in figure['data']:
+        encode_trace(trace)
+
+    return json.dumps(figure, cls=PlotlyJSONEncoder, separators=(',', ':'))
+
+
+def traces_to_json(traces):
+    """JSON {"traces": [...]} для дельт графика, массивы закодированы так же, как в figure_to_json"""
+    from plotly.utils import PlotlyJSONEncoder
+
+    data = [encode_trace(trace.to_plotly_json()) for trace in traces]
+    return json.dumps({'traces': data}, cls=PlotlyJSONEncoder, separators=(',', ':'))
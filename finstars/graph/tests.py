@@ -1,3 +1,456 @@
-from django.test import TestCase
+import asyncio
+import base64
+import copy
+import io
+import json
+import math
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.utils import ConnectionHandler
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from finstars import settings as project_settings
+from finstars.concurrency import fetch_concurrently, get_executor
+from finstars.data_cache import get_data_version, get_tile_cache, reset_data_version
+from finstars.downsampling import lttb_indices
+from finstars.profiling import profile_phase
+from graph import tiles
+from graph.data import DailyDegrees, load_planet_runs
+from graph.serialization import figure_to_json
+from graph.tiles import get_range_data
+from graph.views import build_market_planet_figure, get_planet_segments
+from search import views as search_views
+from search.bulk_load import BulkLoader
+from search.ephemeris import reset_ephemeris_index
+from search.events import reset_event_index
+from search.models import PlanetaryPosition
+from search.periods import Run
+from search.synthetic import generate_position_rows
+from graph.management.commands.benchmark_planet_pipeline import (
+    columnar_pipeline, generate_rows, per_row_pipeline,
+)
+
+
+class FetchConcurrentlyTests(SimpleTestCase):
+    def test_queue_wait_does_not_count_against_source_timeout(self):
+        # Втрое больше источников, чем потоков: последние ждут в очереди дольше своего таймаута
+        count = get_executor()._max_workers * 3
+        sources = {i: (time.sleep, (0.2,), 0.5) for i in range(count)}
+
+        results, errors = fetch_concurrently(sources)
+
+        self.assertEqual(errors, {})
+        self.assertEqual(len(results), count)
+
+    def test_slow_and_failing_sources_do_not_affect_others(self):
+        results, errors = fetch_concurrently({
+            'ok': (sum, ([1, 2],)),
+            'slow': (time.sleep, (1,), 0.1),
+            'broken': (int, ('x',)),
+        })
+
+        self.assertEqual(results, {'ok': 3})
+        self.assertIsInstance(errors['slow'], TimeoutError)
+        self.assertIsInstance(errors['broken'], ValueError)
+
+    @override_settings(FETCH_QUEUE_TIMEOUT=0.1)
+    def test_source_waiting_too_long_for_a_worker_times_out(self):
+        # Все потоки заняты зависшими источниками: очередной не стартует и не ждется бесконечно
+        workers = get_executor()._max_workers
+        sources = {i: (time.sleep, (0.5,), 0.2) for i in range(workers)}
+        sources['queued'] = (sum, ([1],))
+
+        started = time.monotonic()
+        results, errors = fetch_concurrently(sources)
+
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertEqual(results, {})
+        self.assertIsInstance(errors['queued'], TimeoutError)
+
+
+class PlanetPipelineTests(SimpleTestCase):
+    def test_per_row_and_columnar_segments_are_equal(self):
+        rows = generate_rows(3)
+        self.assertEqual(per_row_pipeline(rows), columnar_pipeline(rows))
+
+    def test_gaps_missing_degrees_and_single_days(self):
+        rows = [
+            (date(2020, 1, 1), 'Ma', '1', 10.005, None),
+            (date(2020, 1, 2), 'Ma', '1', None, None),
+            # пропуск дня начинает новый период
+            (date(2020, 1, 4), 'Ma', '1', 12.345, '(R)'),
+            (date(2020, 1, 1), 'Sa', '10', 29.9999, '(R)'),
+        ]
+        segments = columnar_pipeline(rows)
+
+        self.assertEqual(per_row_pipeline(rows), segments)
+        self.assertEqual([segment[3] for segment in segments],
+                         [[date(2020, 1, 1), date(2020, 1, 2)], [date(2020, 1, 4)], [date(2020, 1, 1)]])
+        self.assertEqual(segments[0][4][1], '02-01-2020, Ma 1 , ')
+        self.assertEqual(segments[1][4], ['04-01-2020, Ma 1 (R), 12.35'])
+
+
+def reference_lttb(x, y, threshold):
+    """Последовательный LTTB в исходной записи (Steinarsson): индексы выбранных точек"""
+    count = len(x)
+    every = (count - 2) / (threshold - 2)
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        average_start = math.floor((i + 1) * every) + 1
+        average_end = min(math.floor((i + 2) * every) + 1, count)
+        average_x = sum(x[average_start:average_end]) / (average_end - average_start)
+        average_y = sum(y[average_start:average_end]) / (average_end - average_start)
+
+        max_area, next_a = -1.0, None
+        for j in range(math.floor(i * every) + 1, math.floor((i + 1) * every) + 1):
+            area = abs((x[a] - average_x) * (y[j] - y[a]) - (x[a] - x[j]) * (average_y - y[a])) * 0.5
+            if area > max_area:
+                max_area, next_a = area, j
+        selected.append(next_a)
+        a = next_a
+    selected.append(count - 1)
+    return selected
+
+
+class LttbTests(SimpleTestCase):
+    def test_matches_reference_lttb(self):
+        rng = np.random.default_rng(0)
+        # (17, 13) и (32, 15): linspace округляет границу корзины иначе, чем floor(i * every) + 1
+        for count, max_points in ((10, 5), (17, 13), (32, 15), (1000, 100), (1003, 7), (5000, 997)):
+            x = np.cumsum(rng.uniform(0.5, 1.5, count))
+            y = np.cumsum(rng.normal(size=count))
+            with self.subTest(count=count, max_points=max_points):
+                self.assertEqual(lttb_indices(x, y, max_points).tolist(),
+                                 reference_lttb(x.tolist(), y.tolist(), max_points))
+
+
+class ChartParamsTests(SimpleTestCase):
+    def test_invalid_dates_get_400(self):
+        for url in ('/graph/figure/', '/graph/figure/async/', '/graph/delta/'):
+            for params in ({'start_date': '2024-13-01'}, {'end_date': 'x'},
+                           {'start_date': '2024-02-01', 'end_date': '2024-01-01'}):
+                with self.subTest(url=url, params=params):
+                    response = self.client.get(url, params)
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn('error', response.json())
+
+
+class DataVersionTests(TestCase):
+    def tearDown(self):
+        reset_data_version()
+
+    def test_new_ephemeris_file_changes_version(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'ephemeris.bin')
+            with override_settings(EPHEMERIS_FILE=path):
+                reset_data_version()
+                missing = get_data_version()
+
+                with open(path, 'wb') as file:
+                    file.write(b'1')
+                reset_data_version()
+                exported = get_data_version()
+
+                with open(path, 'ab') as file:
+                    file.write(b'2')
+                reset_data_version()
+                reexported = get_data_version()
+
+        self.assertEqual(len({missing, exported, reexported}), 3)
+
+    def test_loader_updating_existing_rows_changes_version(self):
+        loader = BulkLoader('market_data', ['date'], ['close_price'])
+        versions = []
+        # Та же дата с исправленной ценой (число строк и последняя дата не меняются), затем без изменений
+        for price in (4742.83, 4700.0, 4700.0):
+            # Версия процесса сбрасывается после коммита загрузки
+            with self.captureOnCommitCallbacks(execute=True):
+                loader.load([[[date(2024, 1, 2), price]]])
+            versions.append(get_data_version())
+        loaded, corrected, unchanged = versions
+
+        self.assertNotEqual(corrected, loaded)
+        self.assertEqual(unchanged, corrected)
+
+    def test_rebuilding_periods_changes_version(self):
+        reset_data_version()
+        before = get_data_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('build_planetary_periods', full=True, stdout=io.StringIO())
+
+        self.assertNotEqual(get_data_version(), before)
+
+
+@override_settings(EPHEMERIS_FILE=None)
+class BenchmarkSuiteTests(TransactionTestCase):
+    # Тайлы графика читаются в потоках пула, поэтому данные не должны быть в незавершенной транзакции
+    def setUp(self):
+        call_command('generate_synthetic_data', years=2, stdout=io.StringIO())
+        reset_data_version()
+        cache = get_tile_cache()
+        if cache:
+            cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.baseline = os.path.join(directory.name, 'baseline.json')
+
+    def run_suite(self, *args, **options):
+        stdout = io.StringIO()
+        call_command('benchmark_suite', *args, repeat=1, baseline=self.baseline, stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def test_all_cases_run_and_match_their_own_baseline(self):
+        self.run_suite(save_baseline=True)
+        # Допуск большой: проверяется сравнение, а не скорость машины, на которой идут тесты
+        self.assertIn('No regressions', self.run_suite(tolerance=100))
+
+    def test_slower_case_fails_against_baseline(self):
+        only = ['find_intersections', 'get_intersecting_periods']
+        self.run_suite(only=only, save_baseline=True)
+
+        def slow_intersect_periods(periods_list, closed=True):
+            time.sleep(0.05)
+            return intersect_periods(periods_list, closed)
+
+        intersect_periods = search_views.intersect_periods
+        with mock.patch.object(search_views, 'intersect_periods', slow_intersect_periods):
+            with self.assertRaisesRegex(CommandError, r'find_intersections seconds'):
+                self.run_suite(only=only, tolerance=1)
+
+    def test_baseline_from_other_dataset_is_rejected(self):
+        self.run_suite(only=['find_intersections'], save_baseline=True)
+        call_command('generate_synthetic_data', years=3, replace=True, skip_periods=True, stdout=io.StringIO())
+
+        with self.assertRaisesRegex(CommandError, 'Baseline was recorded on dataset'):
+            self.run_suite(only=['find_intersections'])
+
+
+class ConnectionPoolSettingsTests(SimpleTestCase):
+    def test_project_pool_options_build_a_pool(self):
+        # Пул создается закрытым: соединение с PostgreSQL для проверки параметров не нужно
+        handler = ConnectionHandler({'default': copy.deepcopy(project_settings.DATABASES['default'])})
+        wrapper = handler['default']
+        if wrapper.vendor != 'postgresql' or 'pool' not in wrapper.settings_dict['OPTIONS']:
+            self.skipTest('psycopg_pool is not installed')
+        try:
+            pool = wrapper.pool
+            self.assertEqual(pool.max_size, project_settings.DATABASE_POOL_MAX_SIZE)
+            self.assertTrue(wrapper.settings_dict['CONN_HEALTH_CHECKS'])
+        finally:
+            wrapper.close_pool()
+
+
+class PartialFigureTests(TestCase):
+    def setUp(self):
+        reset_data_version()
+        get_tile_cache().clear()
+        self.addCleanup(get_tile_cache().clear)
+
+    def test_partial_figure_is_marked_and_not_cached(self):
+        params = {'start_date': '2024-01-01', 'end_date': '2024-01-31'}
+        market = [(date(2024, 1, 2), 4742.83)]
+        with mock.patch.object(tiles, 'load_year_runs', return_value=[]), \
+                mock.patch.object(tiles, 'load_year_market', side_effect=[OSError('timeout'), market]):
+            partial = self.client.get('/graph/figure/', params)
+            full = self.client.get('/graph/figure/', params)
+            cached = self.client.get('/graph/figure/', params)
+
+        self.assertEqual(partial['X-Data-Incomplete'], '1')
+        self.assertNotIn('market', [trace.get('uid') for trace in partial.json()['data']])
+        self.assertNotIn('X-Data-Incomplete', full)
+        self.assertIn('market', [trace.get('uid') for trace in full.json()['data']])
+        self.assertEqual(cached.content, full.content)
+
+    def test_partial_delta_is_marked(self):
+        with mock.patch.object(tiles, 'load_year_runs', side_effect=OSError('timeout')), \
+                mock.patch.object(tiles, 'load_year_market', return_value=[]):
+            response = self.client.get('/graph/delta/', {'start_date': '2024-01-01', 'end_date': '2024-01-31'})
+
+        self.assertEqual(response['X-Data-Incomplete'], '1')
+
+
+# Тайлы лет загружаются в потоках пула — в TestCase sqlite отвечает 'table is locked'
+@override_settings(EPHEMERIS_FILE=None)
+class PlanetHoverTests(TransactionTestCase):
+    def setUp(self):
+        reset_data_version()
+        get_tile_cache().clear()
+        self.addCleanup(get_tile_cache().clear)
+        # Ма в Овне с 30.12.2023 по 03.01.2024 (период пересекает границу года), 04.01 — в Тельце
+        positions = [(date(2023, 12, 30) + timedelta(days=i), '1', 10.0 + i + 0.123) for i in range(5)]
+        positions.append((date(2024, 1, 4), '2', 0.5))
+        PlanetaryPosition.objects.bulk_create(
+            PlanetaryPosition(date=day, planet='Ma', zodiac_sign=sign, degrees_in_sign=degrees)
+            for day, sign, degrees in positions
+        )
+
+    def test_hover_point_for_every_day_with_stored_degrees(self):
+        runs, _, degrees, _ = get_range_data(date(2023, 12, 31), date(2024, 1, 4))
+        segments = get_planet_segments(runs, degrees)
+
+        self.assertEqual([segment[3] for segment in segments], [
+            [date(2023, 12, 31), date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 3)], [date(2024, 1, 4)],
+        ])
+        self.assertEqual(segments[0][4], [
+            '31-12-2023, Ma 1 , 11.12', '01-01-2024, Ma 1 , 12.12',
+            '02-01-2024, Ma 1 , 13.12', '03-01-2024, Ma 1 , 14.12',
+        ])
+        self.assertEqual(segments[1][4], ['04-01-2024, Ma 2 , 0.50'])
+
+    def test_boundary_points_without_daily_degrees(self):
+        runs, _, _, _ = get_range_data(date(2023, 12, 31), date(2024, 1, 4))
+        segments = get_planet_segments(runs)
+
+        self.assertEqual([segment[3] for segment in segments],
+                         [[date(2023, 12, 31), date(2024, 1, 3)], [date(2024, 1, 4)]])
+
+    def test_figure_hover_has_every_day(self):
+        response = self.client.get('/graph/figure/', {'start_date': '2024-01-01', 'end_date': '2024-01-04'})
+
+        hover = [trace['hovertext'] for trace in response.json()['data'] if trace.get('uid') == 'line:Ma:1:0']
+        self.assertEqual(hover, [['01-01-2024, Ma 1 , 12.12', '02-01-2024, Ma 1 , 13.12', '03-01-2024, Ma 1 , 14.12']])
+
+
+@override_settings(EPHEMERIS_FILE=None, EPHEMERIS_INDEX_CHECK_INTERVAL=0)
+class EventRunsSourceTests(TestCase):
+    def setUp(self):
+        PlanetaryPosition.objects.bulk_create(
+            PlanetaryPosition(date=day, planet=planet, zodiac_sign=sign, degrees_in_sign=degrees, retrograde=retrograde)
+            for day, planet, sign, degrees, retrograde in generate_position_rows(2, planets=['Ma', 'Bu'])
+        )
+        for reset in (reset_event_index, reset_ephemeris_index):
+            reset()
+            self.addCleanup(reset)
+
+    def test_events_source_matches_daily_rows(self):
+        start_date, end_date = date(1900, 3, 15), date(1901, 9, 30)
+        daily_runs = load_planet_runs(start_date, end_date)
+
+        call_command('build_planetary_events', stdout=io.StringIO())
+        event_runs = load_planet_runs(start_date, end_date)
+
+        self.assertTrue(daily_runs)
+        # Источники перечисляют планеты в разном порядке
+        self.assertEqual(sorted(event_runs), sorted(daily_runs))
+
+
+def decode_typed_array(value):
+    return np.frombuffer(base64.b64decode(value['bdata']), dtype=value['dtype'])
+
+
+def expected_numbers(values):
+    """Значения x/y трассы plotly -> float64, даты в мс от эпохи, None -> NaN"""
+    return np.array([
+        np.nan if value is None
+        else np.datetime64(value, 'ms').astype(np.int64) if isinstance(value, (date, np.datetime64))
+        else value
+        for value in values
+    ], dtype=np.float64)
+
+
+class FigureJsonTests(SimpleTestCase):
+    def setUp(self):
+        start_date, end_date = date(2024, 1, 1), date(2024, 1, 10)
+        runs = [
+            Run('Ma', '1', False, date(2024, 1, 1), date(2024, 1, 4), 27.5, 29.9),
+            Run('Ma', '2', True, date(2024, 1, 5), date(2024, 1, 10), 0.1, 3.2),
+            Run('Ma', '1', False, date(2024, 1, 8), date(2024, 1, 10), 28.0, 28.4),
+            Run('Sa', '10', False, date(2024, 1, 1), date(2024, 1, 10), 5.0, 5.5),
+        ]
+        degrees = DailyDegrees(start_date, {'Ma': np.linspace(27.5, 30.5, 10), 'Sa': np.linspace(5.0, 5.5, 10)})
+        market = [(date(2024, 1, 2), 4742.83), (date(2024, 1, 3), 4704.81), (date(2024, 1, 4), 4688.68)]
+        self.params = {'start_date': start_date.isoformat(), 'end_date': end_date.isoformat()}
+        self.data = (runs, market, degrees, False)
+        self.fig = build_market_planet_figure(start_date, end_date, data=self.data)
+
+    def test_typed_arrays_decode_to_figure_values(self):
+        with mock.patch('graph.views.get_tile_cache', return_value=None), \
+                mock.patch('graph.views.get_range_data', return_value=self.data):
+            response = self.client.get('/graph/figure/', self.params)
+        figure = response.json()
+        expected = self.fig.to_plotly_json()
+
+        self.assertEqual(len(figure['data']), len(expected['data']))
+        self.assertEqual(figure['layout']['xaxis']['type'], 'date')
+        encoded = 0
+        for trace, expected_trace in zip(figure['data'], expected['data']):
+            self.assertEqual(trace.get('uid'), expected_trace.get('uid'))
+            for key in ('x', 'y'):
+                if isinstance(trace[key], dict):
+                    encoded += 1
+                    np.testing.assert_array_equal(decode_typed_array(trace[key]),
+                                                  expected_numbers(expected_trace[key]), f"{trace.get('uid')} {key}")
+                else:
+                    self.assertEqual(trace[key], list(expected_trace[key]))
+            self.assertEqual(trace.get('hovertext'), expected_trace.get('hovertext'))
+        self.assertTrue(encoded)
+
+    def test_dates_are_milliseconds_since_epoch(self):
+        figure = json.loads(figure_to_json(self.fig))
+
+        market = next(trace for trace in figure['data'] if trace.get('uid') == 'market')
+        self.assertEqual(decode_typed_array(market['x']).tolist(), [1704153600000.0, 1704240000000.0, 1704326400000.0])
+        # Разрыв между отрезками одной трассы — NaN в x и y
+        line = next(trace for trace in figure['data'] if trace.get('uid') == 'line:Ma:1:0')
+        self.assertTrue(np.isnan(decode_typed_array(line['x'])[4]))
+        self.assertTrue(np.isnan(decode_typed_array(line['y'])[4]))
+
+
+def server_timing(response):
+    """Заголовок Server-Timing как {метрика: параметры}"""
+    metrics = {}
+    for metric in response['Server-Timing'].split(', '):
+        name, _, params = metric.partition(';')
+        metrics[name] = params
+    return metrics
+
+
+class ProfilingMiddlewareTests(TestCase):
+    def test_server_timing_only_when_enabled(self):
+        with override_settings(PROFILING_SERVER_TIMING=False):
+            self.assertNotIn('Server-Timing', self.client.get('/search/'))
+        with override_settings(PROFILING_SERVER_TIMING=True):
+            self.assertEqual(list(server_timing(self.client.get('/search/')))[-2:], ['db', 'total'])
+
+    def test_server_timing_follows_debug_by_default(self):
+        # В settings.py PROFILING_SERVER_TIMING = DEBUG
+        self.assertEqual(project_settings.PROFILING_SERVER_TIMING, project_settings.DEBUG)
+
+    @override_settings(PROFILING_SERVER_TIMING=True, SEARCH_BACKEND='sql')
+    def test_query_count_matches_executed_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/search/', {'zodiac_Ma': '1', 'zodiac_Sa': '2'})
+
+        self.assertTrue(queries.captured_queries)
+        self.assertEqual(server_timing(response)['db'].split(';desc=')[1], f'"{len(queries.captured_queries)} queries"')
+
+
+@override_settings(PROFILING_SERVER_TIMING=True)
+class ProfilingContextTests(SimpleTestCase):
+    async def test_concurrent_async_requests_keep_their_phases(self):
+        async def get_range_data_async(start_date, end_date):
+            # Этап назван по году запроса; ожидание дает второму запросу выполниться в это время
+            with profile_phase(f'source{start_date.year}'):
+                await asyncio.sleep(0.05)
+            return [], [], DailyDegrees(start_date, {}), False
+
+        with mock.patch('graph.views.get_tile_cache', return_value=None), \
+                mock.patch('graph.views.get_range_data_async', get_range_data_async):
+            responses = await asyncio.gather(*(
+                self.async_client.get('/graph/figure/async/', {'start_date': f'{year}-01-01', 'end_date': f'{year}-12-31'})
+                for year in (2020, 2021)
+            ))
+
+        for year, response in zip((2020, 2021), responses):
+            phases = set(server_timing(response)) - {'db', 'total'}
+            self.assertEqual(phases, {'cache', 'load', f'source{year}', 'planets', 'market', 'serialize'})
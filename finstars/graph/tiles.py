@@ -0,0 +1,208 @@
+"""
+Кэш данных графика по годам ("тайлы") поверх кэша Django.
+
+История неизменна, поэтому периоды планет, их градусы по дням и котировки за каждый календарный год
+вычисляются один раз и кладутся в кэш FIGURE_CACHE_ALIAS (finstars/data_cache.py). Любой диапазон собирается из тайлов
+его лет; из базы догружаются только отсутствующие (как правило, крайние) годы.
+Ключи содержат версию данных: после загрузки новых данных старые тайлы просто перестают читаться.
+"""
+import asyncio
+import logging
+from datetime import date, timedelta
+
+import numpy as np
+
+from finstars.concurrency import fetch_concurrently
+from finstars.data_cache import get_data_version, get_data_version_async, get_tile_cache
+from search.periods import to_date
+
+from .data import (
+    DailyDegrees, clip_run, load_daily_degrees, load_daily_degrees_async, load_market_data,
+    load_market_data_async, load_planet_runs, load_planet_runs_async,
+)
+
+logger = logging.getLogger(__name__)
+
+# Формат тайла в ключе кэша: тайлы прежнего формата (без 'degrees') не читаются
+TILE_FORMAT = 2
+
+
+def load_year_runs(year):
+    year_start, year_end = date(year, 1, 1), date(year, 12, 31)
+    return [clip_run(run, year_start, year_end) for run in load_planet_runs(year_start, year_end)]
+
+
+def load_year_degrees(year):
+    return load_daily_degrees(date(year, 1, 1), date(year, 12, 31)).values
+
+
+def load_year_market(year):
+    return list(load_market_data(date(year, 1, 1), date(year, 12, 31)))
+
+
+def compute_year_tiles(years):
+    """
+    Тайлы {год: тайл} для недостающих лет. Периоды планет, градусы по дням и котировки каждого года
+    загружаются параллельно; возвращает (тайлы, incomplete) — множество лет, у которых
+    какой-то источник упал и тайл собран частично (такие тайлы не кэшируются).
+    """
+    sources = {}
+    for year in years:
+        sources[('runs', year)] = (load_year_runs, (year,))
+        sources[('degrees', year)] = (load_year_degrees, (year,))
+        sources[('market', year)] = (load_year_market, (year,))
+
+    results, errors = fetch_concurrently(sources)
+    tiles = {
+        year: {
+            'runs': results.get(('runs', year), []),
+            'degrees': results.get(('degrees', year), {}),
+            'market': results.get(('market', year), []),
+        }
+        for year in years
+    }
+    incomplete = {year for _, year in errors}
+    return tiles, incomplete
+
+
+def get_year_tiles(start_year, end_year):
+    """
+    (тайлы {год: тайл}, incomplete) за годы диапазона; недостающие вычисляются и кладутся в кэш.
+    incomplete — годы, собранные частично из-за ошибки источника
+    """
+    years = range(start_year, end_year + 1)
+    cache = get_tile_cache()
+    if cache is None:
+        return compute_year_tiles(years)
+
+    version = get_data_version()
+    keys = {year: f'graph:tile:{TILE_FORMAT}:{version}:{year}' for year in years}
+    cached = cache.get_many(keys.values())
+
+    tiles = {year: cached[key] for year, key in keys.items() if key in cached}
+    missing_years = [year for year in years if year not in tiles]
+    incomplete = set()
+    if missing_years:
+        computed, incomplete = compute_year_tiles(missing_years)
+        tiles.update(computed)
+        cache.set_many({keys[year]: computed[year] for year in missing_years if year not in incomplete},
+                       timeout=None)
+    return tiles, incomplete
+
+
+async def compute_year_tiles_async(years):
+    """compute_year_tiles для async-представлений: все запросы всех лет ожидаются одновременно"""
+    jobs = []
+    for year in years:
+        jobs.append(load_planet_runs_async(date(year, 1, 1), date(year, 12, 31)))
+        jobs.append(load_daily_degrees_async(date(year, 1, 1), date(year, 12, 31)))
+        jobs.append(load_market_data_async(date(year, 1, 1), date(year, 12, 31)))
+    results = await asyncio.gather(*jobs, return_exceptions=True)
+
+    tiles, incomplete = {}, set()
+    for i, year in enumerate(years):
+        runs, degrees, market = results[3 * i:3 * i + 3]
+        errors = [result for result in (runs, degrees, market) if isinstance(result, Exception)]
+        if errors:
+            logger.warning("Tile %s failed: %s", year, errors[0])
+            incomplete.add(year)
+        year_start, year_end = date(year, 1, 1), date(year, 12, 31)
+        tiles[year] = {
+            'runs': [] if isinstance(runs, Exception) else [clip_run(run, year_start, year_end) for run in runs],
+            'degrees': {} if isinstance(degrees, Exception) else degrees.values,
+            'market': [] if isinstance(market, Exception) else list(market),
+        }
+    return tiles, incomplete
+
+
+async def get_year_tiles_async(start_year, end_year):
+    years = list(range(start_year, end_year + 1))
+    cache = get_tile_cache()
+    if cache is None:
+        return await compute_year_tiles_async(years)
+
+    version = await get_data_version_async()
+    keys = {year: f'graph:tile:{TILE_FORMAT}:{version}:{year}' for year in years}
+    cached = await cache.aget_many(keys.values())
+
+    tiles = {year: cached[key] for year, key in keys.items() if key in cached}
+    missing_years = [year for year in years if year not in tiles]
+    incomplete = set()
+    if missing_years:
+        computed, incomplete = await compute_year_tiles_async(missing_years)
+        tiles.update(computed)
+        await cache.aset_many({keys[year]: computed[year] for year in missing_years if year not in incomplete},
+                              timeout=None)
+    return tiles, incomplete
+
+
+def stitch_runs(runs):
+    """Склеивает периоды, разрезанные границей года (тот же знак и ретроградность, дни подряд)"""
+    last_runs = {}
+    stitched = []
+    for run in sorted(runs, key=lambda run: (run.planet, run.start_date)):
+        previous = last_runs.get(run.planet)
+        if (previous is not None and previous.zodiac_sign == run.zodiac_sign
+                and previous.retrograde == run.retrograde
+                and run.start_date - previous.end_date == timedelta(days=1)):
+            previous = previous._replace(end_date=run.end_date, end_degrees=run.end_degrees)
+            stitched[-1] = previous
+        else:
+            previous = run
+            stitched.append(run)
+        last_runs[run.planet] = previous
+    return stitched
+
+
+def assemble_degrees(tiles, start_date, end_date):
+    """DailyDegrees диапазона: годовые массивы тайлов подряд, обрезанные по датам"""
+    years = sorted(tiles)
+    origin = date(years[0], 1, 1)
+    planets = {planet for year in years for planet in tiles[year]['degrees']}
+
+    values = {}
+    for planet in planets:
+        yearly = [
+            tiles[year]['degrees'].get(planet, np.full((date(year, 12, 31) - date(year, 1, 1)).days + 1, np.nan))
+            for year in years
+        ]
+        values[planet] = np.concatenate(yearly)[(start_date - origin).days:(end_date - origin).days + 1]
+    return DailyDegrees(start_date, values)
+
+
+def assemble_range(tiles, start_date, end_date):
+    """(runs, market, degrees) диапазона из тайлов его лет"""
+    runs = []
+    market = []
+    for year in sorted(tiles):
+        runs.extend(
+            clip_run(run, start_date, end_date) for run in tiles[year]['runs']
+            if run.end_date >= start_date and run.start_date <= end_date
+        )
+        market.extend(row for row in tiles[year]['market'] if start_date <= row[0] <= end_date)
+
+    return stitch_runs(runs), market, assemble_degrees(tiles, start_date, end_date)
+
+
+def get_range_data(start_date, end_date):
+    """
+    (runs, market, degrees, incomplete) для диапазона дат, собранные из годовых тайлов.
+    degrees — DailyDegrees для подсказок по дням;
+    incomplete=True, если часть данных не загрузилась: такой результат нельзя кэшировать
+    """
+    start_date, end_date = to_date(start_date), to_date(end_date)
+    if start_date > end_date:
+        return [], [], DailyDegrees(start_date, {}), False
+
+    tiles, incomplete = get_year_tiles(start_date.year, end_date.year)
+    return (*assemble_range(tiles, start_date, end_date), bool(incomplete))
+
+
+async def get_range_data_async(start_date, end_date):
+    """get_range_data для async-представлений"""
+    start_date, end_date = to_date(start_date), to_date(end_date)
+    if start_date > end_date:
+        return [], [], DailyDegrees(start_date, {}), False
+
+    tiles, incomplete = await get_year_tiles_async(start_date.year, end_date.year)
+    return (*assemble_range(tiles, start_date, end_date), bool(incomplete))
@@ -1,6 +1,12 @@
 from django.urls import path
-from .views import market_planet_chart
+from .views import (
+    market_planet_chart, market_planet_chart_delta, market_planet_chart_figure, market_planet_chart_figure_async,
+)
 
 urlpatterns = [
     path('', market_planet_chart, name='market_planet_chart'),
+    path('figure/', market_planet_chart_figure, name='market_planet_chart_figure'),
+    path('delta/', market_planet_chart_delta, name='market_planet_chart_delta'),
+    # Та же фигура через async-представление (для ASGI-сервера)
+    path('figure/async/', market_planet_chart_figure_async, name='market_planet_chart_figure_async'),
 ]
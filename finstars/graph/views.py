@@ -1,155 +1,252 @@
-import psycopg2
-import plotly.graph_objs as go
-from plotly.subplots import make_subplots
 from django.shortcuts import render
-import plotly.offline as pyo
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 import logging
 
+import numpy as np
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.views.decorators.gzip import gzip_page
+
+from finstars.data_cache import get_data_version, get_data_version_async, get_tile_cache
+from finstars.downsampling import downsample, parse_max_points
+from finstars.profiling import profile_phase
+
+from search.periods import to_date
+
+from .serialization import figure_to_json, traces_to_json
+from .tiles import get_range_data, get_range_data_async
+
 logger = logging.getLogger(__name__)
 
 
-# Подключение к БД
-def get_db_connection():
-    conn = psycopg2.connect(
-        dbname="planetary_market_data",
-        user="user",
-        password="",
-        host="localhost"
-    )
-    return conn
+ZODIAC_COLORS = {
+    '1': 'red', '2': 'green', '3': 'yellow', '4': 'blue',
+    '5': 'orange', '6': 'brown', '7': 'pink', '8': 'purple',
+    '9': 'cyan', '10': 'gray', '11': 'lightblue', '12': 'violet'
+}
+
+# Заголовок ответа, если часть данных диапазона не загрузилась (ответ не кэшируется)
+DATA_INCOMPLETE_HEADER = 'X-Data-Incomplete'
+
+PLANET_Y_POSITIONS = {
+    'Sa': 1, 'Ra': 2, 'Ma': 3, 'Gu': 4, 'Bu': 5, 'Sk': 6
+}
+
+
+# Перестановка символов 'YYYY-MM-DD' -> 'DD-MM-YYYY'
+_DAY_FIRST_ORDER = [8, 9, 7, 5, 6, 4, 0, 1, 2, 3]
+
+
+def format_hover_texts(dates, planets, signs, retrograde, degrees):
+    """Подписи 'DD-MM-YYYY, planet sign (R), degrees' для массивов одинаковой длины одной векторной операцией"""
+    if not len(dates):
+        return np.empty(0, dtype='<U1')
+
+    iso_dates = np.datetime_as_string(np.asarray(dates, dtype='datetime64[D]'), unit='D').astype('<U10')
+    day_first = np.ascontiguousarray(iso_dates.view('<U1').reshape(-1, 10)[:, _DAY_FIRST_ORDER]).view('<U10').ravel()
+
+    degrees = np.asarray(degrees, dtype=np.float64)
+    formatted_degrees = np.where(np.isnan(degrees), '', np.char.mod('%.2f', degrees))
+    markers = np.where(retrograde, '(R)', '')
+
+    texts = day_first
+    for part in (', ', planets, ' ', signs, ' ', markers, ', ', formatted_degrees):
+        texts = np.char.add(texts, part)
+    return texts
+
+
+def get_planet_segments(runs, degrees=None):
+    """
+    Отрезки (planet, sign, is_retrograde, dates, hover_texts) для каждого периода.
+    Подписи для всех точек строятся одной векторной операцией.
+
+    degrees — DailyDegrees диапазона (graph.data): точка с подсказкой на каждый день периода
+    и градусом из эфемериды. Без него точки и подсказки только на границах периодов
+    (градус на обрезанной границе интерполирован, см. graph.data.clip_run).
+    """
+    if not runs:
+        return []
+
+    planets, signs, retrograde, start_dates, end_dates, start_degrees, end_degrees = zip(*runs)
+    starts = np.array(start_dates, dtype='datetime64[D]')
+    ends = np.array(end_dates, dtype='datetime64[D]')
+
+    if degrees is None:
+        # Границы всех периодов подряд: [start_0, end_0, start_1, end_1, ...]; у однодневного — одна точка
+        lengths = np.where(starts == ends, 1, 2)
+        dates = np.column_stack((starts, ends)).ravel()
+        point_degrees = np.array([
+            np.nan if value is None else float(value)
+            for pair in zip(start_degrees, end_degrees) for value in pair
+        ])
+        keep = np.ones(len(dates), dtype=bool)
+        keep[1::2] = lengths == 2
+        dates, point_degrees = dates[keep], point_degrees[keep]
+    else:
+        lengths = (ends - starts).astype(np.int64) + 1
+        first_points = np.cumsum(lengths) - lengths
+        dates = np.repeat(starts, lengths) + (np.arange(lengths.sum()) - np.repeat(first_points, lengths))
+        offsets = (starts - np.datetime64(degrees.origin, 'D')).astype(np.int64)
+        missing = np.full(lengths.max(), np.nan)
+        point_degrees = np.concatenate([
+            degrees.values[planet][offset:offset + length] if planet in degrees.values else missing[:length]
+            for planet, offset, length in zip(planets, offsets, lengths)
+        ])
+
+    hover_texts = format_hover_texts(
+        dates, np.repeat(planets, lengths), np.repeat(signs, lengths), np.repeat(retrograde, lengths), point_degrees
+    ).tolist()
+    dates = dates.astype(object).tolist()
+
+    segments = []
+    point = 0
+    for run, length in zip(runs, lengths.tolist()):
+        segments.append((run.planet, run.zodiac_sign, run.retrograde,
+                         dates[point:point + length], hover_texts[point:point + length]))
+        point += length
+    return segments
+
+
+def segment_line_style(sign, is_retrograde):
+    line_style = dict(color=ZODIAC_COLORS[sign], width=3)
+    if is_retrograde:
+        line_style['dash'] = 'dash'
+    return line_style
+
+
+def segment_label(planet, sign, is_retrograde):
+    retrograde_marker = "(R)" if is_retrograde else ""
+    return f"{planet} {sign} {retrograde_marker}"
 
 
 # Функция для получения данных по планетам с hovertext и подписями
-def plot_planets(start_date, end_date, fig):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute('''
-        SELECT date, planet, zodiac_sign, degrees_in_sign, retrograde
-        FROM planetary_positions
-        WHERE date BETWEEN %s AND %s
-        AND planet IN ('Sa', 'Gu', 'Ma', 'Sk', 'Bu', 'Ra')
-        ORDER BY date;
-    ''', (start_date, end_date))
-
-    planet_data = cursor.fetchall()
-    planets_grouped = {}
-
-    ZODIAC_COLORS = {
-        '1': 'red', '2': 'green', '3': 'yellow', '4': 'blue',
-        '5': 'orange', '6': 'brown', '7': 'pink', '8': 'purple',
-        '9': 'cyan', '10': 'gray', '11': 'lightblue', '12': 'violet'
-    }
-
-    PLANET_Y_POSITIONS = {
-        'Sa': 1, 'Ra': 2, 'Ma': 3, 'Gu': 4, 'Bu': 5, 'Sk': 6
-    }
-
-    # Группировка данных по планетам
-    for row in planet_data:
-        date, planet, sign, degrees_in_sign, retrograde = row
-        if planet not in planets_grouped:
-            planets_grouped[planet] = []
-        planets_grouped[planet].append({
-            'date': date,
-            'sign': sign,
-            'degrees_in_sign': degrees_in_sign,
-            'retrograde': retrograde
-        })
-
-    # Функция для добавления линии и подписи
-    def add_trace_to_fig(segment_dates, planet, previous_sign, previous_retrograde, hover_texts):
-        line_style = dict(color=ZODIAC_COLORS[previous_sign], width=3)
-        if previous_retrograde:
-            line_style['dash'] = 'dash'
-
-        fig.add_trace(go.Scatter(
-            x=segment_dates,
-            y=[PLANET_Y_POSITIONS[planet]] * len(segment_dates),
+def plot_planets(start_date, end_date, fig, consolidate=True, webgl=False, runs=None, degrees=None):
+    """
+    consolidate=True — одна линия на сочетание планета/знак/ретроградность (отрезки разделены None)
+    и одна текстовая трасса подписей на планету: число трасс не зависит от длины диапазона.
+    consolidate=False — по линии и подписи на каждый отрезок.
+    webgl=True — Scattergl вместо Scatter.
+    runs, degrees — уже загруженные периоды и DailyDegrees (иначе берутся из тайлов за диапазон).
+    """
+    # plotly импортируется при первом построении графика, а не при загрузке URLconf
+    import plotly.graph_objs as go
+
+    if runs is None:
+        runs, _, degrees, _ = get_range_data(start_date, end_date)
+    segments = get_planet_segments(runs, degrees)
+    scatter = go.Scattergl if webgl else go.Scatter
+
+    if not consolidate:
+        for planet, sign, is_retrograde, segment_dates, hover_texts in segments:
+            fig.add_trace(scatter(
+                x=segment_dates,
+                y=[PLANET_Y_POSITIONS[planet]] * len(segment_dates),
+                mode='lines',
+                line=segment_line_style(sign, is_retrograde),
+                hoverinfo='text',
+                hovertext=hover_texts
+            ))
+
+            mid_index = len(segment_dates) // 2
+            fig.add_trace(scatter(
+                x=[segment_dates[mid_index]],
+                y=[PLANET_Y_POSITIONS[planet] + 0.1],  # Над отрезком
+                mode='text',
+                text=[segment_label(planet, sign, is_retrograde)],
+                showlegend=False
+            ))
+        return
+
+    for trace in build_consolidated_traces(segments, scatter):
+        fig.add_trace(trace)
+
+
+def build_consolidated_traces(segments, scatter=None):
+    """
+    Трассы сводного режима. У каждой трассы uid — ключ стиля (line:планета:знак:R,
+    labels:планета), по которому страница дописывает дельты к уже загруженным трассам.
+    scatter — класс трасс, по умолчанию go.Scatter.
+    """
+    if scatter is None:
+        import plotly.graph_objs as go
+        scatter = go.Scatter
+
+    lines = {}
+    labels = {}
+    for planet, sign, is_retrograde, segment_dates, hover_texts in segments:
+        line = lines.setdefault((planet, sign, is_retrograde), {'x': [], 'y': [], 'hovertext': []})
+        if line['x']:
+            # Разрыв между отрезками одной трассы
+            line['x'].append(None)
+            line['y'].append(None)
+            line['hovertext'].append(None)
+        line['x'].extend(segment_dates)
+        line['y'].extend([PLANET_Y_POSITIONS[planet]] * len(segment_dates))
+        line['hovertext'].extend(hover_texts)
+
+        label = labels.setdefault(planet, {'x': [], 'text': []})
+        label['x'].append(segment_dates[len(segment_dates) // 2])
+        label['text'].append(segment_label(planet, sign, is_retrograde))
+
+    traces = []
+    for (planet, sign, is_retrograde), line in lines.items():
+        traces.append(scatter(
+            uid=f'line:{planet}:{sign}:{int(is_retrograde)}',
+            x=line['x'],
+            y=line['y'],
             mode='lines',
-            line=line_style,
+            line=segment_line_style(sign, is_retrograde),
             hoverinfo='text',
-            hovertext=hover_texts
+            hovertext=line['hovertext'],
+            connectgaps=False
         ))
 
-        mid_index = len(segment_dates) // 2
-        retrograde_marker = "(R)" if previous_retrograde else ""
-        fig.add_trace(go.Scatter(
-            x=[segment_dates[mid_index]],
-            y=[PLANET_Y_POSITIONS[planet] + 0.1],  # Над отрезком
+    for planet, label in labels.items():
+        traces.append(scatter(
+            uid=f'labels:{planet}',
+            x=label['x'],
+            y=[PLANET_Y_POSITIONS[planet] + 0.1] * len(label['x']),  # Над отрезками
             mode='text',
-            text=[f"{planet} {previous_sign} {retrograde_marker}"],
+            text=label['text'],
             showlegend=False
         ))
+    return traces
+
+
+def build_financial_trace(financial_data, max_points=None):
+    import plotly.graph_objs as go
+
+    if not financial_data:
+        return None
+
+    dates, close_prices = zip(*financial_data)
+    # Длинный ряд прореживается до max_points точек (LTTB) с сохранением формы
+    dates, close_prices = downsample(dates, close_prices, max_points)
+    return go.Scatter(
+        uid='market',
+        x=dates,
+        y=close_prices,
+        mode='lines',
+        name='S&P 500',
+        line=dict(color='blue'),
+        yaxis="y2"
+    )
 
-    # Обработка каждой планеты
-    for planet, positions in planets_grouped.items():
-        previous_sign = None
-        previous_retrograde = None
-        segment_dates = []
-        hover_texts = []
-
-        for i, pos in enumerate(positions):
-            current_sign = pos['sign']
-            current_degrees = pos['degrees_in_sign']
-            is_retrograde = pos['retrograde'] == "(R)"
-            retrograde_marker = "(R)" if is_retrograde else ""
-
-            # Форматирование градусов
-            formatted_degrees = f"{current_degrees:.2f}"
-            hover_text = f"{pos['date'].strftime('%d-%m-%Y')}, {planet} {current_sign} {retrograde_marker}, {formatted_degrees}"
-
-            # Проверка смены знака или ретроградности
-            if previous_sign is None or current_sign != previous_sign or is_retrograde != previous_retrograde:
-                if segment_dates:
-                    add_trace_to_fig(segment_dates, planet, previous_sign, previous_retrograde, hover_texts)
-
-                # Начинаем новый сегмент, исключая дату, с которой начинается новый знак
-                segment_dates = [pos['date']]
-                hover_texts = [hover_text]
-                previous_sign = current_sign
-                previous_retrograde = is_retrograde
-            else:
-                segment_dates.append(pos['date'])
-                hover_texts.append(hover_text)
-
-        if segment_dates:
-            add_trace_to_fig(segment_dates, planet, previous_sign, previous_retrograde, hover_texts)
-
-    conn.close()
 
 # Функция для получения данных фондового рынка
-def plot_financial_data(start_date, end_date, fig):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute('''
-        SELECT date, close_price
-        FROM market_data
-        WHERE date BETWEEN %s AND %s AND close_price != 0;
-    ''', (start_date, end_date))
-
-    financial_data = cursor.fetchall()
-    if financial_data:
-        dates, close_prices = zip(*financial_data)
-        fig.add_trace(go.Scatter(
-            x=dates,
-            y=close_prices,
-            mode='lines',
-            name='S&P 500',
-            line=dict(color='blue'),
-            yaxis="y2"
-        ))
+def plot_financial_data(start_date, end_date, fig, max_points=None, financial_data=None):
+    if financial_data is None:
+        _, financial_data, _, _ = get_range_data(start_date, end_date)
 
-    conn.close()
+    trace = build_financial_trace(financial_data, max_points)
+    if trace is not None:
+        fig.add_trace(trace)
 
-def market_planet_chart(request):
-    # Логируем полученные GET-параметры
-    start_date = request.GET.get('start_date', '2024-01-01')
-    end_date = request.GET.get('end_date', '2024-12-31')
 
-    print(f"Received request with start_date: {start_date} and end_date: {end_date}")  # Логируем входящие данные
+def build_market_planet_figure(start_date, end_date, webgl=False, max_points=None, data=None):
+    """data — уже загруженные (runs, financial_data, degrees, incomplete), иначе берутся из тайлов за диапазон"""
+    from plotly.subplots import make_subplots
 
     fig = make_subplots(
         rows=2, cols=1,
@@ -158,9 +255,17 @@ def market_planet_chart(request):
         row_heights=[0.3, 0.7]
     )
 
+    # Данные планет и рынка загружаются одним этапом (недостающие годы — параллельно)
+    if data is None:
+        with profile_phase('load'):
+            data = get_range_data(start_date, end_date)
+    runs, financial_data, degrees, _ = data
+
     # Построение графиков
-    plot_planets(start_date, end_date, fig)
-    plot_financial_data(start_date, end_date, fig)
+    with profile_phase('planets'):
+        plot_planets(start_date, end_date, fig, webgl=webgl, runs=runs, degrees=degrees)
+    with profile_phase('market'):
+        plot_financial_data(start_date, end_date, fig, max_points, financial_data=financial_data)
 
     fig.update_layout(
         height=800,
@@ -183,15 +288,152 @@ def market_planet_chart(request):
             tickformat="%Y-%m-%d"
         )
     )
+    # Даты в JSON-ответе передаются числами (мс от эпохи), поэтому тип оси задается явно
+    fig.update_xaxes(type='date')
+    return fig
 
-    graph_html = pyo.plot(fig, output_type="div")
 
-    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        print("Returning updated graph HTML.")  # Логируем ответ сервера
-        return HttpResponse(graph_html)
+def parse_chart_date(value):
+    try:
+        return to_date(value)
+    except ValueError:
+        raise ValueError(f'Некорректная дата {value}.')
 
-    return render(request, 'graph/market_planet_chart.html', {'graph_html': graph_html})
 
+def get_chart_params(request):
+    """Параметры графика из GET; ValueError с текстом ошибки при некорректных датах"""
+    start_date = parse_chart_date(request.GET.get('start_date', '2024-01-01'))
+    end_date = parse_chart_date(request.GET.get('end_date', '2024-12-31'))
+    if start_date > end_date:
+        raise ValueError('Начальная дата позже конечной.')
+    # webgl=1 — отрисовка через WebGL (Scattergl) для очень длинных диапазонов
+    webgl = request.GET.get('webgl') == '1'
+    # max_points — примерно ширина графика в пикселях; при приближении страница
+    # перезапрашивает суженный диапазон и получает полное разрешение
+    max_points = parse_max_points(request.GET.get('max_points'), settings.CHART_MAX_POINTS)
+    return start_date, end_date, webgl, max_points
 
 
+def market_planet_chart(request):
+    if request.headers.get('x-requested-with') != 'XMLHttpRequest':
+        # Страница сама запрашивает данные графика через market_planet_chart_figure
+        return render(request, 'graph/market_planet_chart.html')
 
+    # Логируем полученные GET-параметры
+    try:
+        start_date, end_date, webgl, max_points = get_chart_params(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    logger.info("Received request with start_date: %s and end_date: %s", start_date, end_date)
+
+    fig = build_market_planet_figure(start_date, end_date, webgl, max_points)
+
+    # plotly.js уже подключен на странице — не встраиваем его в каждый ответ
+    import plotly.offline as pyo
+    with profile_phase('serialize'):
+        graph_html = pyo.plot(fig, output_type="div", include_plotlyjs=False)
+    return HttpResponse(graph_html)
+
+
+@gzip_page
+def market_planet_chart_figure(request):
+    """JSON фигуры для Plotly.react: массивы в бинарном виде, ответ сжимается gzip"""
+    try:
+        start_date, end_date, webgl, max_points = get_chart_params(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    # Повторный запрос того же диапазона отдается из кэша целиком;
+    # в ключе — разобранные даты, поэтому '2024-1-1' и '2024-01-01' дают одну запись
+    cache = get_tile_cache()
+    cache_key = (f'graph:figure:{get_data_version()}:{start_date}:{end_date}:{int(webgl)}:{max_points}'
+                 if cache else None)
+    with profile_phase('cache'):
+        figure_json = cache.get(cache_key) if cache else None
+
+    incomplete = False
+    if figure_json is None:
+        with profile_phase('load'):
+            data = get_range_data(start_date, end_date)
+        incomplete = data[-1]
+        figure_json = build_figure_json(start_date, end_date, webgl, max_points, data)
+        # Частичная фигура (упал источник) не кэшируется, иначе отдавалась бы до смены версии данных
+        if cache and not incomplete:
+            with profile_phase('cache'):
+                cache.set(cache_key, figure_json, timeout=None)
+
+    return chart_json_response(figure_json, incomplete)
+
+
+@gzip_page
+async def market_planet_chart_figure_async(request):
+    """
+    market_planet_chart_figure для ASGI: ожидание базы не занимает поток воркера
+    (асинхронный пул), построение фигуры выполняется в отдельном потоке
+    """
+    try:
+        start_date, end_date, webgl, max_points = get_chart_params(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    cache = get_tile_cache()
+    cache_key = (f'graph:figure:{await get_data_version_async()}:{start_date}:{end_date}:{int(webgl)}:{max_points}'
+                 if cache else None)
+    with profile_phase('cache'):
+        figure_json = await cache.aget(cache_key) if cache else None
+
+    incomplete = False
+    if figure_json is None:
+        with profile_phase('load'):
+            data = await get_range_data_async(start_date, end_date)
+        incomplete = data[-1]
+        figure_json = await sync_to_async(build_figure_json, thread_sensitive=False)(
+            start_date, end_date, webgl, max_points, data)
+        if cache and not incomplete:
+            with profile_phase('cache'):
+                await cache.aset(cache_key, figure_json, timeout=None)
+
+    return chart_json_response(figure_json, incomplete)
+
+
+def build_figure_json(start_date, end_date, webgl, max_points, data):
+    fig = build_market_planet_figure(start_date, end_date, webgl, max_points, data)
+    with profile_phase('serialize'):
+        return figure_to_json(fig)
+
+
+def chart_json_response(content, incomplete):
+    """JSON графика; при частичных данных — заголовок DATA_INCOMPLETE_HEADER, чтобы страница запросила их снова"""
+    response = HttpResponse(content, content_type='application/json')
+    if incomplete:
+        response[DATA_INCOMPLETE_HEADER] = '1'
+    return response
+
+
+@gzip_page
+def market_planet_chart_delta(request):
+    """
+    Дельта для панорамирования: только отрезки и котировки, пересекающие новый срез дат,
+    в виде трасс с теми же uid, что и в полной фигуре. Страница дописывает их
+    через Plotly.extendTraces/prependTraces или добавляет как новые трассы.
+    """
+    try:
+        start_date, end_date, webgl, max_points = get_chart_params(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    import plotly.graph_objs as go
+
+    with profile_phase('load'):
+        runs, financial_data, degrees, incomplete = get_range_data(start_date, end_date)
+
+    scatter = go.Scattergl if webgl else go.Scatter
+    with profile_phase('planets'):
+        traces = build_consolidated_traces(get_planet_segments(runs, degrees), scatter)
+    with profile_phase('market'):
+        financial_trace = build_financial_trace(financial_data, max_points)
+    if financial_trace is not None:
+        traces.append(financial_trace)
+
+    with profile_phase('serialize'):
+        delta_json = traces_to_json(traces)
+    return chart_json_response(delta_json, incomplete)
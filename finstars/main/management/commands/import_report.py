@@ -0,0 +1,105 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Запуск воркера в отдельном процессе: настройка Django, middleware и весь URLconf,
+# как при первом запросе. Время и пиковый RSS процесса печатаются последней строкой
+STARTUP_SCRIPT = '''
+import json, os, resource, sys, time
+started = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+from django.urls import get_resolver
+get_resolver().url_patterns
+elapsed = time.perf_counter() - started
+# ru_maxrss в Linux наследуется от родителя через fork/exec, поэтому пик берется из /proc (VmHWM)
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if os.path.exists('/proc/self/status'):
+    with open('/proc/self/status') as status:
+        rss_kb = next(int(line.split()[1]) for line in status if line.startswith('VmHWM:'))
+print(json.dumps({
+    'seconds': elapsed,
+    'rss_kb': rss_kb,
+    'modules': sorted(sys.modules),
+}))
+'''
+
+# Тяжелые зависимости, которые должны загружаться только при первом использовании
+HEAVY_MODULES = ('dash', 'django_plotly_dash', 'pandas', 'plotly', 'yfinance', 'httpx', 'psycopg_pool')
+
+
+def parse_importtime(stderr):
+    """Строки -X importtime -> {модуль: накопленное время в мкс} для модулей верхнего уровня дерева импорта"""
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Отступ — глубина вложенности; без отступа — импорт, выполненный непосредственно
+        if name.startswith('  '):
+            continue
+        totals[name.strip()] = totals.get(name.strip(), 0) + int(cumulative)
+    return totals
+
+
+class Command(BaseCommand):
+    help = ("Холодный старт воркера в отдельном процессе: время импорта Django, middleware и URLconf, "
+            "пиковый RSS, самые долгие импорты и загруженные тяжелые зависимости; "
+            "--check сравнивает время и память с STARTUP_TIME_BUDGET_MS и STARTUP_RSS_BUDGET_MB")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=3, help='Запусков; берется самый быстрый')
+        parser.add_argument('--top', type=int, default=15)
+        parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                            help='Переменные окружения процесса, например FINSTARS_DASH=0')
+        parser.add_argument('--check', action='store_true', help='Ошибка, если бюджет превышен')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ)
+        for item in options['env']:
+            key, _, value = item.partition('=')
+            env[key] = value
+
+        runs = [self.run_startup(env) for _ in range(max(options['repeat'], 1))]
+        result, imports = min(runs, key=lambda run: run[0]['seconds'])
+        rss_mb = result['rss_kb'] / 1024
+
+        self.stdout.write(f"Startup: {result['seconds'] * 1000:.0f} ms, peak RSS {rss_mb:.0f} MiB, "
+                          f"{len(result['modules'])} modules")
+
+        self.stdout.write(f"Slowest imports (of {len(imports)} top-level):")
+        for name, microseconds in sorted(imports.items(), key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write(f"  {microseconds / 1000:8.1f} ms  {name}")
+
+        loaded = set(result['modules'])
+        heavy = [name for name in HEAVY_MODULES if name in loaded]
+        self.stdout.write(f"Heavy modules loaded at startup: {', '.join(heavy) or 'none'}")
+
+        if not options['check']:
+            return
+
+        over_budget = []
+        time_budget = settings.STARTUP_TIME_BUDGET_MS
+        rss_budget = settings.STARTUP_RSS_BUDGET_MB
+        if result['seconds'] * 1000 > time_budget:
+            over_budget.append(f"startup {result['seconds'] * 1000:.0f} ms > {time_budget} ms")
+        if rss_mb > rss_budget:
+            over_budget.append(f"peak RSS {rss_mb:.0f} MiB > {rss_budget} MiB")
+        if over_budget:
+            raise CommandError('Startup over budget: ' + '; '.join(over_budget))
+        self.stdout.write(self.style.SUCCESS('Startup within budget'))
+
+    def run_startup(self, env):
+        completed = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT],
+            env=env, cwd=settings.BASE_DIR, capture_output=True, text=True,
+        )
+        if completed.returncode != 0:
+            raise CommandError(f'Worker startup failed:\n{completed.stderr[-2000:]}')
+
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        return result, parse_importtime(completed.stderr)
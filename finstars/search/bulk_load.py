@@ -0,0 +1,197 @@
+"""
+Потоковая загрузка больших CSV/Parquet файлов в таблицы, заполняемые вне Django
+(planetary_positions, market_data).
+
+Данные читаются пачками и попадают во временную staging-таблицу: в PostgreSQL через COPY,
+в остальных базах (SQLite в тестах) через executemany. Из строк с одинаковым ключом
+остается последняя в файле. Затем одним UPDATE обновляются изменившиеся строки и одним
+INSERT добавляются новые — строки без изменений не трогаются. Если что-то изменилось,
+версия таблицы увеличивается (finstars.data_cache.bump_data_version).
+"""
+import csv
+import io
+import time
+
+from django.db import connection, transaction
+
+from finstars.data_cache import bump_data_version
+
+CHUNK_SIZE = 50000
+
+# Порядковый номер строки во входном файле: из повторяющихся ключей побеждает последняя строка
+ROW_NUMBER_COLUMN = 'load_row'
+
+# Сравнение с учетом NULL
+DISTINCT_FROM = {
+    'postgresql': 'IS DISTINCT FROM',
+    'sqlite': 'IS NOT',
+}
+
+
+def iter_csv_chunks(path, columns, chunk_size=CHUNK_SIZE):
+    """Пачки строк CSV-файла с заголовком; значения упорядочены по columns, пустые строки — None"""
+    with open(path, newline='', encoding='utf-8') as file:
+        reader = csv.DictReader(file)
+        missing = set(columns) - set(reader.fieldnames or [])
+        if missing:
+            raise ValueError(f"{path}: missing columns {', '.join(sorted(missing))}")
+
+        chunk = []
+        for record in reader:
+            chunk.append([record[column] or None for column in columns])
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def iter_parquet_chunks(path, columns, chunk_size=CHUNK_SIZE):
+    """Пачки строк Parquet-файла (нужен pyarrow)"""
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=list(columns)):
+        data = batch.to_pydict()
+        yield [list(row) for row in zip(*(data[column] for column in columns))]
+
+
+def iter_file_chunks(path, columns, chunk_size=CHUNK_SIZE):
+    if str(path).endswith('.parquet'):
+        return iter_parquet_chunks(path, columns, chunk_size)
+    return iter_csv_chunks(path, columns, chunk_size)
+
+
+class BulkLoader:
+    """
+    Загрузка пачек строк в table через staging-таблицу с последующим upsert по key_columns.
+    value_columns — столбцы, изменения которых обновляют существующие строки.
+    """
+
+    def __init__(self, table, key_columns, value_columns, progress=None):
+        self.table = table
+        self.key_columns = list(key_columns)
+        self.value_columns = list(value_columns)
+        self.columns = self.key_columns + self.value_columns
+        self.staging = f'{table}_staging'
+        self.progress = progress
+        self.vendor = connection.vendor
+
+    def load(self, chunks):
+        """Загружает все пачки и возвращает словарь со статистикой"""
+        started = time.monotonic()
+        staged = 0
+
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                self.create_staging(cursor)
+                for chunk in chunks:
+                    numbered = [[staged + number] + list(row) for number, row in enumerate(chunk)]
+                    if self.vendor == 'postgresql':
+                        self.copy_chunk(cursor, numbered)
+                    else:
+                        self.insert_chunk(cursor, numbered)
+                    staged += len(chunk)
+
+                    if self.progress:
+                        elapsed = time.monotonic() - started
+                        self.progress(staged, staged / elapsed if elapsed else 0.0)
+
+                duplicates = self.drop_duplicates(cursor)
+                first_inserted = self.first_new_key(cursor)
+                updated, inserted = self.upsert(cursor)
+                if updated or inserted:
+                    bump_data_version(self.table)
+        finally:
+            # В PostgreSQL таблица удаляется вместе с транзакцией (ON COMMIT DROP), в остальных базах
+            # — уже после нее: в прерванной транзакции DROP подменил бы исходную ошибку своей
+            if self.vendor != 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(f'DROP TABLE IF EXISTS {self.staging}')
+
+        return {
+            'staged': staged,
+            'duplicates': duplicates,
+            'updated': updated,
+            'inserted': inserted,
+            # Наименьшее значение первого ключевого столбца среди добавленных строк (например, дата)
+            'first_inserted': first_inserted,
+            'seconds': time.monotonic() - started,
+        }
+
+    def create_staging(self, cursor):
+        # Столбцы и типы staging-таблицы повторяют целевую таблицу
+        cursor.execute(f'DROP TABLE IF EXISTS {self.staging}')
+        on_commit = 'ON COMMIT DROP' if self.vendor == 'postgresql' else ''
+        cursor.execute(f'''
+            CREATE TEMPORARY TABLE {self.staging} {on_commit} AS
+            SELECT CAST(0 AS BIGINT) AS {ROW_NUMBER_COLUMN}, {', '.join(self.columns)}
+            FROM {self.table} WHERE 1 = 0
+        ''')
+
+    def copy_chunk(self, cursor, chunk):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(chunk)
+        buffer.seek(0)
+
+        sql = f"COPY {self.staging} ({ROW_NUMBER_COLUMN}, {', '.join(self.columns)}) FROM STDIN WITH (FORMAT csv)"
+        raw_cursor = cursor.cursor
+        if hasattr(raw_cursor, 'copy_expert'):
+            raw_cursor.copy_expert(sql, buffer)  # psycopg2
+        else:
+            with raw_cursor.copy(sql) as copy:  # psycopg 3
+                copy.write(buffer.getvalue())
+
+    def insert_chunk(self, cursor, chunk):
+        placeholders = ', '.join(['%s'] * (len(self.columns) + 1))
+        cursor.executemany(
+            f"INSERT INTO {self.staging} ({ROW_NUMBER_COLUMN}, {', '.join(self.columns)}) VALUES ({placeholders})",
+            chunk,
+        )
+
+    def drop_duplicates(self, cursor):
+        """Оставляет по одной, последней во входных данных, строке на ключ; возвращает число удаленных"""
+        keys = ', '.join(self.key_columns)
+        cursor.execute(f'''
+            DELETE FROM {self.staging}
+            WHERE {ROW_NUMBER_COLUMN} NOT IN (
+                SELECT MAX({ROW_NUMBER_COLUMN}) FROM {self.staging} GROUP BY {keys}
+            )
+        ''')
+        return cursor.rowcount
+
+    def first_new_key(self, cursor):
+        """Наименьшее значение первого ключевого столбца у строк, которых еще нет в таблице"""
+        key_match = ' AND '.join(f'{self.table}.{column} = s.{column}' for column in self.key_columns)
+        cursor.execute(f'''
+            SELECT MIN(s.{self.key_columns[0]}) FROM {self.staging} s
+            WHERE NOT EXISTS (SELECT 1 FROM {self.table} WHERE {key_match})
+        ''')
+        return cursor.fetchone()[0]
+
+    def upsert(self, cursor):
+        """Обновляет изменившиеся строки и добавляет новые; возвращает (updated, inserted)"""
+        distinct_from = DISTINCT_FROM.get(self.vendor, 'IS DISTINCT FROM')
+        key_match = ' AND '.join(f'{self.table}.{column} = s.{column}' for column in self.key_columns)
+
+        updated = 0
+        if self.value_columns:
+            assignments = ', '.join(f'{column} = s.{column}' for column in self.value_columns)
+            changed = ' OR '.join(f'{self.table}.{column} {distinct_from} s.{column}' for column in self.value_columns)
+            cursor.execute(f'''
+                UPDATE {self.table} SET {assignments}
+                FROM {self.staging} s
+                WHERE {key_match} AND ({changed})
+            ''')
+            updated = cursor.rowcount
+
+        columns = ', '.join(self.columns)
+        source_columns = ', '.join(f's.{column}' for column in self.columns)
+        cursor.execute(f'''
+            INSERT INTO {self.table} ({columns})
+            SELECT {source_columns} FROM {self.staging} s
+            WHERE NOT EXISTS (SELECT 1 FROM {self.table} WHERE {key_match})
+        ''')
+        inserted = cursor.rowcount
+
+        return updated, inserted
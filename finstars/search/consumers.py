@@ -0,0 +1,148 @@
+"""
+Websocket потоковой выдачи периодов (ws/search/).
+
+Клиент отправляет {"type": "search", "id": ..., "conditions": [{"planet", "zodiac_sign", "retrograde"}, ...]},
+сервер отвечает порциями {"type": "periods", "id": ..., "periods": [[start, end], ...]} по мере получения
+и итогом {"type": "summary", "id": ..., "count": ..., "days": ..., "seconds": ..., "cached": ...}.
+Новый поиск или {"type": "cancel"} отменяет текущий: после отмены порции со старым id не отправляются.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.db import connections
+
+from .periods import format_period_bound, period_days
+from .queries import normalize_conditions
+from .streaming import cache_periods, conditions_from_normalized, get_cached_periods, iter_period_chunks
+
+logger = logging.getLogger(__name__)
+
+# Признак конца потока порций из рабочего потока
+_DONE = object()
+
+
+def _days(periods):
+    return round(sum(period_days(start, end) for start, end in periods), 1)
+
+
+def _period_json(periods):
+    return [[format_period_bound(start), format_period_bound(end)] for start, end in periods]
+
+
+class PeriodSearchConsumer(AsyncJsonWebsocketConsumer):
+
+    async def connect(self):
+        self.search_task = None
+        self.cancel_event = None
+        await self.accept()
+
+    async def disconnect(self, code):
+        await self.cancel_search()
+
+    async def receive_json(self, content, **kwargs):
+        message_type = content.get('type')
+        if message_type == 'cancel':
+            await self.cancel_search()
+        elif message_type == 'search':
+            await self.cancel_search()
+            self.cancel_event = threading.Event()
+            self.search_task = asyncio.create_task(
+                self.run_search(content.get('id'), content.get('conditions') or [], self.cancel_event))
+        else:
+            await self.send_json({'type': 'error', 'id': content.get('id'),
+                                  'error': f'Unknown message type {message_type!r}'})
+
+    async def cancel_search(self):
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+        if self.search_task is not None and not self.search_task.done():
+            self.search_task.cancel()
+            try:
+                await self.search_task
+            except asyncio.CancelledError:
+                pass
+        self.search_task = None
+
+    async def run_search(self, query_id, conditions, cancel_event):
+        """Задача поиска: исключение не теряется в задаче, а уходит клиенту сообщением error"""
+        try:
+            await self.search(query_id, conditions, cancel_event)
+        except Exception as e:
+            logger.exception("Period search %r failed", query_id)
+            await self.send_json({'type': 'error', 'id': query_id, 'error': str(e) or type(e).__name__})
+
+    async def search(self, query_id, conditions, cancel_event):
+        started = time.monotonic()
+        try:
+            conditions = [
+                {'planet': str(condition['planet']), 'zodiac_sign': str(condition['zodiac_sign']),
+                 'retrograde': 'R' if condition.get('retrograde') in ('R', True) else ''}
+                for condition in conditions if condition.get('zodiac_sign')
+            ]
+        except (KeyError, TypeError, AttributeError):
+            await self.send_json({'type': 'error', 'id': query_id, 'error': 'Invalid conditions'})
+            return
+
+        normalized = normalize_conditions(conditions) if conditions else None
+        if not normalized:
+            await self.send_summary(query_id, [], started, cached=False)
+            return
+
+        # Версия данных для ключа кэша читается из базы — соединения потока закрывает database_sync_to_async
+        periods = await database_sync_to_async(get_cached_periods)(normalized)
+        if periods is not None:
+            if periods:
+                await self.send_json({'type': 'periods', 'id': query_id, 'periods': _period_json(periods)})
+            await self.send_summary(query_id, periods, started, cached=True)
+            return
+
+        periods = []
+        queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        producer = threading.Thread(
+            target=self.produce_chunks,
+            args=(conditions_from_normalized(normalized), queue, loop, cancel_event),
+            daemon=True,
+        )
+        producer.start()
+
+        while True:
+            chunk = await queue.get()
+            if chunk is _DONE:
+                break
+            if isinstance(chunk, Exception):
+                await self.send_json({'type': 'error', 'id': query_id, 'error': str(chunk)})
+                return
+            periods.extend(chunk)
+            await self.send_json({'type': 'periods', 'id': query_id, 'periods': _period_json(chunk)})
+
+        await database_sync_to_async(cache_periods)(normalized, periods)
+        await self.send_summary(query_id, periods, started, cached=False)
+
+    @staticmethod
+    def produce_chunks(conditions, queue, loop, cancel_event):
+        """Рабочий поток: порции поиска передаются в цикл событий, пока поиск не отменен"""
+        try:
+            for chunk in iter_period_chunks(conditions):
+                if cancel_event.is_set():
+                    return
+                loop.call_soon_threadsafe(queue.put_nowait, chunk)
+            loop.call_soon_threadsafe(queue.put_nowait, _DONE)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            connections.close_all()
+
+    async def send_summary(self, query_id, periods, started, cached):
+        await self.send_json({
+            'type': 'summary',
+            'id': query_id,
+            'count': len(periods),
+            'days': _days(periods),
+            'seconds': round(time.monotonic() - started, 3),
+            'cached': cached,
+        })
@@ -0,0 +1,258 @@
+import os
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+
+from .ephemeris_file import read_ephemeris_file, write_ephemeris_file
+from .periods import Run, is_retrograde
+from .queries import normalize_conditions
+
+NO_SIGN = 0  # Код знака для дней, по которым нет данных
+
+# Дней в одном блоке прохода индекса при потоковой выдаче периодов (около десяти лет)
+WALK_BLOCK_DAYS = 3653
+
+# Число строк и диапазон дат не меняются, когда загрузчик исправляет уже загруженные даты, —
+# поэтому в сигнатуре и версия таблицы из data_versions (finstars.data_cache.bump_data_version)
+SIGNATURE_QUERY = '''
+    SELECT COUNT(*), MIN(date), MAX(date),
+           (SELECT COALESCE(MAX(version), 0) FROM data_versions WHERE name = 'planetary_positions')
+    FROM planetary_positions;
+'''
+
+POSITIONS_QUERY = '''
+    SELECT date, planet, zodiac_sign, degrees_in_sign, retrograde
+    FROM planetary_positions
+    ORDER BY planet, date;
+'''
+
+
+class EphemerisIndex:
+    """
+    Вся таблица planetary_positions в памяти процесса: по планете — компактные массивы,
+    индексированные смещением в днях от origin (код знака uint8, флаг ретроградности bool,
+    градус в знаке float32). Поиск по любому набору условий — векторное AND масок
+    и поиск границ периодов через np.diff.
+    """
+
+    def __init__(self, origin, signs, retrograde, degrees, signature=None):
+        self.origin = np.datetime64(origin, 'D')
+        self.signs = signs
+        self.retrograde = retrograde
+        self.degrees = degrees
+        self.length = len(next(iter(signs.values()))) if signs else 0
+        self.signature = signature
+
+    @classmethod
+    def from_rows(cls, rows, signature=None):
+        """Строит индекс из строк (date, planet, zodiac_sign, degrees_in_sign, retrograde)"""
+        rows = list(rows)
+        if not rows:
+            return cls(np.datetime64('1970-01-01'), {}, {}, {}, signature)
+
+        dates, planets, signs, degrees, retrograde = zip(*rows)
+        dates = np.array(dates, dtype='datetime64[D]')
+        planets = np.array(planets)
+        origin = dates.min()
+        offsets = (dates - origin).astype(np.int64)
+        length = int(offsets.max()) + 1
+
+        sign_codes = np.array([int(sign) for sign in signs], dtype=np.uint8)
+        degree_values = np.array([np.nan if value is None else float(value) for value in degrees], dtype=np.float32)
+        retrograde_flags = np.array([is_retrograde(value) for value in retrograde], dtype=bool)
+
+        index_signs, index_retrograde, index_degrees = {}, {}, {}
+        for planet in np.unique(planets):
+            selected = planets == planet
+            planet_offsets = offsets[selected]
+
+            index_signs[str(planet)] = np.full(length, NO_SIGN, dtype=np.uint8)
+            index_signs[str(planet)][planet_offsets] = sign_codes[selected]
+            index_retrograde[str(planet)] = np.zeros(length, dtype=bool)
+            index_retrograde[str(planet)][planet_offsets] = retrograde_flags[selected]
+            index_degrees[str(planet)] = np.full(length, np.nan, dtype=np.float32)
+            index_degrees[str(planet)][planet_offsets] = degree_values[selected]
+
+        return cls(origin, index_signs, index_retrograde, index_degrees, signature)
+
+    @classmethod
+    def load(cls):
+        with connection.cursor() as cursor:
+            cursor.execute(SIGNATURE_QUERY)
+            signature = tuple(cursor.fetchone())
+            cursor.execute(POSITIONS_QUERY)
+            return cls.from_rows(cursor.fetchall(), signature)
+
+    @classmethod
+    def from_file(cls, path):
+        """Индекс поверх отображенного в память файла эфемерид (см. search.ephemeris_file)"""
+        origin, signs, retrograde, degrees = read_ephemeris_file(path)
+        return cls(origin, signs, retrograde, degrees, get_file_signature(path))
+
+    def save(self, path):
+        return write_ephemeris_file(path, self.origin, self.signs, self.retrograde, self.degrees)
+
+    def mask(self, conditions, start=0, end=None):
+        """
+        Булева маска дней [start, end) (по умолчанию всех), в которые выполнены все условия,
+        или None для несовместимых условий
+        """
+        normalized = normalize_conditions(conditions)
+        if not normalized:
+            return None
+
+        end = self.length if end is None else end
+        result = np.ones(end - start, dtype=bool)
+        for planet, (zodiac_sign, retrograde) in normalized.items():
+            if planet not in self.signs:
+                return None
+            result &= self.signs[planet][start:end] == int(zodiac_sign)
+            result &= self.retrograde[planet][start:end] == retrograde
+        return result
+
+    def mask_to_periods(self, mask):
+        """Непрерывные отрезки True в маске как [(start_date, end_date), ...] с границами включительно"""
+        edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1) - 1
+
+        start_dates = (self.origin + starts).astype(object)
+        end_dates = (self.origin + ends).astype(object)
+        return list(zip(start_dates, end_dates))
+
+    def offset(self, date):
+        return int((np.datetime64(date, 'D') - self.origin).astype(np.int64))
+
+    def runs(self, planets, start_date, end_date):
+        """Непрерывные периоды Run по планетам внутри диапазона дат (границы обрезаются по диапазону)"""
+        start, end = max(self.offset(start_date), 0), min(self.offset(end_date), self.length - 1)
+        runs = []
+        if start > end:
+            return runs
+
+        for planet in planets:
+            if planet not in self.signs:
+                continue
+            signs = self.signs[planet][start:end + 1]
+            retrograde = self.retrograde[planet][start:end + 1]
+            degrees = self.degrees[planet][start:end + 1]
+
+            changes = np.flatnonzero((signs[1:] != signs[:-1]) | (retrograde[1:] != retrograde[:-1])) + 1
+            run_starts = np.concatenate(([0], changes))
+            run_ends = np.concatenate((changes, [len(signs)])) - 1
+
+            for run_start, run_end in zip(run_starts, run_ends):
+                if signs[run_start] == NO_SIGN:
+                    continue
+                runs.append(Run(
+                    planet, str(signs[run_start]), bool(retrograde[run_start]),
+                    (self.origin + start + run_start).astype(object),
+                    (self.origin + start + run_end).astype(object),
+                    float(degrees[run_start]), float(degrees[run_end]),
+                ))
+        return runs
+
+    def daily_degrees(self, planets, start_date, end_date):
+        """Градусы {planet: float64 массив по дням диапазона}; дни вне индекса — NaN"""
+        days = (end_date - start_date).days + 1
+        start = self.offset(start_date)
+        first, last = max(start, 0), min(start + days, self.length)
+
+        values = {}
+        for planet in planets:
+            if planet not in self.degrees:
+                continue
+            values[planet] = np.full(days, np.nan)
+            if first < last:
+                values[planet][first - start:last - start] = self.degrees[planet][first:last]
+        return values
+
+    def find_periods(self, conditions):
+        """Периоды [(start_date, end_date), ...], где одновременно выполнены все условия"""
+        mask = self.mask(conditions)
+        if mask is None:
+            return []
+        return self.mask_to_periods(mask)
+
+    def iter_periods(self, conditions, block_days=WALK_BLOCK_DAYS):
+        """
+        find_periods для потоковой выдачи: маска строится по блокам из block_days дней, и периоды
+        отдаются по мере прохода. Период на стыке блоков отдается целиком, когда найден его конец.
+        """
+        open_start = None
+        for block_start in range(0, self.length, block_days):
+            block_end = min(block_start + block_days, self.length)
+            mask = self.mask(conditions, block_start, block_end)
+            if mask is None:
+                return
+
+            # Первый день блока сравнивается с последним днем предыдущего
+            edges = np.diff(np.concatenate(([0 if open_start is None else 1], mask.view(np.int8))))
+            starts = (np.flatnonzero(edges == 1) + block_start).tolist()
+            ends = (np.flatnonzero(edges == -1) + block_start - 1).tolist()
+            if open_start is not None:
+                starts.insert(0, open_start)
+
+            for start, end in zip(starts, ends):
+                yield self.date(start), self.date(end)
+            open_start = starts[-1] if len(starts) > len(ends) else None
+
+        if open_start is not None:
+            yield self.date(open_start), self.date(self.length - 1)
+
+    def date(self, offset):
+        return (self.origin + offset).astype(object)
+
+
+_index = None
+_index_checked_at = 0.0
+_index_lock = threading.Lock()
+
+
+def get_table_signature():
+    with connection.cursor() as cursor:
+        cursor.execute(SIGNATURE_QUERY)
+        return tuple(cursor.fetchone())
+
+
+def get_file_signature(path):
+    stat = os.stat(path)
+    return 'file', stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def get_ephemeris_index():
+    """
+    Индекс уровня процесса. Если задан EPHEMERIS_FILE и файл существует, индекс отображает его
+    в память (manage.py export_ephemeris), иначе загружается из planetary_positions.
+    Раз в EPHEMERIS_INDEX_CHECK_INTERVAL секунд сверяется сигнатура источника (для таблицы —
+    число строк, диапазон дат и версия данных, для файла — inode, mtime и размер), и индекс перестраивается,
+    если данные изменились.
+    """
+    global _index, _index_checked_at
+
+    check_interval = getattr(settings, 'EPHEMERIS_INDEX_CHECK_INTERVAL', 60)
+    if _index is not None and time.monotonic() - _index_checked_at < check_interval:
+        return _index
+
+    with _index_lock:
+        if _index is not None and time.monotonic() - _index_checked_at < check_interval:
+            return _index
+
+        path = getattr(settings, 'EPHEMERIS_FILE', None)
+        if path and os.path.exists(path):
+            if _index is None or _index.signature != get_file_signature(path):
+                _index = EphemerisIndex.from_file(path)
+        elif _index is None or _index.signature != get_table_signature():
+            _index = EphemerisIndex.load()
+        _index_checked_at = time.monotonic()
+        return _index
+
+
+def reset_ephemeris_index():
+    """Сбрасывает индекс процесса (например, после загрузки новых данных)"""
+    global _index
+    with _index_lock:
+        _index = None
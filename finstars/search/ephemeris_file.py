@@ -0,0 +1,108 @@
+"""
+Бинарный колоночный формат эфемерид для общего доступа из нескольких воркеров.
+
+Структура файла (little-endian):
+    заголовок HEADER_STRUCT: magic, версия, число планет, число дней, origin (дни от 1970-01-01)
+    коды планет: по PLANET_CODE_SIZE байт ASCII на планету
+    колонки, каждая выровнена по COLUMN_ALIGNMENT байт:
+        signs       uint8   [планеты × дни]
+        retrograde  uint8   [планеты × дни]
+        degrees     float32 [планеты × дни]
+
+Читатель отображает файл через mmap и строит массивы np.frombuffer без копирования,
+так что все воркеры делят одну копию страниц в page cache.
+"""
+import mmap
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b'FSEPHEM\0'
+VERSION = 1
+HEADER_STRUCT = struct.Struct('<8sHHIi')
+PLANET_CODE_SIZE = 4
+COLUMN_ALIGNMENT = 64
+
+
+class EphemerisFileError(ValueError):
+    pass
+
+
+def _align(offset):
+    return (offset + COLUMN_ALIGNMENT - 1) // COLUMN_ALIGNMENT * COLUMN_ALIGNMENT
+
+
+def _layout(planets_count, length):
+    """Смещения колонок signs, retrograde, degrees и общий размер файла"""
+    signs_offset = _align(HEADER_STRUCT.size + planets_count * PLANET_CODE_SIZE)
+    retrograde_offset = _align(signs_offset + planets_count * length)
+    degrees_offset = _align(retrograde_offset + planets_count * length)
+    size = degrees_offset + planets_count * length * 4
+    return signs_offset, retrograde_offset, degrees_offset, size
+
+
+def write_ephemeris_file(path, origin, signs, retrograde, degrees):
+    """
+    Записывает массивы индекса в файл. Запись идет во временный файл с последующим os.replace,
+    поэтому уже открытые отображения старого файла в других процессах остаются корректными.
+    """
+    planets = sorted(signs)
+    length = len(signs[planets[0]]) if planets else 0
+    origin_days = int(np.datetime64(origin, 'D').astype(np.int64))
+    signs_offset, retrograde_offset, degrees_offset, size = _layout(len(planets), length)
+
+    buffer = bytearray(size)
+    HEADER_STRUCT.pack_into(buffer, 0, MAGIC, VERSION, len(planets), length, origin_days)
+    for i, planet in enumerate(planets):
+        code = planet.encode('ascii')
+        if len(code) > PLANET_CODE_SIZE:
+            raise EphemerisFileError(f"Planet code is too long: {planet}")
+        offset = HEADER_STRUCT.size + i * PLANET_CODE_SIZE
+        buffer[offset:offset + PLANET_CODE_SIZE] = code.ljust(PLANET_CODE_SIZE, b'\0')
+
+    for i, planet in enumerate(planets):
+        np.frombuffer(buffer, np.uint8, length, signs_offset + i * length)[:] = signs[planet]
+        np.frombuffer(buffer, np.uint8, length, retrograde_offset + i * length)[:] = retrograde[planet]
+        np.frombuffer(buffer, '<f4', length, degrees_offset + i * length * 4)[:] = degrees[planet]
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as file:
+        file.write(buffer)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    return size
+
+
+def read_ephemeris_file(path):
+    """
+    Отображает файл в память и возвращает (origin, signs, retrograde, degrees),
+    где словари по планетам содержат массивы-представления поверх mmap (только чтение).
+    """
+    with open(path, 'rb') as file:
+        # Пустой файл нельзя отобразить в память (mmap бросает ValueError)
+        if os.fstat(file.fileno()).st_size < HEADER_STRUCT.size:
+            raise EphemerisFileError(f"{path}: file is too short")
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, planets_count, length, origin_days = HEADER_STRUCT.unpack_from(mapped, 0)
+    if magic != MAGIC:
+        raise EphemerisFileError(f"{path}: not an ephemeris file")
+    if version != VERSION:
+        raise EphemerisFileError(f"{path}: unsupported version {version}")
+
+    signs_offset, retrograde_offset, degrees_offset, size = _layout(planets_count, length)
+    if len(mapped) < size:
+        raise EphemerisFileError(f"{path}: file is truncated")
+
+    signs, retrograde, degrees = {}, {}, {}
+    for i in range(planets_count):
+        offset = HEADER_STRUCT.size + i * PLANET_CODE_SIZE
+        planet = mapped[offset:offset + PLANET_CODE_SIZE].rstrip(b'\0').decode('ascii')
+        signs[planet] = np.frombuffer(mapped, np.uint8, length, signs_offset + i * length)
+        retrograde[planet] = np.frombuffer(mapped, np.bool_, length, retrograde_offset + i * length)
+        degrees[planet] = np.frombuffer(mapped, '<f4', length, degrees_offset + i * length * 4)
+
+    origin = np.datetime64(origin_days, 'D')
+    return origin, signs, retrograde, degrees
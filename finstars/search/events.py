@@ -0,0 +1,354 @@
+"""
+Индекс событий: точные моменты входа планет в знаки и станций.
+
+Дневная строка planetary_positions — положение на 00:00 UTC. Между соседними днями
+абсолютная долгота (номер знака · 30 + градус в знаке) приближается параболой по трем
+соседним дням: момент входа — пересечение границы знака, момент станции — вершина
+параболы (скорость равна нулю). Входы находятся с точностью до минут, станции — до часа
+(у медленных планет точность станций ограничена округлением градусов в данных).
+
+Состояние планеты (знак, ретроградность) постоянно между соседними событиями, поэтому
+поиск периодов и нарезка графика идут по событиям — их тысячи на планету за век
+(у Луны — около тысячи трехсот в год), а не по дневным строкам.
+
+Таблица planetary_events читается, только пока она покрывает весь диапазон дат
+planetary_positions; после дозагрузки эфемерид без пересборки таблицы события
+вычисляются по EphemerisIndex.
+"""
+import datetime
+import logging
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max, Min
+
+from .ephemeris import NO_SIGN, get_ephemeris_index
+from .models import DataVersion, PlanetaryEvent, PlanetaryPosition
+from .periods import Run, intersect_periods, iter_intersect_periods
+from .queries import normalize_conditions
+
+# Состояние (zodiac_sign, retrograde) — после события; moment — naive datetime в UTC
+Event = namedtuple('Event', 'planet kind moment zodiac_sign retrograde degrees')
+
+logger = logging.getLogger(__name__)
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def _parabola(longitudes, center):
+    """Коэффициенты (a, b) параболы L(center + u) = L[center] + b·u + a·u² по трем соседним дням"""
+    before, middle, after = longitudes[center - 1], longitudes[center], longitudes[center + 1]
+    return (after - 2 * middle + before) / 2, (after - before) / 2
+
+
+def _centers(k, last):
+    """Дни, парабола вокруг которых покрывает интервал [k, k + 1] внутри ряда [0, last]"""
+    return [center for center in (k, k + 1) if 1 <= center <= last - 1]
+
+
+def crossing_time(longitudes, k, boundary):
+    """Момент (в днях от начала ряда) между днями k и k + 1, когда долгота проходит boundary"""
+    for center in _centers(k, len(longitudes) - 1):
+        a, b = _parabola(longitudes, center)
+        c = longitudes[center] - boundary
+        if a == 0:
+            roots = [-c / b] if b else []
+        else:
+            discriminant = b * b - 4 * a * c
+            if discriminant < 0:
+                continue
+            root = np.sqrt(discriminant)
+            roots = [(-b - root) / (2 * a), (-b + root) / (2 * a)]
+        inside = [center + u for u in roots if k <= center + u <= k + 1]
+        if inside:
+            return min(inside, key=lambda t: abs(t - k - 0.5))
+
+    # Рядом нет третьего дня или парабола не пересекает границу — линейная интерполяция
+    step = longitudes[k + 1] - longitudes[k]
+    fraction = (boundary - longitudes[k]) / step if step else 0.5
+    return k + min(max(fraction, 0.0), 1.0)
+
+
+def station_time(longitudes, k):
+    """(момент, долгота) станции между днями k и k + 1: вершина параболы, где скорость равна нулю"""
+    candidates = []
+    for center in _centers(k, len(longitudes) - 1):
+        a, b = _parabola(longitudes, center)
+        if a == 0:
+            continue
+        u = -b / (2 * a)
+        if k <= center + u <= k + 1:
+            candidates.append((center + u, longitudes[center] + b * u + a * u * u))
+
+    if candidates:
+        return min(candidates, key=lambda candidate: abs(candidate[0] - k - 0.5))
+    return k + 0.5, (longitudes[k] + longitudes[k + 1]) / 2
+
+
+def _segment_events(planet, origin, signs, retrograde, longitudes):
+    """События одного непрерывного ряда дней; origin — datetime64[m] первого дня ряда"""
+    # Переходы через 360° убираются, чтобы разности долгот были скоростями
+    longitudes = np.unwrap(longitudes, period=360)
+    last = len(longitudes) - 1
+
+    def moment(days):
+        # Событие между днями k и k + 1 не раньше первой минуты после k: день k остается в старом состоянии
+        minutes = int(round(days * MINUTES_PER_DAY))
+        minutes = min(max(minutes, int(np.floor(days)) * MINUTES_PER_DAY + 1), int(np.ceil(days)) * MINUTES_PER_DAY)
+        return (origin + np.timedelta64(minutes, 'm')).astype(object)
+
+    changes = []
+    for k in np.flatnonzero(signs[1:] != signs[:-1]).tolist():
+        boundary = 30 * np.floor(max(longitudes[k], longitudes[k + 1]) / 30)
+        forward = longitudes[k + 1] >= longitudes[k]
+        # Градус в новом знаке: при прямом движении планета входит в его начало, при попятном — в конец
+        changes.append((crossing_time(longitudes, k, boundary), PlanetaryEvent.INGRESS,
+                        int(signs[k + 1]), None, 0.0 if forward else 30.0))
+    for k in np.flatnonzero(retrograde[1:] != retrograde[:-1]).tolist():
+        t, longitude = station_time(longitudes, k)
+        changes.append((t, PlanetaryEvent.STATION, None, bool(retrograde[k + 1]), float(longitude % 30)))
+    changes.sort(key=lambda change: change[0])
+
+    sign, is_retrograde = int(signs[0]), bool(retrograde[0])
+    events = [Event(planet, PlanetaryEvent.START, moment(0), str(sign), is_retrograde,
+                    float(longitudes[0] % 30))]
+    for t, kind, new_sign, new_retrograde, degrees in changes:
+        if new_sign is not None:
+            sign = new_sign
+        if new_retrograde is not None:
+            is_retrograde = new_retrograde
+        events.append(Event(planet, kind, moment(t), str(sign), is_retrograde, degrees))
+    # Последний день ряда входит в период целиком; градус в конце — продолжение суточного движения
+    step = longitudes[last] - longitudes[last - 1] if last else 0.0
+    end_degrees = min(max(float(longitudes[last] % 30 + step), 0.0), 30.0)
+    events.append(Event(planet, PlanetaryEvent.END, moment(last + 1), str(sign), is_retrograde, end_degrees))
+    return events
+
+
+def find_planet_events(planet, origin, signs, retrograde, degrees):
+    """
+    События планеты по дневным массивам EphemerisIndex (origin — дата первого элемента).
+    Пропуски в данных разбивают ряд: у каждого непрерывного ряда свои события start и end.
+    """
+    valid = (signs != NO_SIGN) & ~np.isnan(degrees)
+    longitudes = (signs.astype(np.float64) - 1) * 30 + degrees.astype(np.float64)
+    origin = np.datetime64(origin, 'D').astype('datetime64[m]')
+
+    edges = np.diff(np.concatenate(([0], valid.view(np.int8), [0])))
+    events = []
+    for first, end in zip(np.flatnonzero(edges == 1).tolist(), np.flatnonzero(edges == -1).tolist()):
+        events.extend(_segment_events(
+            planet, origin + np.timedelta64(first * MINUTES_PER_DAY, 'm'),
+            signs[first:end], retrograde[first:end], longitudes[first:end],
+        ))
+    return events
+
+
+def events_from_ephemeris(index, planets=None):
+    """События всех (или перечисленных) планет EphemerisIndex"""
+    events = []
+    for planet in planets or sorted(index.signs):
+        if planet in index.signs:
+            events.extend(find_planet_events(
+                planet, index.origin, index.signs[planet], index.retrograde[planet], index.degrees[planet]))
+    return events
+
+
+class EventIndex:
+    """
+    События в памяти процесса: по планете — массивы моментов (datetime64[m]) и состояний
+    после события. Период состояния — полуинтервал [момент события, момент следующего).
+    """
+
+    def __init__(self, events, signature=None):
+        self.signature = signature
+        self.moments, self.kinds, self.signs, self.retrograde, self.degrees = {}, {}, {}, {}, {}
+
+        by_planet = {}
+        for event in events:
+            by_planet.setdefault(event.planet, []).append(event)
+        for planet, planet_events in by_planet.items():
+            planet_events.sort(key=lambda event: event.moment)
+            self.moments[planet] = np.array([event.moment for event in planet_events], dtype='datetime64[m]')
+            self.kinds[planet] = np.array([event.kind for event in planet_events])
+            self.signs[planet] = np.array([int(event.zodiac_sign) for event in planet_events], dtype=np.uint8)
+            self.retrograde[planet] = np.array([event.retrograde for event in planet_events], dtype=bool)
+            self.degrees[planet] = np.array([np.nan if event.degrees is None else event.degrees
+                                             for event in planet_events], dtype=np.float64)
+
+    @classmethod
+    def load(cls, signature=None):
+        rows = PlanetaryEvent.objects.order_by('planet', 'moment').values_list(*Event._fields)
+        return cls([
+            Event(planet, kind, moment.astimezone(datetime.timezone.utc).replace(tzinfo=None),
+                  sign, retrograde, degrees)
+            for planet, kind, moment, sign, retrograde, degrees in rows
+        ], signature)
+
+    @classmethod
+    def from_ephemeris(cls, index, signature=None):
+        return cls(events_from_ephemeris(index), signature)
+
+    def state_periods(self, planet, zodiac_sign, retrograde):
+        """Полуинтервалы [start, end), в которые планета в знаке zodiac_sign с заданной ретроградностью"""
+        if planet not in self.moments:
+            return []
+        matched = ((self.signs[planet] == int(zodiac_sign)) & (self.retrograde[planet] == retrograde)
+                   & (self.kinds[planet] != PlanetaryEvent.END))
+        # После каждого события, кроме end, есть следующее — конец периода
+        starts = np.flatnonzero(matched[:-1])
+        moments = self.moments[planet]
+        return list(zip(moments[starts].astype(object), moments[starts + 1].astype(object)))
+
+    def find_periods(self, conditions):
+        """Периоды [(start, end), ...] (datetime, полуинтервалы), где одновременно выполнены все условия"""
+        return intersect_periods(self.condition_periods(conditions), closed=False)
+
+    def iter_periods(self, conditions):
+        """find_periods для потоковой выдачи: периоды отдаются по мере прохода заметающей прямой"""
+        return iter_intersect_periods(self.condition_periods(conditions), closed=False)
+
+    def condition_periods(self, conditions):
+        """Периоды состояний по каждому условию; пустой список, если какое-то условие не выполняется никогда"""
+        normalized = normalize_conditions(conditions)
+        if not normalized:
+            return []
+
+        periods_list = []
+        for planet, (zodiac_sign, retrograde) in normalized.items():
+            periods = self.state_periods(planet, zodiac_sign, retrograde)
+            if not periods:
+                return []
+            periods_list.append(periods)
+        return periods_list
+
+    def runs(self, planets, start_date, end_date, degrees=None):
+        """
+        Дневные периоды Run внутри диапазона (как строки planetary_periods, границы обрезаются
+        по диапазону): день входит в период события, если его 00:00 лежит между этим событием
+        и следующим. degrees — градусы {planet: массив по дням от start_date} из planetary_positions
+        (EphemerisIndex.daily_degrees, graph.data.load_daily_degrees): градус на границе берется
+        из них. Интерполяция между градусами событий — только для дней, которых в degrees нет.
+        """
+        start = np.datetime64(start_date, 'D')
+        end = np.datetime64(end_date, 'D')
+        one_day = np.timedelta64(1, 'D')
+        degrees = degrees or {}
+        runs = []
+
+        for planet in planets:
+            if planet not in self.moments:
+                continue
+            moments, kinds = self.moments[planet], self.kinds[planet]
+            daily = degrees.get(planet)
+            # Первый день, чье 00:00 не раньше момента события
+            days = (moments + np.timedelta64(MINUTES_PER_DAY - 1, 'm')).astype('datetime64[D]')
+
+            for i in range(len(moments) - 1):
+                if kinds[i] == PlanetaryEvent.END:
+                    continue
+                first_day, last_day = max(days[i], start), min(days[i + 1] - one_day, end)
+                if first_day > last_day:
+                    continue
+
+                def degrees_at(day, i=i):
+                    offset = int((day - start).astype(np.int64))
+                    if daily is not None and 0 <= offset < len(daily) and not np.isnan(daily[offset]):
+                        return float(daily[offset])
+                    return self.interpolate_degrees(planet, i, day)
+
+                runs.append(Run(
+                    planet, str(self.signs[planet][i]), bool(self.retrograde[planet][i]),
+                    first_day.astype(object), last_day.astype(object),
+                    degrees_at(first_day), degrees_at(last_day),
+                ))
+        return runs
+
+    def interpolate_degrees(self, planet, i, day):
+        """Градус в 00:00 дня day между событием i и следующим по линейной интерполяции; None без данных"""
+        moments, kinds = self.moments[planet], self.kinds[planet]
+        # Градус следующего события — в системе старого знака: вход в следующий знак — 30°, в предыдущий — 0°
+        next_degrees = self.degrees[planet][i + 1]
+        if kinds[i + 1] == PlanetaryEvent.INGRESS:
+            next_degrees = 30.0 - next_degrees
+        event_degrees = self.degrees[planet][i]
+        duration = (moments[i + 1] - moments[i]).astype(np.float64)
+
+        fraction = (day.astype('datetime64[m]') - moments[i]).astype(np.float64) / duration
+        value = event_degrees + (next_degrees - event_degrees) * fraction
+        return None if np.isnan(value) else float(value)
+
+
+_index = None
+_index_checked_at = 0.0
+_index_lock = threading.Lock()
+
+
+def get_events_signature():
+    """
+    (число событий, первый и последний момент, первая и последняя дата planetary_positions,
+    версия planetary_events) — версию увеличивает build_planetary_events, даже если число
+    событий и их диапазон не изменились
+    """
+    events = PlanetaryEvent.objects.aggregate(count=Count('id'), first=Min('moment'), last=Max('moment'))
+    positions = PlanetaryPosition.objects.aggregate(first=Min('date'), last=Max('date'))
+    version = DataVersion.objects.filter(name='planetary_events').values_list('version', flat=True).first()
+    return (events['count'], events['first'], events['last'], positions['first'], positions['last'],
+            version or 0)
+
+
+def events_cover_positions(signature):
+    """
+    Построена ли таблица по текущему диапазону дат: событие start стоит в 00:00 первого дня,
+    а end — в 00:00 дня после последнего
+    """
+    count, first_moment, last_moment, first_date, last_date = signature[:5]
+    if not count:
+        return False
+    if first_date is None:
+        return True
+    utc = datetime.timezone.utc
+    return (first_moment.astimezone(utc).date() <= first_date
+            and last_moment.astimezone(utc).date() > last_date)
+
+
+def get_event_index():
+    """
+    Индекс событий уровня процесса: из таблицы planetary_events (manage.py build_planetary_events),
+    а если она пуста или не покрывает новые даты planetary_positions — вычисленный по EphemerisIndex.
+    Сигнатура источника сверяется не чаще, чем раз в EPHEMERIS_INDEX_CHECK_INTERVAL секунд.
+    """
+    global _index, _index_checked_at
+
+    check_interval = getattr(settings, 'EPHEMERIS_INDEX_CHECK_INTERVAL', 60)
+    if _index is not None and time.monotonic() - _index_checked_at < check_interval:
+        return _index
+
+    with _index_lock:
+        if _index is not None and time.monotonic() - _index_checked_at < check_interval:
+            return _index
+
+        signature = get_events_signature()
+        if events_cover_positions(signature):
+            if _index is None or _index.signature != signature:
+                _index = EventIndex.load(signature)
+        else:
+            if signature[0]:
+                logger.warning("planetary_events does not cover planetary_positions %s..%s; "
+                               "run build_planetary_events", signature[3], signature[4])
+            ephemeris = get_ephemeris_index()
+            signature = ('ephemeris', ephemeris.signature)
+            if _index is None or _index.signature != signature:
+                _index = EventIndex.from_ephemeris(ephemeris, signature)
+        _index_checked_at = time.monotonic()
+        return _index
+
+
+def reset_event_index():
+    """Сбрасывает индекс процесса (например, после пересборки planetary_events)"""
+    global _index
+    with _index_lock:
+        _index = None
@@ -0,0 +1,37 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from finstars.data_cache import bump_data_version
+
+from search.ephemeris import EphemerisIndex
+from search.events import find_planet_events, reset_event_index
+from search.models import PlanetaryEvent
+
+CHUNK_SIZE = 10000
+
+
+class Command(BaseCommand):
+    help = ("Строит таблицу planetary_events (моменты входов в знаки и станций) "
+            "по дневным строкам planetary_positions. Таблица пересобирается целиком: пока в ней есть "
+            "хотя бы одна строка, график и SEARCH_BACKEND='events' читают события всех планет только из нее.")
+
+    def handle(self, *args, **options):
+        index = EphemerisIndex.load()
+
+        with transaction.atomic():
+            PlanetaryEvent.objects.all().delete()
+            for planet in sorted(index.signs):
+                events = find_planet_events(
+                    planet, index.origin, index.signs[planet], index.retrograde[planet], index.degrees[planet])
+                PlanetaryEvent.objects.bulk_create(
+                    [PlanetaryEvent(**event._replace(moment=event.moment.replace(tzinfo=datetime.timezone.utc))._asdict())
+                     for event in events],
+                    batch_size=CHUNK_SIZE,
+                )
+                self.stdout.write(f"{planet}: {len(events)} events")
+            bump_data_version('planetary_events')
+
+        reset_event_index()
+        self.stdout.write(self.style.SUCCESS('planetary_events is up to date'))
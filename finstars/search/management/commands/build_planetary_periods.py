@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+
+from finstars.data_cache import bump_data_version
+
+from search.models import PlanetaryPeriod
+from search.periods import build_runs
+
+CHUNK_SIZE = 10000
+
+
+class Command(BaseCommand):
+    help = ("Строит таблицу planetary_periods (непрерывные периоды планет в знаках) "
+            "из дневных строк planetary_positions. По умолчанию достраивает только новые даты.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Полностью пересобрать таблицу')
+        parser.add_argument('--planet', action='append', dest='planets', help='Ограничить планетами (можно несколько)')
+
+    def handle(self, *args, **options):
+        planets = options['planets'] or self.get_planets()
+
+        for planet in planets:
+            with transaction.atomic():
+                created = self.rebuild_planet(planet, full=options['full'])
+            self.stdout.write(f"{planet}: {created} periods")
+        bump_data_version('planetary_periods')
+
+        self.stdout.write(self.style.SUCCESS('planetary_periods is up to date'))
+
+    def get_planets(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT DISTINCT planet FROM planetary_positions ORDER BY planet;')
+            return [row[0] for row in cursor.fetchall()]
+
+    def rebuild_planet(self, planet, full=False):
+        periods = PlanetaryPeriod.objects.filter(planet=planet)
+        since = None
+
+        if full:
+            periods.delete()
+        else:
+            # Последний период мог продолжиться новыми датами — пересобираем его целиком
+            since = periods.aggregate(last_start=Max('start_date'))['last_start']
+            if since is not None:
+                periods.filter(start_date__gte=since).delete()
+
+        created = 0
+        batch = []
+        for run in build_runs(self.iter_positions(planet, since)):
+            batch.append(PlanetaryPeriod(**run._asdict()))
+            if len(batch) >= CHUNK_SIZE:
+                PlanetaryPeriod.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+
+        PlanetaryPeriod.objects.bulk_create(batch)
+        return created + len(batch)
+
+    def iter_positions(self, planet, since=None):
+        query = '''
+            SELECT date, planet, zodiac_sign, degrees_in_sign, retrograde
+            FROM planetary_positions
+            WHERE planet = %s {}
+            ORDER BY date;
+        '''
+        params = [planet]
+        if since is not None:
+            query = query.format('AND date >= %s')
+            params.append(since)
+        else:
+            query = query.format('')
+
+        with connection.cursor() as cursor:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(CHUNK_SIZE)
+                if not rows:
+                    break
+                yield from rows
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from search.ephemeris import EphemerisIndex
+
+
+class Command(BaseCommand):
+    help = ("Выгружает planetary_positions в бинарный колоночный файл, который воркеры "
+            "отображают в память (см. search/ephemeris_file.py)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None, help='Путь к файлу (по умолчанию settings.EPHEMERIS_FILE)')
+
+    def handle(self, *args, **options):
+        path = options['output'] or settings.EPHEMERIS_FILE
+        index = EphemerisIndex.load()
+        size = index.save(path)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {len(index.signs)} planets × {index.length} days from {index.origin} "
+            f"to {path} ({size} bytes)"))
@@ -0,0 +1,55 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from finstars.data_cache import bump_data_version
+from search.bulk_load import CHUNK_SIZE, BulkLoader
+from search.synthetic import SYNTHETIC_ORIGIN, iter_market_chunks, iter_position_chunks, synthetic_end_date
+
+from .load_ephemeris import KEY_COLUMNS, VALUE_COLUMNS
+
+
+class Command(BaseCommand):
+    help = ("Заполняет planetary_positions и market_data детерминированными синтетическими данными "
+            "(для бенчмарков и разработки; в SQLite или локальный PostgreSQL)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--years', type=float, default=100, help='Например, 10, 100 или 1000')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--replace', action='store_true',
+                            help='Удалить существующие строки обеих таблиц перед загрузкой')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--skip-periods', action='store_true',
+                            help='Не перестраивать planetary_periods и planetary_events после загрузки')
+
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT EXISTS (SELECT 1 FROM planetary_positions), EXISTS (SELECT 1 FROM market_data)')
+            has_rows = any(cursor.fetchone())
+
+        if has_rows and not options['replace']:
+            raise CommandError('Tables already contain data; pass --replace to overwrite them with synthetic data')
+
+        if options['replace']:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute('DELETE FROM planetary_positions')
+                cursor.execute('DELETE FROM market_data')
+                bump_data_version('planetary_positions')
+                bump_data_version('market_data')
+
+        years, seed, chunk_size = options['years'], options['seed'], options['chunk_size']
+        self.stdout.write(f"Synthetic data {SYNTHETIC_ORIGIN} .. {synthetic_end_date(years)} (seed {seed})")
+
+        positions = BulkLoader('planetary_positions', KEY_COLUMNS, VALUE_COLUMNS)
+        stats = positions.load(iter_position_chunks(years, seed=seed, chunk_rows=chunk_size))
+        self.stdout.write(f"planetary_positions: {stats['inserted']} rows in {stats['seconds']:.1f}s")
+
+        market = BulkLoader('market_data', ['date'], ['close_price'])
+        stats = market.load(iter_market_chunks(years, seed=seed, chunk_rows=chunk_size))
+        self.stdout.write(f"market_data: {stats['inserted']} rows in {stats['seconds']:.1f}s")
+
+        if not options['skip_periods']:
+            call_command('build_planetary_periods', full=True, stdout=self.stdout)
+            call_command('build_planetary_events', stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS('Done'))
@@ -0,0 +1,53 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+
+from search.bulk_load import CHUNK_SIZE, BulkLoader, iter_file_chunks
+from search.models import PlanetaryPeriod
+from search.periods import to_date
+
+KEY_COLUMNS = ['date', 'planet']
+VALUE_COLUMNS = ['zodiac_sign', 'degrees_in_sign', 'retrograde']
+
+
+def inserted_before_last_period(first_inserted):
+    """Есть ли планета, чей последний период в planetary_periods начинается позже first_inserted"""
+    if first_inserted is None:
+        return False
+    first_inserted = to_date(first_inserted)
+    last_starts = PlanetaryPeriod.objects.values('planet').annotate(last_start=Max('start_date'))
+    return any(row['last_start'] > first_inserted for row in last_starts)
+
+
+class Command(BaseCommand):
+    help = ("Потоковая загрузка эфемерид (CSV или Parquet со столбцами date, planet, zodiac_sign, "
+            "degrees_in_sign, retrograde) в planetary_positions: новые и изменившиеся даты")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к .csv или .parquet файлу')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--skip-periods', action='store_true',
+                            help='Не достраивать planetary_periods и planetary_events после загрузки')
+
+    def handle(self, *args, **options):
+        loader = BulkLoader('planetary_positions', KEY_COLUMNS, VALUE_COLUMNS, progress=self.report_progress)
+        try:
+            stats = loader.load(iter_file_chunks(options['path'], loader.columns, options['chunk_size']))
+        except (OSError, ValueError, ImportError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"planetary_positions: {stats['inserted']} inserted, {stats['updated']} updated "
+            f"of {stats['staged']} rows ({stats['duplicates']} repeated keys) in {stats['seconds']:.1f}s"))
+
+        if not options['skip_periods'] and (stats['inserted'] or stats['updated']):
+            # Исправленные исторические даты могут затронуть любой период, а даты раньше начала
+            # последнего периода (дозагрузка прошлого, заполнение пропуска) инкрементальный режим
+            # не увидит — в обоих случаях пересобираем целиком
+            full = bool(stats['updated']) or inserted_before_last_period(stats['first_inserted'])
+            call_command('build_planetary_periods', full=full, stdout=self.stdout)
+            # Иначе график и поиск по событиям продолжили бы читать события старого диапазона
+            call_command('build_planetary_events', stdout=self.stdout)
+
+    def report_progress(self, rows, rows_per_second):
+        self.stdout.write(f"  staged {rows} rows ({rows_per_second:.0f} rows/s)")
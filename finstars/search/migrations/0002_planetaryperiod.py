@@ -0,0 +1,32 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanetaryPeriod',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('planet', models.CharField(max_length=2)),
+                ('zodiac_sign', models.CharField(max_length=2)),
+                ('retrograde', models.BooleanField(default=False)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('start_degrees', models.FloatField(null=True)),
+                ('end_degrees', models.FloatField(null=True)),
+            ],
+            options={
+                'db_table': 'planetary_periods',
+                'indexes': [
+                    models.Index(fields=['planet', 'zodiac_sign', 'retrograde', 'start_date'],
+                                 name='planetary_periods_search_idx'),
+                    models.Index(fields=['planet', 'end_date', 'start_date'], name='planetary_periods_range_idx'),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,81 @@
+from django.db import migrations, models
+
+BRIN_INDEX = 'planetary_positions_date_brin'
+
+
+def reconcile_planetary_positions(apps, schema_editor):
+    """
+    planetary_positions заполняется вне Django, поэтому таблица создается, только если ее нет
+    (например, в чистой SQLite-базе). Для существующей таблицы добавляются недостающие
+    столбцы и индексы.
+    """
+    model = apps.get_model('search', 'PlanetaryPosition')
+    connection = schema_editor.connection
+    table = model._meta.db_table
+
+    with connection.cursor() as cursor:
+        tables = connection.introspection.table_names(cursor)
+        if table not in tables:
+            schema_editor.create_model(model)
+        else:
+            columns = {column.name for column in connection.introspection.get_table_description(cursor, table)}
+            constraints = connection.introspection.get_constraints(cursor, table)
+
+            if 'id' not in columns and connection.vendor == 'postgresql':
+                schema_editor.execute(f'ALTER TABLE {table} ADD COLUMN id BIGSERIAL PRIMARY KEY')
+            if 'degrees_in_sign' not in columns:
+                schema_editor.add_field(model, model._meta.get_field('degrees_in_sign'))
+            for index in model._meta.indexes:
+                if index.name not in constraints:
+                    schema_editor.add_index(model, index)
+
+    if connection.vendor == 'postgresql':
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {BRIN_INDEX} ON {table} USING brin (date)')
+
+
+def drop_planetary_positions_indexes(apps, schema_editor):
+    model = apps.get_model('search', 'PlanetaryPosition')
+    for index in model._meta.indexes:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {index.name}')
+    schema_editor.execute(f'DROP INDEX IF EXISTS {BRIN_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0002_planetaryperiod'),
+    ]
+
+    operations = [
+        # Модель описывает существующую таблицу planetary_positions, а не search_planetaryposition
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterModelTable(
+                    name='planetaryposition',
+                    table='planetary_positions',
+                ),
+                migrations.AddField(
+                    model_name='planetaryposition',
+                    name='degrees_in_sign',
+                    field=models.FloatField(null=True),
+                ),
+                migrations.AlterField(
+                    model_name='planetaryposition',
+                    name='retrograde',
+                    field=models.CharField(blank=True, max_length=3, null=True),
+                ),
+                migrations.AddIndex(
+                    model_name='planetaryposition',
+                    index=models.Index(fields=['planet', 'zodiac_sign', 'retrograde', 'date'],
+                                       name='planetary_positions_search_idx'),
+                ),
+                migrations.AddIndex(
+                    model_name='planetaryposition',
+                    index=models.Index(fields=['date', 'planet'],
+                                       include=['zodiac_sign', 'degrees_in_sign', 'retrograde'],
+                                       name='planetary_positions_date_idx'),
+                ),
+            ],
+        ),
+        migrations.RunPython(reconcile_planetary_positions, drop_planetary_positions_indexes),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0003_planetaryposition_real_table'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanetaryEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('planet', models.CharField(max_length=2)),
+                ('kind', models.CharField(max_length=7)),
+                ('moment', models.DateTimeField()),
+                ('zodiac_sign', models.CharField(max_length=2)),
+                ('retrograde', models.BooleanField(default=False)),
+                ('degrees', models.FloatField(null=True)),
+            ],
+            options={
+                'db_table': 'planetary_events',
+                'indexes': [
+                    models.Index(fields=['planet', 'moment'], name='planetary_events_planet_idx'),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+from django.db import migrations, models
+
+CONSTRAINT = 'planetary_positions_date_planet_uniq'
+
+
+def add_unique_date_planet(apps, schema_editor):
+    """
+    Перед ограничением удаляются повторы (date, planet), оставшиеся от прежних загрузок:
+    остается последняя добавленная строка. В SQLite таблица, созданная вне Django,
+    может не иметь столбца id, поэтому там используется rowid.
+    """
+    model = apps.get_model('search', 'PlanetaryPosition')
+    connection = schema_editor.connection
+    table = model._meta.db_table
+    row_id = 'id' if connection.vendor == 'postgresql' else 'rowid'
+
+    schema_editor.execute(f'''
+        DELETE FROM {table}
+        WHERE {row_id} NOT IN (SELECT MAX({row_id}) FROM {table} GROUP BY date, planet)
+    ''')
+    if connection.vendor == 'postgresql':
+        schema_editor.add_constraint(model, model._meta.constraints[0])
+    else:
+        # Добавление ограничения в SQLite пересоздает таблицу по модели, что ломает таблицу без id
+        schema_editor.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS {CONSTRAINT} ON {table} (date, planet)')
+
+
+def drop_unique_date_planet(apps, schema_editor):
+    model = apps.get_model('search', 'PlanetaryPosition')
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.remove_constraint(model, model._meta.constraints[0])
+    else:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {CONSTRAINT}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0004_planetaryevent'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name='planetaryposition',
+                    constraint=models.UniqueConstraint(fields=['date', 'planet'], name=CONSTRAINT),
+                ),
+            ],
+        ),
+        migrations.RunPython(add_unique_date_planet, drop_unique_date_planet),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0005_planetaryposition_unique_date_planet'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'data_versions',
+            },
+        ),
+    ]
@@ -2,10 +2,100 @@ from django.db import models
 
 
 class PlanetaryPosition(models.Model):
+    RETROGRADE = '(R)'  # Так ретроградность хранится в planetary_positions
+
     planet = models.CharField(max_length=2)  # Например, 'Sk', 'Bu'
     zodiac_sign = models.CharField(max_length=2)  # Например, '1' для Овна
-    retrograde = models.BooleanField(default=False)  # Ретроградный ли период
+    degrees_in_sign = models.FloatField(null=True)  # Градус внутри знака
+    retrograde = models.CharField(max_length=3, null=True, blank=True)  # '(R)' для ретроградного периода
     date = models.DateField()  # Дата, на которую зафиксированы данные
 
+    class Meta:
+        db_table = 'planetary_positions'
+        indexes = [
+            # Поиск периодов: planet = %s AND zodiac_sign = %s AND retrograde ... ORDER BY date
+            models.Index(fields=['planet', 'zodiac_sign', 'retrograde', 'date'],
+                         name='planetary_positions_search_idx'),
+            # Диапазоны дат для графика (graph.views): покрывающий индекс для index-only scan
+            models.Index(fields=['date', 'planet'], include=['zodiac_sign', 'degrees_in_sign', 'retrograde'],
+                         name='planetary_positions_date_idx'),
+        ]
+        constraints = [
+            # Одна строка на планету и дату: повторы сбивали границы периодов
+            models.UniqueConstraint(fields=['date', 'planet'], name='planetary_positions_date_planet_uniq'),
+        ]
+        # BRIN-индекс по date для больших таблиц создается миграцией 0003 только в PostgreSQL
+
+    @property
+    def is_retrograde(self):
+        return self.retrograde == self.RETROGRADE
+
     def __str__(self):
         return f"{self.planet} in {self.zodiac_sign} on {self.date}"
+
+
+class PlanetaryPeriod(models.Model):
+    """Непрерывный период (run) планеты в одном знаке с одной ретроградностью"""
+    planet = models.CharField(max_length=2)
+    zodiac_sign = models.CharField(max_length=2)
+    retrograde = models.BooleanField(default=False)
+    start_date = models.DateField()  # Первый день периода (включительно)
+    end_date = models.DateField()  # Последний день периода (включительно)
+    start_degrees = models.FloatField(null=True)  # Градус в знаке в первый день
+    end_degrees = models.FloatField(null=True)  # Градус в знаке в последний день
+
+    class Meta:
+        db_table = 'planetary_periods'
+        indexes = [
+            models.Index(fields=['planet', 'zodiac_sign', 'retrograde', 'start_date'],
+                         name='planetary_periods_search_idx'),
+            models.Index(fields=['planet', 'end_date', 'start_date'], name='planetary_periods_range_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.planet} in {self.zodiac_sign} from {self.start_date} to {self.end_date}"
+
+
+class PlanetaryEvent(models.Model):
+    """
+    Смена состояния планеты между дневными строками planetary_positions с точностью до минут:
+    вход в знак (ingress) или станция (station — смена директного движения на ретроградное и обратно).
+    start и end отмечают начало и конец непрерывного ряда данных. zodiac_sign и retrograde —
+    состояние после события, поэтому период состояния длится от события до следующего.
+    """
+    START = 'start'
+    INGRESS = 'ingress'
+    STATION = 'station'
+    END = 'end'
+
+    planet = models.CharField(max_length=2)
+    kind = models.CharField(max_length=7)
+    moment = models.DateTimeField()  # UTC
+    zodiac_sign = models.CharField(max_length=2)
+    retrograde = models.BooleanField(default=False)
+    degrees = models.FloatField(null=True)  # Градус в знаке в момент события
+
+    class Meta:
+        db_table = 'planetary_events'
+        indexes = [
+            models.Index(fields=['planet', 'moment'], name='planetary_events_planet_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.planet} {self.kind} {self.zodiac_sign} at {self.moment}"
+
+
+class DataVersion(models.Model):
+    """
+    Версия данных таблицы name: загрузчики и пересборки увеличивают ее после каждой записи
+    (finstars.data_cache.bump_data_version). Входит в ключи кэшей и сигнатуры индексов, поэтому
+    исправленные значения за уже загруженные даты тоже их сбрасывают.
+    """
+    name = models.CharField(max_length=64, primary_key=True)  # Имя таблицы, например 'planetary_positions'
+    version = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'data_versions'
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
@@ -0,0 +1,199 @@
+import datetime
+import heapq
+from collections import namedtuple
+
+import numpy as np
+
+UNIX_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+# Непрерывный период планеты в одном знаке с одной ретроградностью (границы включительно)
+Run = namedtuple('Run', 'planet zodiac_sign retrograde start_date end_date start_degrees end_degrees')
+
+# Типы событий при заметании. Для замкнутых границ начало обрабатывается раньше конца
+# в той же точке (отрезки [1, 5] и [5, 8] пересекаются в 5), для полуоткрытых
+# [start, end) — наоборот (отрезки [1, 5) и [5, 8) не пересекаются).
+_START_FIRST = {'start': 0, 'end': 1}
+_END_FIRST = {'start': 1, 'end': 0}
+
+
+def _list_events(index, periods, order):
+    """Поток событий одного списка периодов, отсортированный по позиции"""
+    events = []
+    for start, end in periods:
+        if end < start:
+            continue
+        events.append((start, order['start'], index, 1))
+        events.append((end, order['end'], index, -1))
+
+    # Уже упорядоченный список непересекающихся периодов сортируется за O(n)
+    events.sort(key=lambda event: (event[0], event[1]))
+    return events
+
+
+def intersect_periods(periods_list, closed=True):
+    """
+    K-путевое пересечение списков периодов одним проходом заметающей прямой.
+
+    Каждый список — последовательность пар (start, end) с любыми сравнимыми значениями
+    (date, datetime, числа). Возвращает отсортированные, слитые и непересекающиеся
+    периоды, покрытые всеми списками одновременно. Сложность O(P · log N), где
+    P — общее число периодов, N — число списков.
+    """
+    return list(iter_intersect_periods(periods_list, closed))
+
+
+def iter_intersect_periods(periods_list, closed=True):
+    """intersect_periods по мере прохода заметающей прямой (для потоковой выдачи)"""
+    if not periods_list:
+        return
+
+    order = _START_FIRST if closed else _END_FIRST
+    lists_count = len(periods_list)
+    streams = [_list_events(i, periods, order) for i, periods in enumerate(periods_list)]
+    if not all(streams):
+        return
+
+    # Глубина вложенности по каждому списку (периоды внутри списка могут перекрываться)
+    depth = [0] * lists_count
+    covered = 0
+    # Последний найденный период отдается, только когда ясно, что следующий его не продолжает
+    pending = None
+    current_start = None
+
+    for position, _, index, delta in heapq.merge(*streams, key=lambda event: (event[0], event[1])):
+        before = depth[index]
+        depth[index] = before + delta
+
+        if before == 0 and delta > 0:
+            covered += 1
+            if covered == lists_count:
+                current_start = position
+        elif before == 1 and delta < 0:
+            if covered == lists_count:
+                if pending and current_start <= pending[1]:
+                    # Продолжение предыдущего периода — сливаем
+                    pending = (pending[0], position)
+                elif current_start < position or (closed and current_start == position):
+                    if pending:
+                        yield pending
+                    pending = (current_start, position)
+            covered -= 1
+
+    if pending:
+        yield pending
+
+
+def merge_periods(periods, closed=True):
+    """Слияние перекрывающихся периодов одного списка"""
+    return intersect_periods([periods], closed=closed)
+
+
+def period_days(start, end):
+    """
+    Длительность периода в днях: у дат границы включительно ([1 янв, 1 янв] — один день),
+    у datetime (индекс событий, search.events) — полуинтервал [start, end)
+    """
+    if isinstance(start, datetime.datetime):
+        return (end - start).total_seconds() / 86400
+    return (end - start).days + 1
+
+
+def to_date(value):
+    """Дата из строки 'YYYY-MM-DD' (так даты возвращает SQLite) или значение как есть"""
+    if isinstance(value, str):
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    return value
+
+
+def format_period_bound(value):
+    """Граница периода для JSON: дата или момент с точностью до минут"""
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(timespec='minutes')
+    return str(value)
+
+
+def is_retrograde(value):
+    """В planetary_positions ретроградность хранится текстом '(R)'"""
+    return value is True or value == '(R)'
+
+
+def build_runs(rows):
+    """
+    Свертка дневных строк (date, planet, zodiac_sign, degrees_in_sign, retrograde),
+    отсортированных по планете и дате, в непрерывные периоды Run.
+    Новый период начинается при смене знака, ретроградности или при пропуске дней.
+    """
+    current = None
+    for date, planet, sign, degrees, retrograde in rows:
+        retrograde = is_retrograde(retrograde)
+        if (current is not None and current.planet == planet and current.zodiac_sign == sign
+                and current.retrograde == retrograde and (date - current.end_date).days == 1):
+            current = current._replace(end_date=date, end_degrees=degrees)
+            continue
+
+        if current is not None:
+            yield current
+        current = Run(planet, sign, retrograde, date, date, degrees, degrees)
+
+    if current is not None:
+        yield current
+
+
+def rows_to_columns(rows):
+    """
+    Дневные строки (date, planet, zodiac_sign, degrees_in_sign, retrograde) -> столбцы NumPy:
+    даты datetime64[D], коды планет, коды знаков uint8, градусы float64 (None -> NaN), маска ретроградности.
+    Градусы не сужаются до float32: иначе подпись '%.2f' на границе периода расходится со значением из базы
+    """
+    count = len(rows)
+    if not count:
+        return {
+            'dates': np.empty(0, dtype='datetime64[D]'), 'planets': np.empty(0, dtype='<U2'),
+            'signs': np.empty(0, dtype=np.uint8), 'degrees': np.empty(0, dtype=np.float64),
+            'retrograde': np.empty(0, dtype=bool),
+        }
+
+    first_date = rows[0][0]
+    if isinstance(first_date, datetime.date):
+        # Порядковый номер дня быстрее, чем разбор каждого объекта date в datetime64
+        ordinals = np.fromiter((row[0].toordinal() for row in rows), dtype=np.int64, count=count)
+        dates = (ordinals - UNIX_EPOCH_ORDINAL).astype('datetime64[D]')
+    else:
+        dates = np.array([row[0] for row in rows], dtype='datetime64[D]')
+
+    return {
+        'dates': dates,
+        'planets': np.array([row[1] for row in rows], dtype='<U2'),
+        'signs': np.fromiter((int(row[2]) for row in rows), dtype=np.uint8, count=count),
+        'degrees': np.fromiter((np.nan if row[3] is None else row[3] for row in rows), dtype=np.float64, count=count),
+        'retrograde': np.fromiter((is_retrograde(row[4]) for row in rows), dtype=bool, count=count),
+    }
+
+
+def runs_from_columns(columns):
+    """
+    Векторная версия build_runs: границы периодов находятся сравнением соседних строк
+    (смена планеты, знака, ретроградности или пропуск дня), строки отсортированы по планете и дате.
+    """
+    dates, planets, signs = columns['dates'], columns['planets'], columns['signs']
+    degrees, retrograde = columns['degrees'], columns['retrograde']
+    if not len(dates):
+        return []
+
+    breaks = ((planets[1:] != planets[:-1]) | (signs[1:] != signs[:-1])
+              | (retrograde[1:] != retrograde[:-1])
+              | (dates[1:] - dates[:-1] != np.timedelta64(1, 'D')))
+    starts = np.concatenate(([0], np.flatnonzero(breaks) + 1))
+    ends = np.concatenate((starts[1:], [len(dates)])) - 1
+
+    start_dates = dates[starts].astype(object)
+    end_dates = dates[ends].astype(object)
+    start_degrees = degrees[starts].astype(np.float64)
+    end_degrees = degrees[ends].astype(np.float64)
+    return [
+        Run(planet, str(sign), bool(is_retrograde), start_date, end_date,
+            None if np.isnan(start_degree) else start_degree, None if np.isnan(end_degree) else end_degree)
+        for planet, sign, is_retrograde, start_date, end_date, start_degree, end_degree in zip(
+            planets[starts].tolist(), signs[starts].tolist(), retrograde[starts].tolist(),
+            start_dates, end_dates, start_degrees.tolist(), end_degrees.tolist())
+    ]
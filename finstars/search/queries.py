@@ -0,0 +1,97 @@
+# Построение единого SQL-запроса поиска периодов по набору условий
+
+from .periods import to_date
+
+RETROGRADE_MARK = '(R)'  # Так ретроградность хранится в planetary_positions
+
+ZODIAC_SIGN_COUNT = 12  # Знаки хранятся номерами '1'..'12'
+
+# Ключ "острова" подряд идущих дат: у дат без пропусков разность с номером строки постоянна
+ISLAND_KEYS = {
+    'postgresql': 'date - (ROW_NUMBER() OVER (ORDER BY date))::int',
+    'sqlite': 'julianday(date) - ROW_NUMBER() OVER (ORDER BY date)',
+}
+
+# Условия записаны так, чтобы их покрывал индекс (planet, zodiac_sign, retrograde, date)
+CONDITION_SQL = {
+    True: '(planet = %s AND zodiac_sign = %s AND retrograde = %s)',
+    False: '(planet = %s AND zodiac_sign = %s AND (retrograde IS NULL OR retrograde <> %s))',
+}
+
+PERIODS_QUERY = '''
+    WITH matched AS (
+        SELECT date
+        FROM planetary_positions
+        WHERE {conditions}
+        GROUP BY date
+        HAVING COUNT(DISTINCT planet) = %s
+    ),
+    islands AS (
+        SELECT date, {island_key} AS island
+        FROM matched
+    )
+    SELECT MIN(date) AS start_date, MAX(date) AS end_date
+    FROM islands
+    GROUP BY island
+    ORDER BY start_date;
+'''
+
+
+def normalize_sign(value):
+    """Номер знака строкой '1'..'12' или None для некорректного значения"""
+    try:
+        sign = int(value)
+    except (TypeError, ValueError):
+        return None
+    return str(sign) if 1 <= sign <= ZODIAC_SIGN_COUNT else None
+
+
+def normalize_conditions(conditions):
+    """
+    Приводит условия к виду {planet: (zodiac_sign, retrograde)}. Условия с некорректным
+    знаком (например, из строки запроса) отбрасываются.
+    Возвращает None, если для одной планеты заданы несовместимые условия.
+    """
+    normalized = {}
+    for condition in conditions:
+        zodiac_sign = normalize_sign(condition['zodiac_sign'])
+        if zodiac_sign is None:
+            continue
+        key = (zodiac_sign, condition['retrograde'] == 'R')
+        if normalized.setdefault(condition['planet'], key) != key:
+            return None
+    return normalized
+
+
+def build_periods_query(conditions, vendor='postgresql'):
+    """
+    Один параметризованный запрос, который отбирает дни, где выполнены все условия,
+    и сворачивает их в периоды оконной функцией прямо в базе.
+    Возвращает (sql, params) или None, если условия заведомо несовместимы.
+    """
+    normalized = normalize_conditions(conditions)
+    if not normalized:
+        return None
+
+    clauses, params = [], []
+    for planet, (zodiac_sign, retrograde) in normalized.items():
+        clauses.append(CONDITION_SQL[retrograde])
+        params.extend([planet, zodiac_sign, RETROGRADE_MARK])
+    params.append(len(normalized))
+
+    sql = PERIODS_QUERY.format(
+        conditions=' OR '.join(clauses),
+        island_key=ISLAND_KEYS.get(vendor, ISLAND_KEYS['postgresql']),
+    )
+    return sql, params
+
+
+def query_periods(cursor, conditions, vendor='postgresql'):
+    """Периоды [(start_date, end_date), ...], где одновременно выполнены все условия"""
+    query = build_periods_query(conditions, vendor)
+    if query is None:
+        return []
+
+    cursor.execute(*query)
+    # SQLite возвращает даты строками
+    return [(to_date(start), to_date(end)) for start, end in cursor.fetchall()]
@@ -0,0 +1,7 @@
+from django.urls import path
+
+from .consumers import PeriodSearchConsumer
+
+websocket_urlpatterns = [
+    path('ws/search/', PeriodSearchConsumer.as_asgi()),
+]
@@ -0,0 +1,82 @@
+"""
+Поиск периодов порциями для потоковой выдачи (search.consumers) и общий кэш результатов.
+
+Порции отдаются по мере получения: из индекса эфемерид — по мере прохода маски блоками дней,
+из индекса событий — по мере прохода заметающей прямой, из базы — по fetchmany серверного
+курсора (строки передаются порциями, а не целиком при execute; сам запрос с GROUP BY
+и ORDER BY база все равно вычисляет до первой строки). Полный результат кэшируется
+по нормализованному набору условий и версии данных, поэтому повторный поиск с теми же
+условиями отдается одной порцией сразу.
+"""
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from finstars.data_cache import get_data_version, get_tile_cache
+
+from .ephemeris import get_ephemeris_index
+from .events import get_event_index
+from .periods import to_date
+from .queries import build_periods_query, normalize_conditions
+
+# Периодов в одной порции потоковой выдачи
+PERIODS_CHUNK_SIZE = 200
+
+
+def conditions_from_normalized(normalized):
+    return [
+        {'planet': planet, 'zodiac_sign': sign, 'retrograde': 'R' if retrograde else ''}
+        for planet, (sign, retrograde) in sorted(normalized.items())
+    ]
+
+
+def periods_cache_key(normalized):
+    key = ';'.join(f'{planet}:{sign}:{int(retrograde)}' for planet, (sign, retrograde) in sorted(normalized.items()))
+    # Индекс событий отдает моменты, а не даты, — его результаты кэшируются отдельно
+    backend = getattr(settings, 'SEARCH_BACKEND', 'index')
+    return f'search:periods:{get_data_version()}:{backend}:{key}'
+
+
+def get_cached_periods(normalized):
+    """Кэшированные периоды для нормализованных условий или None"""
+    cache = get_tile_cache()
+    if not cache:
+        return None
+    return cache.get(periods_cache_key(normalized))
+
+
+def cache_periods(normalized, periods):
+    cache = get_tile_cache()
+    if cache:
+        cache.set(periods_cache_key(normalized), periods, timeout=None)
+
+
+def iter_period_chunks(conditions, chunk_size=PERIODS_CHUNK_SIZE):
+    """Периоды [(start, end), ...] порциями не больше chunk_size, по возрастанию дат"""
+    normalized = normalize_conditions(conditions)
+    if not normalized:
+        return
+
+    backend = getattr(settings, 'SEARCH_BACKEND', 'index')
+    if backend in ('index', 'events'):
+        index = get_ephemeris_index() if backend == 'index' else get_event_index()
+        periods = index.iter_periods(conditions)
+        chunk = list(islice(periods, chunk_size))
+        while chunk:
+            yield chunk
+            chunk = list(islice(periods, chunk_size))
+        return
+
+    # В PostgreSQL chunked_cursor — именованный курсор; внутри транзакции он не материализуется
+    # целиком (WITH HOLD), и fetchmany получает строки с сервера порциями.
+    # В SQLite это обычный курсор, который и так шагает по результату
+    sql, params = build_periods_query(conditions, connection.vendor)
+    with transaction.atomic(), connection.chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            # SQLite возвращает даты строками
+            yield [(to_date(start), to_date(end)) for start, end in rows]
@@ -0,0 +1,113 @@
+"""
+Детерминированные синтетические эфемериды и котировки для бенчмарков и разработки.
+
+Долгота планеты — равномерное среднее движение плюс синусоидальная петля с синодическим
+периодом: когда петля "обгоняет" среднее движение, планета ретроградна. Параметры подобраны
+так, что длительность знаков и доля ретроградных дней близки к настоящим. Котировки —
+геометрическое броуновское движение по рабочим дням. Один и тот же seed дает те же данные.
+"""
+from datetime import date, timedelta
+
+import numpy as np
+
+from .periods import UNIX_EPOCH_ORDINAL
+
+SYNTHETIC_ORIGIN = date(1900, 1, 1)
+CHUNK_ROWS = 50000
+
+# Среднее движение (градусов в сутки), синодический период (сутки) и амплитуда петли (градусы)
+PLANET_MOTION = {
+    'Su': (0.9856, None, 0.0),
+    'Ch': (13.1764, None, 0.0),
+    'Bu': (0.9856, 115.88, 22.0),
+    'Sk': (0.9856, 583.92, 93.9),
+    'Ma': (0.5240, 779.94, 67.9),
+    'Gu': (0.0831, 398.88, 9.12),
+    'Sa': (0.0335, 378.09, 4.9),
+    'Ra': (-0.0529, None, 0.0),
+}
+
+# Средний лунный узел всегда движется назад и помечается как ретроградный
+ALWAYS_RETROGRADE = {'Ra'}
+
+MARKET_DRIFT = 0.03  # Годовая доходность (цены остаются разумными и на 1000 лет)
+MARKET_VOLATILITY = 0.18  # Годовая волатильность
+MARKET_START_PRICE = 100.0
+
+
+def day_count(years):
+    return int(round(years * 365.25))
+
+
+def planet_motion(planet, t, seed=0):
+    """
+    (долгота без приведения к 0..360, скорость в градусах в сутки) в моменты t — дни
+    от SYNTHETIC_ORIGIN, в том числе дробные (точные моменты событий для проверки search.events)
+    """
+    mean_motion, synodic_period, amplitude = PLANET_MOTION[planet]
+    rng = np.random.default_rng([seed, sum(map(ord, planet))])
+    start_longitude, phase = rng.uniform(0, 360), rng.uniform(0, 2 * np.pi)
+
+    t = np.asarray(t, dtype=np.float64)
+    longitude = start_longitude + mean_motion * t
+    speed = np.full(t.shape, mean_motion)
+    if synodic_period:
+        angular = 2 * np.pi / synodic_period
+        longitude += amplitude * np.sin(angular * t + phase)
+        speed += amplitude * angular * np.cos(angular * t + phase)
+    return longitude, speed
+
+
+def planet_longitudes(planet, days, seed=0):
+    """(долгота 0..360, признак ретроградности) на каждый из days дней от SYNTHETIC_ORIGIN"""
+    longitude, speed = planet_motion(planet, np.arange(days, dtype=np.float64), seed)
+    retrograde = np.ones(days, dtype=bool) if planet in ALWAYS_RETROGRADE else speed < 0
+    return np.mod(longitude, 360.0), retrograde
+
+
+def iter_position_chunks(years, planets=None, seed=0, chunk_rows=CHUNK_ROWS):
+    """
+    Строки planetary_positions [date, planet, zodiac_sign, degrees_in_sign, retrograde]
+    пачками (для search.bulk_load.BulkLoader), по планетам и датам.
+    """
+    days = day_count(years)
+    dates = (np.datetime64(SYNTHETIC_ORIGIN, 'D') + np.arange(days)).astype(object)
+    for planet in planets or PLANET_MOTION:
+        longitude, retrograde = planet_longitudes(planet, days, seed)
+        signs = (longitude // 30).astype(np.int64) + 1
+        degrees = np.round(longitude % 30, 4)
+        for start in range(0, days, chunk_rows):
+            end = min(start + chunk_rows, days)
+            yield [
+                [dates[i], planet, str(signs[i]), float(degrees[i]), '(R)' if retrograde[i] else None]
+                for i in range(start, end)
+            ]
+
+
+def generate_position_rows(years, planets=None, seed=0):
+    """Все строки сразу как кортежи (date, planet, zodiac_sign, degrees_in_sign, retrograde)"""
+    return [tuple(row) for chunk in iter_position_chunks(years, planets, seed) for row in chunk]
+
+
+def iter_market_chunks(years, seed=0, chunk_rows=CHUNK_ROWS):
+    """Строки market_data [date, close_price] пачками, только рабочие дни"""
+    days = day_count(years)
+    dates = np.datetime64(SYNTHETIC_ORIGIN, 'D') + np.arange(days)
+    # 1970-01-01 — четверг: день недели 0 = понедельник
+    weekdays = (dates.astype(np.int64) + 3) % 7
+    business_dates = dates[weekdays < 5]
+
+    rng = np.random.default_rng([seed, 1])
+    step = 1 / 252
+    returns = rng.normal((MARKET_DRIFT - MARKET_VOLATILITY ** 2 / 2) * step,
+                         MARKET_VOLATILITY * np.sqrt(step), len(business_dates))
+    prices = np.round(MARKET_START_PRICE * np.exp(np.cumsum(returns)), 2)
+
+    ordinals = business_dates.astype(np.int64) + UNIX_EPOCH_ORDINAL
+    for start in range(0, len(business_dates), chunk_rows):
+        end = min(start + chunk_rows, len(business_dates))
+        yield [[date.fromordinal(int(ordinals[i])), float(prices[i])] for i in range(start, end)]
+
+
+def synthetic_end_date(years):
+    return SYNTHETIC_ORIGIN + timedelta(days=day_count(years) - 1)
@@ -1,3 +1,550 @@
-from django.test import TestCase
+import datetime
+import io
+import os
+import tempfile
+import threading
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from finstars.async_db import get_conninfo
+
+from .bulk_load import BulkLoader
+from .consumers import PeriodSearchConsumer
+from .ephemeris import EphemerisIndex, get_ephemeris_index, reset_ephemeris_index
+from .ephemeris_file import (
+    COLUMN_ALIGNMENT, HEADER_STRUCT, MAGIC, VERSION, EphemerisFileError, read_ephemeris_file,
+)
+from .events import MINUTES_PER_DAY, EventIndex, find_planet_events, get_event_index, reset_event_index
+from .models import PlanetaryEvent, PlanetaryPeriod, PlanetaryPosition
+from .periods import intersect_periods
+from .queries import normalize_conditions
+from .streaming import iter_period_chunks
+from .synthetic import SYNTHETIC_ORIGIN, generate_position_rows, planet_motion
+from .views import find_periods, find_periods_async
+
+KEY_COLUMNS = ['date', 'planet']
+VALUE_COLUMNS = ['zodiac_sign', 'degrees_in_sign', 'retrograde']
+
+
+def positions():
+    return sorted(PlanetaryPosition.objects.values_list('date', 'planet', 'zodiac_sign', 'degrees_in_sign',
+                                                        'retrograde'))
+
+
+class BulkLoaderTests(TestCase):
+    def setUp(self):
+        self.loader = BulkLoader('planetary_positions', KEY_COLUMNS, VALUE_COLUMNS)
+
+    def test_merge_updates_changed_and_inserts_new_rows(self):
+        PlanetaryPosition.objects.create(date=datetime.date(2024, 1, 1), planet='Sa', zodiac_sign='11',
+                                         degrees_in_sign=10.0)
+        PlanetaryPosition.objects.create(date=datetime.date(2024, 1, 2), planet='Sa', zodiac_sign='11',
+                                         degrees_in_sign=10.1)
+
+        stats = self.loader.load([[
+            ['2024-01-01', 'Sa', '11', 10.0, None],  # без изменений
+            ['2024-01-02', 'Sa', '11', 10.2, None],  # исправленный градус
+            ['2024-01-03', 'Sa', '11', 10.3, '(R)'],  # новая дата
+        ]])
+
+        self.assertEqual((stats['staged'], stats['updated'], stats['inserted']), (3, 1, 1))
+        self.assertEqual(str(stats['first_inserted']), '2024-01-03')
+        self.assertEqual(positions(), [
+            (datetime.date(2024, 1, 1), 'Sa', '11', 10.0, None),
+            (datetime.date(2024, 1, 2), 'Sa', '11', 10.2, None),
+            (datetime.date(2024, 1, 3), 'Sa', '11', 10.3, '(R)'),
+        ])
+
+    def test_repeated_key_keeps_last_row(self):
+        # Повтор ключа в разных пачках и внутри одной пачки
+        stats = self.loader.load([
+            [['2024-01-01', 'Sa', '10', 29.9, None], ['2024-01-02', 'Sa', '11', 0.1, None]],
+            [['2024-01-01', 'Sa', '11', 0.0, None], ['2024-01-01', 'Ma', '1', 5.0, None],
+             ['2024-01-01', 'Ma', '1', 5.5, None]],
+        ])
+
+        self.assertEqual((stats['staged'], stats['duplicates'], stats['inserted']), (5, 2, 3))
+        self.assertEqual(positions(), [
+            (datetime.date(2024, 1, 1), 'Ma', '1', 5.5, None),
+            (datetime.date(2024, 1, 1), 'Sa', '11', 0.0, None),
+            (datetime.date(2024, 1, 2), 'Sa', '11', 0.1, None),
+        ])
+
+    def test_error_during_load_keeps_table_and_raises_original_error(self):
+        PlanetaryPosition.objects.create(date=datetime.date(2024, 1, 1), planet='Sa', zodiac_sign='11')
+
+        def chunks():
+            yield [['2024-01-02', 'Sa', '11', 0.1, None]]
+            raise ValueError('broken file')
+
+        with self.assertRaisesMessage(ValueError, 'broken file'):
+            self.loader.load(chunks())
+
+        self.assertEqual(PlanetaryPosition.objects.count(), 1)
+        with connection.cursor() as cursor:
+            self.assertNotIn(self.loader.staging, connection.introspection.table_names(cursor))
+
+        # После ошибки загрузчик снова работает на том же соединении
+        self.assertEqual(self.loader.load([[['2024-01-02', 'Sa', '11', 0.1, None]]])['inserted'], 1)
+
+    def test_database_rejects_duplicate_date_planet(self):
+        PlanetaryPosition.objects.create(date=datetime.date(2024, 1, 1), planet='Sa', zodiac_sign='11')
+        with self.assertRaises(IntegrityError):
+            PlanetaryPosition.objects.create(date=datetime.date(2024, 1, 1), planet='Sa', zodiac_sign='11')
+
+
+def event_days(events):
+    """Моменты событий в днях от SYNTHETIC_ORIGIN"""
+    origin = datetime.datetime.combine(SYNTHETIC_ORIGIN, datetime.time())
+    return np.array([(event.moment - origin).total_seconds() / 86400 for event in events])
+
+
+def to_day_periods(periods):
+    """
+    Полуинтервалы моментов -> периоды дат (включительно): день входит в период, если его 00:00
+    попадает в полуинтервал. Соседние по дням периоды сливаются, как в дневном индексе.
+    """
+    days = []
+    for start, end in periods:
+        first = start.date() if start.time() == datetime.time() else start.date() + datetime.timedelta(days=1)
+        last = end.date() if end.time() != datetime.time() else end.date() - datetime.timedelta(days=1)
+        if first > last:
+            continue
+        if days and days[-1][1] + datetime.timedelta(days=1) == first:
+            days[-1] = (days[-1][0], last)
+        else:
+            days.append((first, last))
+    return days
+
+
+class LoadEphemerisPeriodsTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def load_days(self, days):
+        path = os.path.join(self.directory, f'{days[0]}.csv')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write('date,planet,zodiac_sign,degrees_in_sign,retrograde\n')
+            for day in days:
+                file.write(f'2024-01-{day:02d},Ma,1,{day},\n')
+        call_command('load_ephemeris', path, stdout=io.StringIO())
+
+    def periods(self):
+        return list(PlanetaryPeriod.objects.filter(planet='Ma').order_by('start_date')
+                    .values_list('start_date', 'end_date'))
+
+    def test_backfilled_dates_reach_periods(self):
+        self.load_days(range(10, 21))
+        self.load_days(range(1, 10))
+
+        self.assertEqual(self.periods(), [(datetime.date(2024, 1, 1), datetime.date(2024, 1, 20))])
+
+    def test_filled_gap_joins_periods(self):
+        self.load_days([1, 2, 3, 4, 5] + list(range(10, 21)))
+        self.assertEqual(len(self.periods()), 2)
+
+        self.load_days(range(6, 10))
+        self.assertEqual(self.periods(), [(datetime.date(2024, 1, 1), datetime.date(2024, 1, 20))])
+
+
+@override_settings(EPHEMERIS_FILE=None, EPHEMERIS_INDEX_CHECK_INTERVAL=0)
+class EphemerisIndexRefreshTests(TestCase):
+    def setUp(self):
+        reset_ephemeris_index()
+        self.addCleanup(reset_ephemeris_index)
+
+    def test_corrected_rows_rebuild_index(self):
+        loader = BulkLoader('planetary_positions', KEY_COLUMNS, VALUE_COLUMNS)
+        loader.load([[['2024-01-01', 'Ma', '1', 29.5, None], ['2024-01-02', 'Ma', '1', 29.9, None]]])
+        before = get_ephemeris_index().find_periods([{'planet': 'Ma', 'zodiac_sign': '1', 'retrograde': ''}])
+
+        # Исправление уже загруженной даты: число строк и диапазон дат те же
+        loader.load([[['2024-01-02', 'Ma', '2', 0.1, None]]])
+        index = get_ephemeris_index()
+
+        self.assertEqual(before, [(datetime.date(2024, 1, 1), datetime.date(2024, 1, 2))])
+        self.assertEqual(index.find_periods([{'planet': 'Ma', 'zodiac_sign': '1', 'retrograde': ''}]),
+                         [(datetime.date(2024, 1, 1), datetime.date(2024, 1, 1))])
+
+
+class EphemerisFileTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'ephemeris.bin')
+        rows = generate_position_rows(2, planets=['Ma', 'Bu', 'Ra'])
+        # Пропуск дня и градус без значения тоже переживают запись
+        rows = [row for row in rows if row[0] != SYNTHETIC_ORIGIN + datetime.timedelta(days=40)]
+        rows[5] = rows[5][:3] + (None,) + rows[5][4:]
+        self.index = EphemerisIndex.from_rows(rows)
+
+    def test_round_trip_matches_index_from_rows(self):
+        self.index.save(self.path)
+        loaded = EphemerisIndex.from_file(self.path)
+
+        self.assertEqual(loaded.origin, self.index.origin)
+        self.assertEqual(loaded.length, self.index.length)
+        for columns in ('signs', 'retrograde', 'degrees'):
+            expected, actual = getattr(self.index, columns), getattr(loaded, columns)
+            self.assertEqual(sorted(actual), sorted(expected))
+            for planet in expected:
+                np.testing.assert_array_equal(actual[planet], expected[planet], f'{columns} {planet}')
+        end_date = SYNTHETIC_ORIGIN + datetime.timedelta(days=700)
+        self.assertEqual(loaded.runs(['Ma', 'Bu', 'Ra'], SYNTHETIC_ORIGIN, end_date),
+                         self.index.runs(['Ma', 'Bu', 'Ra'], SYNTHETIC_ORIGIN, end_date))
+
+    def test_columns_are_aligned(self):
+        self.index.save(self.path)
+        _, signs, retrograde, degrees = read_ephemeris_file(self.path)
+
+        first = sorted(signs)[0]
+        for column in (signs, retrograde, degrees):
+            self.assertEqual(column[first].ctypes.data % COLUMN_ALIGNMENT, 0)
+
+    def test_truncated_and_foreign_files_are_rejected(self):
+        size = self.index.save(self.path)
+        with open(self.path, 'rb') as file:
+            content = file.read()
+        version_offset = len(MAGIC)
+        wrong_version = content[:version_offset] + (VERSION + 1).to_bytes(2, 'little') + content[version_offset + 2:]
+
+        for name, data, message in (
+            ('truncated', content[:size - 1], 'truncated'),
+            ('header only', content[:HEADER_STRUCT.size - 1], 'too short'),
+            ('empty', b'', 'too short'),
+            ('foreign', b'date,planet,zodiac_sign\n' * 10, 'not an ephemeris file'),
+            ('other version', wrong_version, 'unsupported version'),
+        ):
+            with self.subTest(name):
+                with open(self.path, 'wb') as file:
+                    file.write(data)
+                with self.assertRaisesRegex(EphemerisFileError, message):
+                    EphemerisIndex.from_file(self.path)
+
+
+class EphemerisDailyDegreesTests(SimpleTestCase):
+    def test_days_outside_index_are_nan(self):
+        index = EphemerisIndex.from_rows([
+            (datetime.date(2024, 1, 1), 'Ma', '1', 10.5, None),
+            (datetime.date(2024, 1, 2), 'Ma', '1', 11.25, None),
+        ])
+
+        values = index.daily_degrees(['Ma', 'Sa'], datetime.date(2023, 12, 31), datetime.date(2024, 1, 3))
+
+        self.assertEqual(list(values), ['Ma'])
+        np.testing.assert_array_equal(values['Ma'], [np.nan, 10.5, 11.25, np.nan])
+
+
+class EventMomentTests(SimpleTestCase):
+    """Моменты событий по дневным строкам против точного движения синтетических планет"""
+    YEARS = 12
+    PLANETS = ('Ch', 'Bu', 'Sk', 'Ma', 'Gu', 'Sa', 'Ra')
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.index = EphemerisIndex.from_rows(generate_position_rows(cls.YEARS, planets=cls.PLANETS))
+
+    def planet_events(self, planet, kind):
+        index = self.index
+        events = find_planet_events(planet, index.origin, index.signs[planet], index.retrograde[planet],
+                                    index.degrees[planet])
+        return [event for event in events if event.kind == kind]
+
+    def test_ingress_moments_within_minutes(self):
+        for planet in self.PLANETS:
+            events = self.planet_events(planet, PlanetaryEvent.INGRESS)
+            self.assertTrue(events, planet)
+            longitude, speed = planet_motion(planet, event_days(events))
+            # Отклонение от границы знака, переведенное в минуты через скорость планеты
+            offset = longitude - 30 * np.round(longitude / 30)
+            errors = np.abs(offset / speed) * MINUTES_PER_DAY
+            self.assertLess(errors.max(), 10, planet)
+
+    def test_station_moments_within_hours(self):
+        for planet in ('Bu', 'Sk', 'Ma', 'Gu', 'Sa'):
+            events = self.planet_events(planet, PlanetaryEvent.STATION)
+            self.assertTrue(events, planet)
+            t = event_days(events)
+            _, speed = planet_motion(planet, t)
+            _, speed_before = planet_motion(planet, t - 0.01)
+            _, speed_after = planet_motion(planet, t + 0.01)
+            acceleration = (speed_after - speed_before) / 0.02
+            errors = np.abs(speed / acceleration) * MINUTES_PER_DAY
+            self.assertLess(errors.max(), 180, planet)
+
+    def test_day_level_periods_match_daily_index(self):
+        events = EventIndex.from_ephemeris(self.index)
+        for conditions in (
+            [{'planet': 'Ma', 'zodiac_sign': '3', 'retrograde': ''}],
+            [{'planet': 'Sk', 'zodiac_sign': '5', 'retrograde': 'R'}],
+            [{'planet': 'Bu', 'zodiac_sign': '8', 'retrograde': ''},
+             {'planet': 'Ch', 'zodiac_sign': '2', 'retrograde': ''}],
+            [{'planet': 'Gu', 'zodiac_sign': '1', 'retrograde': ''},
+             {'planet': 'Sa', 'zodiac_sign': '1', 'retrograde': 'R'}],
+        ):
+            expected = self.index.find_periods(conditions)
+            self.assertEqual(to_day_periods(events.find_periods(conditions)), expected, conditions)
+
+    def test_runs_match_daily_index(self):
+        events = EventIndex.from_ephemeris(self.index)
+        start_date, end_date = datetime.date(1903, 2, 10), datetime.date(1905, 7, 20)
+        degrees = self.index.daily_degrees(self.PLANETS, start_date, end_date)
+
+        expected = self.index.runs(self.PLANETS, start_date, end_date)
+        self.assertEqual(events.runs(self.PLANETS, start_date, end_date, degrees), expected)
+        # Без дневных градусов границы те же, градусы интерполируются между событиями
+        self.assertEqual([run[:5] for run in events.runs(self.PLANETS, start_date, end_date)],
+                         [run[:5] for run in expected])
+
+
+@override_settings(EPHEMERIS_FILE=None)
+class EventIndexSourceTests(TestCase):
+    def setUp(self):
+        PlanetaryPosition.objects.bulk_create(
+            PlanetaryPosition(date=date, planet=planet, zodiac_sign=sign, degrees_in_sign=degrees,
+                              retrograde=retrograde)
+            for date, planet, sign, degrees, retrograde in generate_position_rows(1, planets=['Ma'])
+        )
+        for reset in (reset_event_index, reset_ephemeris_index):
+            reset()
+            self.addCleanup(reset)
+
+    def test_table_is_used_while_it_covers_positions(self):
+        call_command('build_planetary_events', stdout=io.StringIO())
+        self.assertNotEqual(get_event_index().signature[0], 'ephemeris')
+
+    def test_new_positions_without_rebuild_fall_back_to_ephemeris(self):
+        call_command('build_planetary_events', stdout=io.StringIO())
+        last = PlanetaryPosition.objects.latest('date')
+        PlanetaryPosition.objects.create(date=last.date + datetime.timedelta(days=1), planet='Ma',
+                                         zodiac_sign=last.zodiac_sign, degrees_in_sign=last.degrees_in_sign)
+        reset_event_index()
+        reset_ephemeris_index()
+
+        with self.assertLogs('search.events', 'WARNING'):
+            index = get_event_index()
+        self.assertEqual(index.signature[0], 'ephemeris')
+        self.assertEqual(index.moments['Ma'][-1], np.datetime64(last.date + datetime.timedelta(days=2), 'm'))
+
+
+class NormalizeConditionsTests(SimpleTestCase):
+    def test_signs_are_normalized_and_invalid_conditions_dropped(self):
+        self.assertEqual(normalize_conditions([
+            {'planet': 'Sa', 'zodiac_sign': '03', 'retrograde': 'R'},
+            {'planet': 'Ma', 'zodiac_sign': 12, 'retrograde': ''},
+            {'planet': 'Gu', 'zodiac_sign': 'foo', 'retrograde': ''},
+            {'planet': 'Sk', 'zodiac_sign': '13', 'retrograde': ''},
+            {'planet': 'Bu', 'zodiac_sign': None, 'retrograde': ''},
+        ]), {'Sa': ('3', True), 'Ma': ('12', False)})
+
+    def test_conflicting_conditions(self):
+        self.assertIsNone(normalize_conditions([
+            {'planet': 'Sa', 'zodiac_sign': '3', 'retrograde': ''},
+            {'planet': 'Sa', 'zodiac_sign': '4', 'retrograde': ''},
+        ]))
+
+
+@override_settings(EPHEMERIS_FILE=None)
+class SearchViewTests(TestCase):
+    def setUp(self):
+        PlanetaryPosition.objects.bulk_create(
+            PlanetaryPosition(date=date, planet=planet, zodiac_sign=sign, degrees_in_sign=degrees,
+                              retrograde=retrograde)
+            for date, planet, sign, degrees, retrograde in generate_position_rows(1, planets=['Sa', 'Ma'])
+        )
+        for reset in (reset_event_index, reset_ephemeris_index):
+            reset()
+            self.addCleanup(reset)
+
+    def test_invalid_sign_is_ignored_by_every_backend(self):
+        sign = PlanetaryPosition.objects.filter(planet='Ma').earliest('date').zodiac_sign
+        for backend in ('index', 'events', 'sql'):
+            for path in ('/search/', '/search/async/'):
+                with self.subTest(backend=backend, path=path), override_settings(SEARCH_BACKEND=backend):
+                    response = self.client.get(path, {'zodiac_Sa': 'foo', 'zodiac_Ma': sign})
+                    self.assertEqual(response.status_code, 200)
+                    self.assertTrue(response.context['periods'])
+
+                    response = self.client.get(path, {'zodiac_Sa': 'foo'})
+                    self.assertEqual(response.status_code, 200)
+                    self.assertFalse(response.context['periods'])
+
+    def test_sql_backend_returns_dates(self):
+        sign = PlanetaryPosition.objects.filter(planet='Ma').earliest('date').zodiac_sign
+        conditions = [{'planet': 'Ma', 'zodiac_sign': sign, 'retrograde': ''}]
+        with override_settings(SEARCH_BACKEND='index'):
+            expected = find_periods(conditions)
+
+        with override_settings(SEARCH_BACKEND='sql'):
+            self.assertEqual(find_periods(conditions), expected)
+            self.assertEqual(async_to_sync(find_periods_async)(conditions), expected)
+            response = self.client.get('/search/', {'zodiac_Ma': sign})
+        self.assertContains(response, f'start-date={expected[0][0]:%Y-%m-%d}&end-date={expected[0][1]:%Y-%m-%d}')
+
+
+STREAM_CONDITIONS = [
+    [{'planet': 'Ma', 'zodiac_sign': '3', 'retrograde': ''}],
+    [{'planet': 'Sk', 'zodiac_sign': '5', 'retrograde': ''}, {'planet': 'Ma', 'zodiac_sign': '6', 'retrograde': ''}],
+    [{'planet': 'Sk', 'zodiac_sign': '2', 'retrograde': 'R'}],
+]
+
+
+class IndexWalkTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.index = EphemerisIndex.from_rows(generate_position_rows(6, planets=['Sk', 'Ma']))
+
+    def test_ephemeris_walk_matches_find_periods_across_block_boundaries(self):
+        for conditions in STREAM_CONDITIONS:
+            expected = self.index.find_periods(conditions)
+            self.assertTrue(expected)
+            for block_days in (1, 7, 100, 10000):
+                with self.subTest(conditions=conditions, block_days=block_days):
+                    self.assertEqual(list(self.index.iter_periods(conditions, block_days)), expected)
+
+    def test_event_walk_matches_find_periods(self):
+        events = EventIndex.from_ephemeris(self.index)
+        for conditions in STREAM_CONDITIONS:
+            self.assertEqual(list(events.iter_periods(conditions)), events.find_periods(conditions))
+
+
+@override_settings(EPHEMERIS_FILE=None)
+class PeriodChunksTests(TestCase):
+    def setUp(self):
+        PlanetaryPosition.objects.bulk_create(
+            PlanetaryPosition(date=date, planet=planet, zodiac_sign=sign, degrees_in_sign=degrees,
+                              retrograde=retrograde)
+            for date, planet, sign, degrees, retrograde in generate_position_rows(6, planets=['Sk', 'Ma'])
+        )
+        for reset in (reset_event_index, reset_ephemeris_index):
+            reset()
+            self.addCleanup(reset)
+
+    def test_chunks_of_every_backend_add_up_to_full_result(self):
+        index = EphemerisIndex.load()
+        for conditions in STREAM_CONDITIONS:
+            expected = index.find_periods(conditions)
+            for backend in ('index', 'sql'):
+                with self.subTest(conditions=conditions, backend=backend), override_settings(SEARCH_BACKEND=backend):
+                    chunks = list(iter_period_chunks(conditions, chunk_size=2))
+                    self.assertTrue(all(0 < len(chunk) <= 2 for chunk in chunks))
+                    self.assertEqual([period for chunk in chunks for period in chunk], expected)
+
+            with override_settings(SEARCH_BACKEND='events'):
+                chunks = list(iter_period_chunks(conditions, chunk_size=2))
+                self.assertEqual([period for chunk in chunks for period in chunk],
+                                 get_event_index().find_periods(conditions))
+
+
+class PeriodSearchConsumerTests(SimpleTestCase):
+    async def search(self, conditions):
+        communicator = WebsocketCommunicator(PeriodSearchConsumer.as_asgi(), '/ws/search/')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.send_json_to({'type': 'search', 'id': 1, 'conditions': conditions})
+        response = await communicator.receive_json_from()
+        await communicator.disconnect()
+        return response
+
+    async def test_invalid_conditions_get_error_frame(self):
+        for conditions in (['Sa'], [{'zodiac_sign': '3'}], 5):
+            with self.subTest(conditions=conditions):
+                response = await self.search(conditions)
+                self.assertEqual((response['type'], response['id']), ('error', 1))
+
+    async def test_unknown_message_type_gets_error_frame_with_id(self):
+        communicator = WebsocketCommunicator(PeriodSearchConsumer.as_asgi(), '/ws/search/')
+        await communicator.connect()
+        await communicator.send_json_to({'type': 'serach', 'id': 7})
+        response = await communicator.receive_json_from()
+        await communicator.disconnect()
+
+        self.assertEqual((response['type'], response['id']), ('error', 7))
+
+    async def test_unexpected_failure_gets_error_frame(self):
+        conditions = [{'planet': 'Sa', 'zodiac_sign': '3', 'retrograde': ''}]
+        with mock.patch('search.consumers.get_cached_periods', side_effect=RuntimeError('cache is down')), \
+                self.assertLogs('search.consumers', 'ERROR'):
+            response = await self.search(conditions)
+        self.assertEqual(response, {'type': 'error', 'id': 1, 'error': 'cache is down'})
+
+
+def brute_force_intersection(periods_list, closed):
+    """Пересечение перебором точек сетки с шагом 0.5 (границы периодов — целые числа)"""
+    def covers(period, point):
+        start, end = period
+        return start <= point <= end if closed else start <= point < end
+
+    points = [step / 2 for step in range(0, 2 * 40 + 1)]
+    covered = [point for point in points
+               if all(any(covers(period, point) for period in periods) for periods in periods_list)]
+
+    result = []
+    for point in covered:
+        if result and point - result[-1][1] == 0.5:
+            result[-1][1] = point
+        else:
+            result.append([point, point])
+    if closed:
+        return [(int(start), int(end)) for start, end in result]
+    return [(int(start), int(end + 0.5)) for start, end in result]
+
+
+class SweepLineTests(SimpleTestCase):
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(0)
+        for _ in range(500):
+            periods_list = []
+            for _ in range(int(rng.integers(1, 5))):
+                starts = rng.integers(0, 35, int(rng.integers(0, 6)))
+                # Периоды внутри списка могут перекрываться и вырождаться в точку
+                periods_list.append([(int(start), int(start + rng.integers(0, 6))) for start in starts])
+            for closed in (True, False):
+                with self.subTest(periods_list=periods_list, closed=closed):
+                    self.assertEqual(intersect_periods(periods_list, closed=closed),
+                                     brute_force_intersection(periods_list, closed))
+
+    def test_touching_bounds(self):
+        self.assertEqual(intersect_periods([[(1, 5), (5, 8)], [(0, 9)]]), [(1, 8)])
+        self.assertEqual(intersect_periods([[(1, 5)], [(5, 8)]]), [(5, 5)])
+        self.assertEqual(intersect_periods([[(1, 5)], [(5, 8)]], closed=False), [])
+        self.assertEqual(intersect_periods([[(1, 5), (5, 8)], [(0, 9)]], closed=False), [(1, 8)])
+
+
+class AsyncSearchTests(SimpleTestCase):
+    @override_settings(SEARCH_BACKEND='index')
+    async def test_index_search_runs_outside_event_loop_thread(self):
+        loop_thread = threading.get_ident()
+        search_threads = []
+
+        def find_periods(conditions):
+            search_threads.append(threading.get_ident())
+            return [(datetime.date(2020, 1, 1), datetime.date(2020, 1, 2))]
+
+        index = mock.Mock(find_periods=find_periods)
+        with mock.patch('search.views.get_ephemeris_index', return_value=index):
+            periods = await find_periods_async([{'planet': 'Sa', 'zodiac_sign': '1', 'retrograde': ''}])
+
+        self.assertEqual(periods, [(datetime.date(2020, 1, 1), datetime.date(2020, 1, 2))])
+        self.assertNotEqual(search_threads, [loop_thread])
+
+    def test_conninfo_keeps_database_options(self):
+        options = {'sslmode': 'require', 'options': '-c statement_timeout=5000', 'pool': {'max_size': 4}}
+        with mock.patch.dict(settings.DATABASES['default'], {'NAME': 'finstars', 'HOST': 'db', 'OPTIONS': options}):
+            conninfo = get_conninfo()
+
+        self.assertIn('sslmode=require', conninfo)
+        self.assertIn("options='-c statement_timeout=5000'", conninfo)
+        self.assertIn('dbname=finstars', conninfo)
+        self.assertNotIn('pool', conninfo)
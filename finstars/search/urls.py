@@ -5,4 +5,5 @@ from . import views
 
 urlpatterns = [
     path('', views.search_periods, name='search_periods'),
+    path('async/', views.search_periods_async, name='search_periods_async'),
 ]
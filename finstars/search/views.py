@@ -1,6 +1,14 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render
 from django.db import connection
-from datetime import datetime
+
+from finstars.async_db import fetch_all
+
+from .ephemeris import get_ephemeris_index
+from .events import get_event_index
+from .periods import intersect_periods, to_date
+from .queries import build_periods_query, query_periods
 
 PLANET_LIST = [
     {'label': 'SATURN (Sa)', 'value': 'Sa'},
@@ -28,34 +36,46 @@ ZODIAC_SIGNS = [
 
 
 def get_intersecting_periods(periods_list):
-    if not periods_list:
-        return []
-
-    # Начнем с первого списка периодов и будем искать пересечения с каждым следующим
-    common_periods = periods_list[0]
-
-    for periods in periods_list[1:]:
-        common_periods = find_intersections(common_periods, periods)
-
-    return common_periods
+    """Пересечение всех списков периодов за один проход (см. search.periods.intersect_periods)"""
+    return intersect_periods(periods_list)
 
 
 def find_intersections(periods1, periods2):
     """Функция для нахождения пересекающихся периодов между двумя списками периодов"""
-    intersections = []
-
-    for start1, end1 in periods1:
-        for start2, end2 in periods2:
-            start_intersection = max(start1, start2)
-            end_intersection = min(end1, end2)
-            if start_intersection <= end_intersection:
-                intersections.append((start_intersection, end_intersection))
-
-    return intersections
+    return intersect_periods([periods1, periods2])
+
+
+def find_periods(conditions):
+    """Периоды, где одновременно выполнены все условия, через выбранный в SEARCH_BACKEND источник"""
+    backend = getattr(settings, 'SEARCH_BACKEND', 'index')
+    if backend == 'index':
+        return get_ephemeris_index().find_periods(conditions)
+    if backend == 'events':
+        return get_event_index().find_periods(conditions)
+
+    # Пересечение периодов выполняется в базе одним запросом
+    with connection.cursor() as cursor:
+        return query_periods(cursor, conditions, connection.vendor)
+
+
+async def find_periods_async(conditions):
+    """
+    find_periods для async-представлений: SQL-запрос идет через асинхронный пул,
+    поиск по индексу — в отдельном потоке, чтобы не блокировать цикл событий
+    """
+    backend = getattr(settings, 'SEARCH_BACKEND', 'index')
+    if backend in ('index', 'events'):
+        index = await sync_to_async(get_ephemeris_index if backend == 'index' else get_event_index)()
+        return await sync_to_async(index.find_periods, thread_sensitive=False)(conditions)
+
+    query = build_periods_query(conditions, connection.vendor)
+    if query is None:
+        return []
+    # Без асинхронного пула запрос идет через SQLite, который возвращает даты строками
+    return [(to_date(start), to_date(end)) for start, end in await fetch_all(*query)]
 
 
-def search_periods(request):
-    periods = []
+def get_selected_conditions(request):
     selected_conditions = []  # Для хранения условий поиска
 
     # Получаем условия для каждой планеты
@@ -69,46 +89,30 @@ def search_periods(request):
                 'zodiac_sign': zodiac_sign,
                 'retrograde': retrograde
             })
+    return selected_conditions
+
+
+def search_periods(request):
+    periods = []
+    selected_conditions = get_selected_conditions(request)
+
+    if selected_conditions:
+        periods = find_periods(selected_conditions)
+
+    return render(request, 'search/periods.html', {
+        'planets': PLANET_LIST,
+        'zodiac_signs': ZODIAC_SIGNS,
+        'periods': periods
+    })
+
+
+async def search_periods_async(request):
+    """search_periods для ASGI: ожидание базы не занимает поток воркера"""
+    periods = []
+    selected_conditions = get_selected_conditions(request)
 
     if selected_conditions:
-        periods_list = []
-
-        with connection.cursor() as cursor:
-            for condition in selected_conditions:
-                query = '''
-                    SELECT date, planet, zodiac_sign, retrograde
-                    FROM planetary_positions
-                    WHERE planet = %s AND zodiac_sign = %s {}
-                    ORDER BY date;
-                '''
-                retrograde_clause = "AND retrograde = '(R)'" if condition[
-                                                                    'retrograde'] == 'R' else "AND (retrograde != '(R)' OR retrograde IS NULL)"
-                query = query.format(retrograde_clause)
-
-                cursor.execute(query, [condition['planet'], condition['zodiac_sign']])
-                raw_periods = cursor.fetchall()
-
-                # Преобразуем результаты в формат [(start_date, end_date), ...]
-                planet_periods = []
-                if raw_periods:
-                    start_date = raw_periods[0][0]
-                    prev_date = start_date
-
-                    for row in raw_periods:
-                        current_date = row[0]
-                        if (current_date - prev_date).days > 1:
-                            # Завершаем предыдущий период
-                            planet_periods.append((start_date, prev_date))
-                            start_date = current_date
-                        prev_date = current_date
-
-                    # Добавляем последний период
-                    planet_periods.append((start_date, prev_date))
-
-                periods_list.append(planet_periods)
-
-        # Найти пересекающиеся периоды
-        periods = get_intersecting_periods(periods_list)
+        periods = await find_periods_async(selected_conditions)
 
     return render(request, 'search/periods.html', {
         'planets': PLANET_LIST,
@@ -0,0 +1,139 @@
+"""
+Корреляции погодных рядов нескольких точек с несколькими тикерами.
+
+Все ряды выравниваются на общий индекс дат (дни, на которые есть значения у всех рядов),
+после чего для всей сетки точки x тикеры одним вычислением считаются:
+- матрицы корреляции Пирсона со сдвигом (погода опережает рынок на lag наблюдений);
+- скользящие матрицы корреляции в окне window наблюдений (через накопленные суммы).
+Скользящие корреляции большой сетки считаются блоками строк в пуле потоков: поэлементные
+операции и накопленные суммы NumPy отпускают GIL, а пул процессов в многопоточном
+веб-воркере означал бы fork после запуска потоков.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=getattr(settings, 'CORRELATION_MAX_THREADS', 4),
+                                       thread_name_prefix='correlation')
+        return _pool
+
+
+def log_returns(series):
+    """Логарифмические доходности ряда цен (первое наблюдение отбрасывается)"""
+    return np.log(series).diff().iloc[1:]
+
+
+def align_series(series_list):
+    """
+    series_list — pd.Series с индексом дат. Возвращает (dates, matrix): общие даты
+    и матрицу (число рядов, число дат) без пропусков.
+    """
+    frame = pd.concat([series.astype(float) for series in series_list], axis=1, join='inner').dropna()
+    return frame.index.values, frame.to_numpy(dtype=np.float64).T
+
+
+def _standardize(values):
+    centered = values - values.mean(axis=1, keepdims=True)
+    norms = np.sqrt((centered * centered).sum(axis=1, keepdims=True))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return centered / norms
+
+
+def lagged_correlations(x, y, lags):
+    """
+    x — (nx, T), y — (ny, T). Возвращает (len(lags), nx, ny): корреляцию x[t] с y[t + lag].
+    Отрицательный lag — рынок опережает погоду.
+    """
+    length = x.shape[1]
+    result = np.full((len(lags), x.shape[0], y.shape[0]), np.nan)
+    for i, lag in enumerate(lags):
+        if abs(lag) >= length - 1:
+            continue
+        if lag >= 0:
+            x_part, y_part = x[:, :length - lag], y[:, lag:]
+        else:
+            x_part, y_part = x[:, -lag:], y[:, :length + lag]
+        # Корреляции всех пар одним матричным произведением стандартизованных рядов
+        result[i] = _standardize(x_part) @ _standardize(y_part).T
+    return result
+
+
+def rolling_correlations(x, y, window):
+    """
+    x — (nx, T), y — (ny, T). Возвращает (T - window + 1, nx, ny): корреляции в окне,
+    заканчивающемся на каждом наблюдении начиная с window-го.
+    """
+    length = x.shape[1]
+    if window < 2 or window > length:
+        return np.empty((0, x.shape[0], y.shape[0]))
+
+    # Центрирование уменьшает потерю точности в разностях накопленных сумм
+    x = x - x.mean(axis=1, keepdims=True)
+    y = y - y.mean(axis=1, keepdims=True)
+
+    def window_sums(values):
+        cumulative = np.cumsum(values, axis=-1)
+        cumulative = np.concatenate([np.zeros(values.shape[:-1] + (1,)), cumulative], axis=-1)
+        return cumulative[..., window:] - cumulative[..., :-window]
+
+    sum_x, sum_y = window_sums(x), window_sums(y)
+    sum_xx, sum_yy = window_sums(x * x), window_sums(y * y)
+    sum_xy = window_sums(x[:, None, :] * y[None, :, :])  # (nx, ny, windows)
+
+    covariance = window * sum_xy - sum_x[:, None, :] * sum_y[None, :, :]
+    variance_x = window * sum_xx - sum_x * sum_x
+    variance_y = window * sum_yy - sum_y * sum_y
+    with np.errstate(invalid='ignore', divide='ignore'):
+        correlation = covariance / np.sqrt(variance_x[:, None, :] * variance_y[None, :, :])
+    return np.clip(correlation, -1.0, 1.0).transpose(2, 0, 1)
+
+
+def parallel_rolling_correlations(x, y, window):
+    """
+    rolling_correlations, посчитанные блоками строк x в пуле потоков, если сетка
+    (nx * ny * T) больше settings.CORRELATION_PARALLEL_THRESHOLD.
+    """
+    threshold = getattr(settings, 'CORRELATION_PARALLEL_THRESHOLD', 2_000_000)
+    workers = getattr(settings, 'CORRELATION_MAX_THREADS', 4)
+    if x.shape[0] < 2 or x.shape[0] * y.shape[0] * x.shape[1] <= threshold:
+        return rolling_correlations(x, y, window)
+
+    blocks = np.array_split(np.arange(x.shape[0]), min(workers, x.shape[0]))
+    futures = [get_pool().submit(rolling_correlations, x[block], y, window) for block in blocks]
+    return np.concatenate([future.result() for future in futures], axis=1)
+
+
+def correlate(weather_series, market_series, lags=(0,), window=None, market_returns=True):
+    """
+    weather_series, market_series — {метка: pd.Series с индексом дат}.
+    Цены рынка по умолчанию заменяются логарифмическими доходностями.
+    Возвращает словарь с общими датами, метками, матрицами со сдвигом и скользящими матрицами.
+    """
+    weather_labels, market_labels = list(weather_series), list(market_series)
+    market = [log_returns(series) if market_returns else series for series in market_series.values()]
+    dates, matrix = align_series(list(weather_series.values()) + market)
+    x, y = matrix[:len(weather_labels)], matrix[len(weather_labels):]
+
+    result = {
+        'dates': dates,
+        'weather': weather_labels,
+        'market': market_labels,
+        'lags': list(lags),
+        'lagged': lagged_correlations(x, y, lags),
+    }
+    if window:
+        result['window'] = window
+        result['rolling_dates'] = dates[window - 1:] if window <= len(dates) else dates[:0]
+        result['rolling'] = parallel_rolling_correlations(x, y, window)
+    return result
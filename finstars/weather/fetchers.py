@@ -0,0 +1,145 @@
+"""
+Загрузчики дневных рядов из внешних источников для локального хранилища (weather.timeseries).
+
+Загрузчик — функция fetch(key, fields, start_date, end_date) -> {field: [(date, value), ...]},
+даты включительно. Какой загрузчик отвечает за источник, задает settings.TIMESERIES_FETCHERS
+(корутинные загрузчики для async-представлений — TIMESERIES_ASYNC_FETCHERS);
+CsvFetcher читает те же ряды из локальных файлов и заменяет сеть в тестах и офлайн.
+"""
+import asyncio
+import csv
+import datetime
+import os
+
+from django.conf import settings
+
+from finstars.async_http import get_json as async_get_json
+from finstars.http_client import get_json
+
+OPEN_METEO_ARCHIVE_URL = 'https://archive-api.open-meteo.com/v1/archive'
+OPEN_METEO_TIMEZONE = 'Asia/Bangkok'
+
+# Поля хранилища -> столбцы yfinance history()
+YFINANCE_COLUMNS = {
+    'open': 'Open',
+    'high': 'High',
+    'low': 'Low',
+    'close': 'Close',
+    'volume': 'Volume',
+}
+
+
+def _to_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(str(value)[:10])
+
+
+def _to_float(value):
+    if value is None or value == '':
+        return None
+    value = float(value)
+    return None if value != value else value  # NaN -> None
+
+
+def fetch_yfinance(key, fields, start_date, end_date):
+    """key — тикер, например '^GSPC'"""
+    import yfinance as yf
+
+    # В yfinance конец диапазона не включается
+    history = yf.Ticker(key).history(start=start_date, end=end_date + datetime.timedelta(days=1))
+    dates = [timestamp.date() for timestamp in history.index]
+    return {
+        field: list(zip(dates, map(_to_float, history[YFINANCE_COLUMNS[field]].tolist())))
+        for field in fields
+    }
+
+
+def date_chunks(start_date, end_date, days):
+    """[start_date, end_date], разбитый на последовательные куски не длиннее days дней"""
+    chunks = []
+    while start_date <= end_date:
+        chunk_end = min(start_date + datetime.timedelta(days=days - 1), end_date)
+        chunks.append((start_date, chunk_end))
+        start_date = chunk_end + datetime.timedelta(days=1)
+    return chunks
+
+
+def open_meteo_params(lat, lon, fields, start_date, end_date):
+    return {
+        'latitude': lat,
+        'longitude': lon,
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'daily': ','.join(fields),
+        'timezone': OPEN_METEO_TIMEZONE,
+    }
+
+
+def open_meteo_chunks(start_date, end_date):
+    return date_chunks(start_date, end_date, getattr(settings, 'OPEN_METEO_CHUNK_DAYS', 3660))
+
+
+def open_meteo_url():
+    # Адрес можно заменить в настройках (например, на локальную заглушку в нагрузочном тесте)
+    return getattr(settings, 'OPEN_METEO_ARCHIVE_URL', OPEN_METEO_ARCHIVE_URL)
+
+
+def add_open_meteo_daily(series, fields, daily):
+    dates = [_to_date(value) for value in daily['time']]
+    for field in fields:
+        series[field].extend(zip(dates, map(_to_float, daily[field])))
+
+
+def fetch_open_meteo(key, fields, start_date, end_date):
+    """
+    key — координаты 'lat,lon', fields — дневные переменные архива Open-Meteo.
+    Все переменные запрашиваются одним вызовом через общую сессию, длинные диапазоны —
+    кусками по OPEN_METEO_CHUNK_DAYS дней.
+    """
+    lat, lon = key.split(',')
+    series = {field: [] for field in fields}
+    for chunk_start, chunk_end in open_meteo_chunks(start_date, end_date):
+        data = get_json(open_meteo_url(), params=open_meteo_params(lat, lon, fields, chunk_start, chunk_end))
+        add_open_meteo_daily(series, fields, data['daily'])
+    return series
+
+
+async def afetch_open_meteo(key, fields, start_date, end_date):
+    """fetch_open_meteo для async-представлений: куски диапазона запрашиваются одновременно через httpx"""
+    lat, lon = key.split(',')
+    responses = await asyncio.gather(*(
+        async_get_json(open_meteo_url(), params=open_meteo_params(lat, lon, fields, chunk_start, chunk_end))
+        for chunk_start, chunk_end in open_meteo_chunks(start_date, end_date)
+    ))
+
+    series = {field: [] for field in fields}
+    for data in responses:
+        add_open_meteo_daily(series, fields, data['daily'])
+    return series
+
+
+class CsvFetcher:
+    """
+    Локальная замена сетевого загрузчика: ряды берутся из directory/<key>.csv
+    со столбцами date и полями (пустая ячейка — нет значения).
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.calls = []  # (key, fields, start_date, end_date) — какие диапазоны запрашивались
+
+    def __call__(self, key, fields, start_date, end_date):
+        self.calls.append((key, tuple(fields), start_date, end_date))
+        series = {field: [] for field in fields}
+
+        path = os.path.join(self.directory, f'{key}.csv')
+        with open(path, newline='', encoding='utf-8') as file:
+            for record in csv.DictReader(file):
+                date = _to_date(record['date'])
+                if start_date <= date <= end_date:
+                    for field in fields:
+                        series[field].append((date, _to_float(record.get(field))))
+        return series
@@ -0,0 +1,161 @@
+import asyncio
+import datetime
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, override_settings
+
+from weather import timeseries
+from weather.fetchers import afetch_open_meteo, fetch_open_meteo
+from weather.timeseries import ONE_DAY, TimeSeriesStore, subtract_ranges, union_ranges
+
+ORIGIN = datetime.date(1950, 1, 1)
+
+
+class StubOpenMeteoHandler(BaseHTTPRequestHandler):
+    """Заглушка архива Open-Meteo: синтетические дневные значения после задержки latency"""
+    latency = 0.2
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        query = parse_qs(urlparse(self.path).query)
+        start = datetime.date.fromisoformat(query['start_date'][0])
+        end = datetime.date.fromisoformat(query['end_date'][0])
+        days = (end - start).days + 1
+
+        daily = {'time': [(start + datetime.timedelta(days=day)).isoformat() for day in range(days)]}
+        for field in query['daily'][0].split(','):
+            daily[field] = [float((start.toordinal() + day) % 17) for day in range(days)]
+
+        body = json.dumps({'daily': daily}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def synthetic_market(key, fields, start_date, end_date):
+    """Котировки без сети: yfinance в нагрузочном тесте не вызывается"""
+    dates = [start_date + datetime.timedelta(days=day) for day in range((end_date - start_date).days + 1)]
+    return {field: [(date, 4000.0 + date.toordinal() % 100) for date in dates if date.weekday() < 5]
+            for field in fields}
+
+
+class MemoryTimeSeriesStore(TimeSeriesStore):
+    """Хранилище в памяти процесса: тест не пишет синтетические ряды в базу"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values = {}
+        self.coverage = {}
+        self.lock = threading.Lock()
+
+    def missing_ranges(self, source, key, fields, start_date, end_date):
+        with self.lock:
+            missing = []
+            for field in fields:
+                covered = sorted(self.coverage.get((source, key, field), []))
+                missing.extend(subtract_ranges(start_date, end_date, covered))
+            return union_ranges(missing)
+
+    def read_series(self, source, key, fields, start_date, end_date):
+        with self.lock:
+            return {
+                field: sorted((date, value) for date, value in self.values.get((source, key, field), {}).items()
+                              if start_date <= date <= end_date)
+                for field in fields
+            }
+
+    def save(self, source, key, fields, start_date, end_date, fetched):
+        with self.lock:
+            for field in fields:
+                self.values.setdefault((source, key, field), {}).update(fetched.get(field, []))
+                self.coverage.setdefault((source, key, field), []).append((start_date, end_date))
+
+
+class Command(BaseCommand):
+    help = ("Нагрузочный тест погодного графика: синхронное и async-представление под одним ASGI-приложением "
+            "против локальной заглушки Open-Meteo; пропускная способность и задержки по уровням параллельности")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', default='1,4,16,64',
+                            help='Уровни параллельности через запятую')
+        parser.add_argument('--requests', type=int, default=64, help='Запросов на каждый уровень')
+        parser.add_argument('--latency', type=float, default=0.2, help='Задержка ответа заглушки, секунд')
+        parser.add_argument('--views', default='sync,async', help='Какие представления сравнивать')
+
+    def handle(self, *args, **options):
+        try:
+            levels = [int(value) for value in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError('--concurrency: целые числа через запятую')
+        paths = {'sync': '/weather/', 'async': '/weather/async/'}
+        views = [view for view in options['views'].split(',') if view in paths]
+
+        StubOpenMeteoHandler.latency = options['latency']
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubOpenMeteoHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        stub_url = f'http://127.0.0.1:{server.server_address[1]}/v1/archive'
+        self.stdout.write(f"Stub Open-Meteo at {stub_url}, latency {options['latency']}s")
+
+        self.request_index = 0
+        try:
+            with override_settings(OPEN_METEO_ARCHIVE_URL=stub_url, HTTP_POOL_SIZE=max(levels) * 2):
+                for view in views:
+                    for level in levels:
+                        self.run_level(view, paths[view], level, options['requests'])
+        finally:
+            server.shutdown()
+            timeseries.reset_timeseries_store()
+
+    def run_level(self, view, path, concurrency, count):
+        # Новое хранилище на каждый прогон, у каждого запроса свой месяц: все запросы идут в заглушку
+        timeseries._store = MemoryTimeSeriesStore(
+            fetchers={'yfinance': synthetic_market, 'open-meteo': fetch_open_meteo},
+            async_fetchers={'open-meteo': afetch_open_meteo},
+        )
+        ranges = []
+        for _ in range(count):
+            start = ORIGIN + datetime.timedelta(days=31 * self.request_index)
+            ranges.append((start, start + datetime.timedelta(days=27)))
+            self.request_index += 1
+
+        latencies, failures, elapsed = asyncio.run(self.drive(path, ranges, concurrency))
+        self.report(view, concurrency, count, latencies, failures, elapsed)
+
+    async def drive(self, path, ranges, concurrency):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies, failures = [], 0
+
+        async def one(start_date, end_date):
+            nonlocal failures
+            async with semaphore:
+                started = time.monotonic()
+                response = await client.get(path, {'start_date': start_date.isoformat(),
+                                                   'end_date': (end_date - ONE_DAY).isoformat()})
+                latencies.append(time.monotonic() - started)
+                if response.status_code != 200 or b'combined-plot' not in response.content:
+                    failures += 1
+
+        started = time.monotonic()
+        await asyncio.gather(*(one(start_date, end_date) for start_date, end_date in ranges))
+        return latencies, failures, time.monotonic() - started
+
+    def report(self, view, concurrency, count, latencies, failures, elapsed):
+        latencies = sorted(latencies)
+        p95 = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+        self.stdout.write(
+            f"{view:>5} c={concurrency:<3} {count} req in {elapsed:6.2f}s  "
+            f"{count / elapsed:7.1f} req/s  p50 {statistics.median(latencies) * 1000:7.0f} ms  "
+            f"p95 {p95 * 1000:7.0f} ms  failed {failures}")
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.15 on 2026-10-18 07:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeriesCoverage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=32)),
+                ('key', models.CharField(max_length=64)),
+                ('field', models.CharField(max_length=64)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+            ],
+            options={
+                'db_table': 'weather_series_coverage',
+                'indexes': [models.Index(fields=['source', 'key', 'field', 'start_date'], name='weather_series_coverage_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SeriesValue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=32)),
+                ('key', models.CharField(max_length=64)),
+                ('field', models.CharField(max_length=64)),
+                ('date', models.DateField()),
+                ('value', models.FloatField(null=True)),
+            ],
+            options={
+                'db_table': 'weather_series_values',
+                'constraints': [models.UniqueConstraint(fields=('source', 'key', 'field', 'date'), name='weather_series_values_uniq')],
+            },
+        ),
+    ]
@@ -1,3 +1,40 @@
 from django.db import models
 
-# Create your models here.
+
+class SeriesValue(models.Model):
+    """Значение дневного ряда внешнего источника (yfinance, Open-Meteo), сохраненное локально"""
+    source = models.CharField(max_length=32)  # Например, 'yfinance', 'open-meteo'
+    key = models.CharField(max_length=64)  # Тикер или координаты 'lat,lon'
+    field = models.CharField(max_length=64)  # Например, 'close', 'precipitation_sum'
+    date = models.DateField()
+    value = models.FloatField(null=True)
+
+    class Meta:
+        db_table = 'weather_series_values'
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'key', 'field', 'date'], name='weather_series_values_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.source} {self.key} {self.field} on {self.date}: {self.value}"
+
+
+class SeriesCoverage(models.Model):
+    """
+    Диапазон дат, уже загруженный из источника. Дни без значений внутри диапазона
+    (выходные биржи) тоже считаются загруженными и повторно не запрашиваются.
+    """
+    source = models.CharField(max_length=32)
+    key = models.CharField(max_length=64)
+    field = models.CharField(max_length=64)
+    start_date = models.DateField()  # Включительно
+    end_date = models.DateField()  # Включительно
+
+    class Meta:
+        db_table = 'weather_series_coverage'
+        indexes = [
+            models.Index(fields=['source', 'key', 'field', 'start_date'], name='weather_series_coverage_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.source} {self.key} {self.field} from {self.start_date} to {self.end_date}"
@@ -1,3 +1,220 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .correlation import lagged_correlations, parallel_rolling_correlations, rolling_correlations
+from .fetchers import OPEN_METEO_ARCHIVE_URL, CsvFetcher, afetch_open_meteo, fetch_open_meteo
+from .timeseries import TimeSeriesStore
+
+
+class CorrelationTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.x = rng.normal(size=(3, 200))
+        self.y = rng.normal(size=(2, 200))
+
+    def test_rolling_matches_pandas(self):
+        result = rolling_correlations(self.x, self.y, 20)
+        for i in range(3):
+            for j in range(2):
+                expected = pd.Series(self.x[i]).rolling(20).corr(pd.Series(self.y[j])).to_numpy()[19:]
+                np.testing.assert_allclose(result[:, i, j], expected, atol=1e-9)
+
+    def test_lagged_matches_numpy(self):
+        result = lagged_correlations(self.x, self.y, [0, 3, -2])
+        np.testing.assert_allclose(result[1, 1, 0], np.corrcoef(self.x[1, :-3], self.y[0, 3:])[0, 1])
+        np.testing.assert_allclose(result[2, 2, 1], np.corrcoef(self.x[2, 2:], self.y[1, :-2])[0, 1])
+
+    @override_settings(CORRELATION_PARALLEL_THRESHOLD=0)
+    def test_parallel_blocks_match_single_pass(self):
+        np.testing.assert_allclose(parallel_rolling_correlations(self.x, self.y, 20),
+                                   rolling_correlations(self.x, self.y, 20))
+
+
+def day(number):
+    return datetime.date(2020, 1, number)
+
+
+class CorrelationParamsTests(SimpleTestCase):
+    def get(self, path, **params):
+        with mock.patch('weather.views.compute_correlations') as compute:
+            response = self.client.get(path, dict({'start_date': '2024-01-01', 'end_date': '2024-03-31'}, **params))
+        compute.assert_not_called()
+        return response
+
+    def test_invalid_numbers_get_explicit_400(self):
+        for params, message in (
+            ({'max_lag': 'x'}, 'Параметр max_lag должен быть целым числом, получено x.'),
+            ({'window': '1.5'}, 'Параметр window должен быть целым числом, получено 1.5.'),
+            ({'start_date': '2024-13-01'}, 'Некорректная дата 2024-13-01.'),
+            ({'end_date': '2023-12-31'}, 'Начальная дата позже конечной.'),
+        ):
+            with self.subTest(params=params):
+                response = self.get('/weather/api/correlation/', **params)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'error': message})
+
+        response = self.get('/weather/correlation/', max_lag='x')
+        self.assertContains(response, 'Параметр max_lag должен быть целым числом', status_code=400)
+
+    @override_settings(CORRELATION_MAX_DAYS=60, CORRELATION_MAX_PAIRS=2)
+    def test_limits_from_settings(self):
+        response = self.get('/weather/api/correlation/')
+        self.assertEqual(response.json(), {'error': 'Диапазон не длиннее 60 дней.'})
+
+        response = self.get('/weather/api/correlation/', end_date='2024-01-31',
+                            location=['1,1', '2,2'], ticker=['A', 'B'])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Не больше 2 пар точка x тикер в одном запросе.'})
+
+
+def open_meteo_response(params):
+    """Ответ архива Open-Meteo за даты из параметров: значение поля — номер дня плюс доля от поля"""
+    start = datetime.date.fromisoformat(params['start_date'])
+    days = (datetime.date.fromisoformat(params['end_date']) - start).days + 1
+    dates = [start + datetime.timedelta(days=i) for i in range(days)]
+    daily = {'time': [day.isoformat() for day in dates]}
+    for i, field in enumerate(params['daily'].split(',')):
+        daily[field] = [day.toordinal() + i / 10 for day in dates]
+    return {'daily': daily}
+
+
+class StubResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+class StubSession:
+    def __init__(self):
+        self.calls = []
+
+    def get(self, url, params=None, timeout=None):
+        self.calls.append((url, params))
+        return StubResponse(open_meteo_response(params))
+
+
+@override_settings(OPEN_METEO_CHUNK_DAYS=30)
+class OpenMeteoFetcherTests(SimpleTestCase):
+    FIELDS = ['temperature_2m_max', 'precipitation_sum']
+    START, END = datetime.date(2024, 1, 15), datetime.date(2024, 4, 2)
+
+    def assert_stitched(self, series):
+        days = (self.END - self.START).days + 1
+        expected_dates = [self.START + datetime.timedelta(days=i) for i in range(days)]
+        for i, field in enumerate(self.FIELDS):
+            self.assertEqual([date for date, _ in series[field]], expected_dates, field)
+            self.assertEqual([value for _, value in series[field]],
+                             [date.toordinal() + i / 10 for date in expected_dates], field)
+
+    def assert_chunk_params(self, params_list):
+        # По запросу на кусок, в каждом — все переменные; куски идут подряд без пропусков и наложений
+        self.assertEqual(len(params_list), 3)
+        self.assertEqual({params['daily'] for params in params_list}, {','.join(self.FIELDS)})
+        self.assertEqual({(params['latitude'], params['longitude']) for params in params_list}, {('7.88', '98.39')})
+        bounds = [(params['start_date'], params['end_date']) for params in params_list]
+        self.assertEqual(bounds, [('2024-01-15', '2024-02-13'), ('2024-02-14', '2024-03-14'),
+                                  ('2024-03-15', '2024-04-02')])
+
+    def test_one_request_per_chunk_with_all_fields(self):
+        session = StubSession()
+        with mock.patch('finstars.http_client.get_session', return_value=session):
+            series = fetch_open_meteo('7.88,98.39', self.FIELDS, self.START, self.END)
+
+        self.assertEqual({url for url, _ in session.calls}, {OPEN_METEO_ARCHIVE_URL})
+        self.assert_chunk_params([params for _, params in session.calls])
+        self.assert_stitched(series)
+
+    async def test_async_chunks_are_stitched_in_date_order(self):
+        params_list = []
+
+        async def get_json(url, params=None):
+            params_list.append(params)
+            # Первый кусок отвечает последним
+            await asyncio.sleep(0.03 if params['start_date'] == '2024-01-15' else 0)
+            return open_meteo_response(params)
+
+        with mock.patch('weather.fetchers.async_get_json', get_json):
+            series = await afetch_open_meteo('7.88,98.39', self.FIELDS, self.START, self.END)
+
+        self.assert_chunk_params(params_list)
+        self.assert_stitched(series)
+
+
+class TimeSeriesStoreTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # Январь 2020 без выходных; у 7 января нет объема
+        self.expected = {'close': [], 'volume': []}
+        with open(os.path.join(directory.name, 'TEST.csv'), 'w', encoding='utf-8') as file:
+            file.write('date,close,volume\n')
+            for number in range(1, 32):
+                if day(number).weekday() >= 5:
+                    continue
+                volume = '' if number == 7 else str(number * 10)
+                file.write(f'{day(number).isoformat()},{number}.5,{volume}\n')
+                self.expected['close'].append((day(number), number + 0.5))
+                self.expected['volume'].append((day(number), None if number == 7 else number * 10.0))
+
+        self.fetcher = CsvFetcher(directory.name)
+        self.store = TimeSeriesStore(fetchers={'csv': self.fetcher}, refresh_days=7)
+
+    def expected_range(self, field, start_date, end_date):
+        return [(date, value) for date, value in self.expected[field] if start_date <= date <= end_date]
+
+    def test_only_gaps_are_fetched(self):
+        self.store.get_series('csv', 'TEST', ['close'], day(10), day(15))
+        series = self.store.get_series('csv', 'TEST', ['close'], day(1), day(20))
+
+        self.assertEqual(series['close'], self.expected_range('close', day(1), day(20)))
+        self.assertEqual(self.fetcher.calls, [
+            ('TEST', ('close',), day(10), day(15)),
+            ('TEST', ('close',), day(1), day(9)),
+            ('TEST', ('close',), day(16), day(20)),
+        ])
+
+    def test_days_without_values_are_not_fetched_again(self):
+        # 4-5 января — выходные: строк нет, но диапазон отмечен загруженным
+        self.store.get_series('csv', 'TEST', ['close', 'volume'], day(1), day(10))
+        series = self.store.get_series('csv', 'TEST', ['close', 'volume'], day(3), day(8))
+
+        self.assertEqual(len(self.fetcher.calls), 1)
+        self.assertEqual(series['volume'], self.expected_range('volume', day(3), day(8)))
+
+    def test_field_without_coverage_is_fetched(self):
+        self.store.get_series('csv', 'TEST', ['close'], day(1), day(10))
+        series = self.store.get_series('csv', 'TEST', ['close', 'volume'], day(1), day(10))
+
+        self.assertEqual(self.fetcher.calls[1], ('TEST', ('close', 'volume'), day(1), day(10)))
+        self.assertEqual(series['close'], self.expected_range('close', day(1), day(10)))
+        self.assertEqual(series['volume'], self.expected_range('volume', day(1), day(10)))
+
+    def test_recent_days_are_fetched_again(self):
+        store = TimeSeriesStore(fetchers={'csv': self.fetcher}, refresh_days=(datetime.date.today() - day(20)).days)
+        store.get_series('csv', 'TEST', ['close'], day(10), day(25))
+        store.get_series('csv', 'TEST', ['close'], day(10), day(25))
+
+        # Дни после final_date (20 января) не отмечаются загруженными
+        self.assertEqual(self.fetcher.calls[1], ('TEST', ('close',), day(21), day(25)))
+
+    async def test_async_store_fetches_the_same_gaps(self):
+        await self.store.aget_series('csv', 'TEST', ['close'], day(10), day(15))
+        series = await self.store.aget_series('csv', 'TEST', ['close'], day(1), day(20))
+
+        self.assertEqual(series['close'], self.expected_range('close', day(1), day(20)))
+        self.assertEqual(sorted(self.fetcher.calls[1:]), [
+            ('TEST', ('close',), day(1), day(9)),
+            ('TEST', ('close',), day(16), day(20)),
+        ])
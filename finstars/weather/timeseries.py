@@ -0,0 +1,177 @@
+"""
+Локальное хранилище дневных рядов внешних источников (yfinance, Open-Meteo).
+
+Ряд задается источником, ключом (тикер или координаты) и полем. На каждый запрос
+вычисляются еще не загруженные поддиапазоны дат, из источника запрашиваются только они,
+остальное читается из базы. Загруженные диапазоны хранятся отдельно (SeriesCoverage),
+поэтому дни без значений (выходные биржи) повторно не запрашиваются. Последние
+TIMESERIES_REFRESH_DAYS дней не считаются окончательными и запрашиваются заново.
+"""
+import asyncio
+import datetime
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .models import SeriesCoverage, SeriesValue
+
+ONE_DAY = datetime.timedelta(days=1)
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def subtract_ranges(start_date, end_date, covered):
+    """Части [start_date, end_date], не покрытые отсортированными по началу диапазонами covered"""
+    missing = []
+    current = start_date
+    for covered_start, covered_end in covered:
+        if covered_end < current:
+            continue
+        if covered_start > end_date:
+            break
+        if covered_start > current:
+            missing.append((current, covered_start - ONE_DAY))
+        current = max(current, covered_end + ONE_DAY)
+    if current <= end_date:
+        missing.append((current, end_date))
+    return missing
+
+
+def union_ranges(ranges):
+    """Объединение пересекающихся и соседних диапазонов дат"""
+    merged = []
+    for start_date, end_date in sorted(ranges):
+        if merged and start_date <= merged[-1][1] + ONE_DAY:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end_date))
+        else:
+            merged.append((start_date, end_date))
+    return merged
+
+
+class TimeSeriesStore:
+    """
+    fetchers — {источник: загрузчик} (см. weather.fetchers); по умолчанию
+    загрузчики из settings.TIMESERIES_FETCHERS.
+    """
+
+    def __init__(self, fetchers=None, refresh_days=None, async_fetchers=None):
+        if fetchers is None:
+            fetchers = {source: import_string(path)
+                        for source, path in getattr(settings, 'TIMESERIES_FETCHERS', {}).items()}
+            if async_fetchers is None:
+                async_fetchers = {source: import_string(path)
+                                  for source, path in getattr(settings, 'TIMESERIES_ASYNC_FETCHERS', {}).items()}
+        self.fetchers = fetchers
+        # Источники без корутинного загрузчика в aget_series загружаются обычным в потоке
+        self.async_fetchers = async_fetchers or {}
+        self.refresh_days = (refresh_days if refresh_days is not None
+                             else getattr(settings, 'TIMESERIES_REFRESH_DAYS', 7))
+
+    def final_date(self):
+        """Последний день, данные за который уже не меняются"""
+        return datetime.date.today() - datetime.timedelta(days=self.refresh_days)
+
+    def missing_ranges(self, source, key, fields, start_date, end_date):
+        """Поддиапазоны [start_date, end_date], которых нет хотя бы для одного из fields"""
+        coverage = {field: [] for field in fields}
+        rows = (SeriesCoverage.objects
+                .filter(source=source, key=key, field__in=fields,
+                        start_date__lte=end_date, end_date__gte=start_date)
+                .order_by('start_date')
+                .values_list('field', 'start_date', 'end_date'))
+        for field, covered_start, covered_end in rows:
+            coverage[field].append((covered_start, covered_end))
+
+        missing = []
+        for field in fields:
+            missing.extend(subtract_ranges(start_date, end_date, coverage[field]))
+        return union_ranges(missing)
+
+    def get_series(self, source, key, fields, start_date, end_date):
+        """
+        {field: [(date, value), ...]} за [start_date, end_date] включительно, по возрастанию дат.
+        Недостающие диапазоны загружаются из источника; ошибки загрузчика не перехватываются.
+        """
+        fields = list(fields)
+        for missing_start, missing_end in self.missing_ranges(source, key, fields, start_date, end_date):
+            fetched = self.fetchers[source](key, fields, missing_start, missing_end)
+            self.save(source, key, fields, missing_start, missing_end, fetched)
+
+        return self.read_series(source, key, fields, start_date, end_date)
+
+    async def aget_series(self, source, key, fields, start_date, end_date):
+        """get_series для async-представлений: недостающие диапазоны загружаются одновременно"""
+        fields = list(fields)
+        missing = await sync_to_async(self.missing_ranges)(source, key, fields, start_date, end_date)
+        if missing:
+            fetcher = self.async_fetchers.get(source)
+            if fetcher is None:
+                fetcher = sync_to_async(self.fetchers[source], thread_sensitive=False)
+            fetched = await asyncio.gather(*(fetcher(key, fields, start, end) for start, end in missing))
+            for (missing_start, missing_end), data in zip(missing, fetched):
+                await sync_to_async(self.save)(source, key, fields, missing_start, missing_end, data)
+
+        return await sync_to_async(self.read_series)(source, key, fields, start_date, end_date)
+
+    def read_series(self, source, key, fields, start_date, end_date):
+        series = {field: [] for field in fields}
+        rows = (SeriesValue.objects
+                .filter(source=source, key=key, field__in=fields, date__gte=start_date, date__lte=end_date)
+                .order_by('date')
+                .values_list('field', 'date', 'value'))
+        for field, date, value in rows:
+            series[field].append((date, value))
+        return series
+
+    def save(self, source, key, fields, start_date, end_date, fetched):
+        values = [
+            SeriesValue(source=source, key=key, field=field, date=date, value=value)
+            for field in fields
+            for date, value in fetched.get(field, [])
+            if start_date <= date <= end_date
+        ]
+        # Свежие дни сохраняются, но загруженными не отмечаются — следующий запрос их обновит
+        covered_end = min(end_date, self.final_date())
+
+        with transaction.atomic():
+            SeriesValue.objects.bulk_create(
+                values,
+                update_conflicts=True,
+                unique_fields=['source', 'key', 'field', 'date'],
+                update_fields=['value'],
+            )
+            if covered_end >= start_date:
+                for field in fields:
+                    self.add_coverage(source, key, field, start_date, covered_end)
+
+    def add_coverage(self, source, key, field, start_date, end_date):
+        """Добавляет диапазон, сливая его с пересекающимися и соседними"""
+        neighbours = SeriesCoverage.objects.filter(
+            source=source, key=key, field=field,
+            start_date__lte=end_date + ONE_DAY, end_date__gte=start_date - ONE_DAY,
+        )
+        for covered in neighbours:
+            start_date = min(start_date, covered.start_date)
+            end_date = max(end_date, covered.end_date)
+        neighbours.delete()
+        SeriesCoverage.objects.create(source=source, key=key, field=field,
+                                      start_date=start_date, end_date=end_date)
+
+
+def get_timeseries_store():
+    """Общее хранилище с загрузчиками из настроек"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TimeSeriesStore()
+        return _store
+
+
+def reset_timeseries_store():
+    global _store
+    with _store_lock:
+        _store = None
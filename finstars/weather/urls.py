@@ -1,6 +1,9 @@
 from django.urls import path
-from .views import plot_combined_graphs
+from .views import correlation_api, correlation_chart, plot_combined_graphs, plot_combined_graphs_async
 
 urlpatterns = [
     path('', plot_combined_graphs, name='combined_graphs'),
+    path('async/', plot_combined_graphs_async, name='combined_graphs_async'),
+    path('correlation/', correlation_chart, name='weather_correlation'),
+    path('api/correlation/', correlation_api, name='weather_correlation_api'),
 ]
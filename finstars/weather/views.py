@@ -1,10 +1,25 @@
+import logging
 from datetime import datetime
-import yfinance as yf
-import requests
-import plotly.graph_objs as go
-from plotly.subplots import make_subplots
+from asgiref.sync import sync_to_async
+import numpy as np
+from django.conf import settings
+from django.http import JsonResponse
 from django.shortcuts import render
 
+from finstars.concurrency import fetch_concurrently, gather_sources
+from finstars.downsampling import downsample, parse_max_points
+
+from .timeseries import get_timeseries_store
+
+logger = logging.getLogger(__name__)
+
+# Таймауты источников (в секундах) при параллельной загрузке
+SOURCE_TIMEOUTS = {
+    'sp500': 20,
+    'weather': 15,
+}
+
+
 # Функция для получения текущей даты и начала года
 def get_default_dates():
     # Начальная дата: 1 января текущего года
@@ -13,49 +28,97 @@ def get_default_dates():
     end_date = datetime.now().strftime('%Y-%m-%d')
     return start_date, end_date
 
+# Ряды читаются из локального хранилища, из сети загружаются только недостающие даты
+SP500_SYMBOL = '^GSPC'
+PHUKET_LOCATION = (7.8804, 98.3923)
+
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date() if isinstance(value, str) else value
+
+
+def _location_key(lat, lon):
+    return f'{lat},{lon}'
+
+
+def _to_pandas(rows, name):
+    # pandas, plotly и httpx импортируются при первом использовании: воркерам,
+    # которые обслуживают только /search/, они не нужны
+    import pandas as pd
+
+    rows = [(date, value) for date, value in rows if value is not None]
+    return pd.Series([value for _, value in rows], index=pd.to_datetime([date for date, _ in rows]),
+                     dtype=float, name=name)
+
+
+# Цены закрытия тикера за заданный период
+def get_ticker_data(symbol, start_date, end_date):
+    series = get_timeseries_store().get_series(
+        'yfinance', symbol, ['close'], _parse_date(start_date), _parse_date(end_date))
+    return _to_pandas(series['close'], 'Close')
+
+
 # Получаем данные по S&P 500 за заданный период
 def get_sp500_data(start_date, end_date):
-    sp500 = yf.Ticker("^GSPC")
-    hist = sp500.history(start=start_date, end=end_date)
-    return hist['Close']
+    return get_ticker_data(SP500_SYMBOL, start_date, end_date)
+
+
+async def get_sp500_data_async(start_date, end_date):
+    series = await get_timeseries_store().aget_series(
+        'yfinance', SP500_SYMBOL, ['close'], _parse_date(start_date), _parse_date(end_date))
+    return _to_pandas(series['close'], 'Close')
+
+
+# Одна дневная переменная Open-Meteo для точки как pd.Series
+def get_weather_series(field, start_date, end_date, lat, lon):
+    series = get_timeseries_store().get_series(
+        'open-meteo', _location_key(lat, lon), [field], _parse_date(start_date), _parse_date(end_date))
+    return _to_pandas(series[field], field)
+
+
+# Дневные переменные Open-Meteo, запрашиваемые одним вызовом
+WEATHER_FIELDS = ['temperature_2m_max', 'precipitation_sum']
 
-# Исправленная функция получения данных о погоде через Open-Meteo
-def get_open_meteo_weather(start_date, end_date, lat=7.8804, lon=98.3923):
-    url = f'https://archive-api.open-meteo.com/v1/archive?latitude={lat}&longitude={lon}&start_date={start_date}&end_date={end_date}&daily=temperature_2m_max&timezone=Asia/Bangkok'
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
 
-        daily_temps = data['daily']['temperature_2m_max']
-        dates = data['daily']['time']
-        return dates, daily_temps
+# Температура и осадки через Open-Meteo одним запросом: (dates, temperatures, precipitation)
+def get_weather_data(start_date, end_date, lat=PHUKET_LOCATION[0], lon=PHUKET_LOCATION[1]):
+    import requests
+
+    try:
+        series = get_timeseries_store().get_series(
+            'open-meteo', _location_key(lat, lon), WEATHER_FIELDS, _parse_date(start_date), _parse_date(end_date))
     except requests.exceptions.RequestException as e:
-        print(f"Error fetching weather data: {e}")
-        return [], []
+        logger.warning("Error fetching weather data: %s", e)
+        return [], [], []
+
+    return _weather_lists(series)
 
 
-# Получаем данные по осадкам через Open-Meteo
-def get_precipitation_data(start_date, end_date, lat=7.8804, lon=98.3923):
-    url = f'https://archive-api.open-meteo.com/v1/archive?latitude={lat}&longitude={lon}&start_date={start_date}&end_date={end_date}&daily=precipitation_sum&timezone=Asia/Bangkok'
+async def get_weather_data_async(start_date, end_date, lat=PHUKET_LOCATION[0], lon=PHUKET_LOCATION[1]):
+    import httpx
+    import requests
+
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
+        series = await get_timeseries_store().aget_series(
+            'open-meteo', _location_key(lat, lon), WEATHER_FIELDS, _parse_date(start_date), _parse_date(end_date))
+    except (requests.exceptions.RequestException, httpx.HTTPError) as e:
+        logger.warning("Error fetching weather data: %s", e)
+        return [], [], []
 
-        daily_precipitation = data['daily']['precipitation_sum']
-        dates = data['daily']['time']
+    return _weather_lists(series)
 
-        # Заменяем None на 0 в данных об осадках
-        daily_precipitation = [precip if precip is not None else 0 for precip in daily_precipitation]
 
-        return dates, daily_precipitation
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching precipitation data: {e}")
-        return [], []
+def _weather_lists(series):
+    temperatures = series['temperature_2m_max']
+    dates = [date.isoformat() for date, _ in temperatures]
+    daily_temps = [value for _, value in temperatures]
+    # Заменяем None на 0 в данных об осадках
+    daily_precipitation = [precip if precip is not None else 0 for _, precip in series['precipitation_sum']]
 
+    return dates, daily_temps, daily_precipitation
 
-def plot_combined_graphs(request):
+
+def get_requested_dates(request):
     # Получаем дефолтные даты (начало года и текущая дата)
     default_start_date, default_end_date = get_default_dates()
 
@@ -65,9 +128,39 @@ def plot_combined_graphs(request):
 
     try:
         # Проверка на корректность формата дат
-        start_date_obj = datetime.strptime(start_date, '%Y-%m-%d')
-        end_date_obj = datetime.strptime(end_date, '%Y-%m-%d')
+        datetime.strptime(start_date, '%Y-%m-%d')
+        datetime.strptime(end_date, '%Y-%m-%d')
     except ValueError:
+        return start_date, end_date, False
+    return start_date, end_date, True
+
+
+def plot_combined_graphs(request):
+    start_date, end_date, valid = get_requested_dates(request)
+    if not valid:
+        return render(request, 'weather/weather.html', {
+            'error': 'Некорректный формат даты.',
+            'combined_div': None,
+            'start_date': start_date,
+            'end_date': end_date
+        })
+
+    # S&P 500 и погода не зависят друг от друга — загружаем параллельно,
+    # каждый источник со своим таймаутом
+    results, errors = fetch_concurrently({
+        'sp500': (get_sp500_data, (start_date, end_date), SOURCE_TIMEOUTS['sp500']),
+        'weather': (get_weather_data, (start_date, end_date), SOURCE_TIMEOUTS['weather']),
+    })
+    return render_combined_graphs(request, start_date, end_date, results)
+
+
+async def plot_combined_graphs_async(request):
+    """
+    plot_combined_graphs для ASGI: ожидание Open-Meteo (httpx) и базы не занимает поток воркера,
+    поэтому один воркер обслуживает много одновременных запросов
+    """
+    start_date, end_date, valid = get_requested_dates(request)
+    if not valid:
         return render(request, 'weather/weather.html', {
             'error': 'Некорректный формат даты.',
             'combined_div': None,
@@ -75,14 +168,24 @@ def plot_combined_graphs(request):
             'end_date': end_date
         })
 
-    # Получаем данные по S&P 500 за заданный период
-    sp500_data = get_sp500_data(start_date, end_date)
+    results, errors = await gather_sources({
+        'sp500': (get_sp500_data_async, (start_date, end_date), SOURCE_TIMEOUTS['sp500']),
+        'weather': (get_weather_data_async, (start_date, end_date), SOURCE_TIMEOUTS['weather']),
+    })
+    # Построение фигуры — работа процессора, она не должна останавливать цикл событий
+    return await sync_to_async(render_combined_graphs, thread_sensitive=False)(request, start_date, end_date, results)
+
 
-    # Получаем данные по погоде (температура) за заданный период
-    weather_dates, weather_temps = get_open_meteo_weather(start_date=start_date, end_date=end_date)
+def render_combined_graphs(request, start_date, end_date, results):
+    import plotly.graph_objs as go
+    from plotly.subplots import make_subplots
 
-    # Получаем данные по осадкам за заданный период
-    precipitation_dates, precipitation_data = get_precipitation_data(start_date=start_date, end_date=end_date)
+    # Если упал только S&P 500, погоду все равно показываем
+    sp500_data = results.get('sp500')
+    if sp500_data is None:
+        sp500_data = _to_pandas([], 'Close')
+    weather_dates, weather_temps, precipitation_data = results.get('weather', ([], [], []))
+    precipitation_dates = weather_dates
 
     # Проверяем, что данные по температуре и осадкам успешно получены
     if not weather_dates or not weather_temps or not precipitation_dates or not precipitation_data:
@@ -93,11 +196,19 @@ def plot_combined_graphs(request):
             'end_date': end_date
         })
 
+    # Длинные ряды прореживаются до max_points точек (LTTB); при приближении страница
+    # перезапрашивает суженный диапазон и получает полное разрешение
+    max_points = parse_max_points(request.GET.get('max_points'), settings.CHART_MAX_POINTS)
+    sp500_dates, sp500_values = downsample(sp500_data.index, sp500_data.values, max_points)
+    weather_dates, weather_temps = downsample(weather_dates, weather_temps, max_points)
+    precipitation_max = max(precipitation_data)
+    precipitation_dates, precipitation_data = downsample(precipitation_dates, precipitation_data, max_points)
+
     # Создаем фигуру с увеличенной высотой и уменьшенными промежутками
     fig = make_subplots(rows=3, cols=1, shared_xaxes=True, vertical_spacing=0.03)
 
     # Линия S&P 500
-    fig.add_trace(go.Scatter(x=sp500_data.index, y=sp500_data.values, name="S&P 500"), row=1, col=1)
+    fig.add_trace(go.Scatter(x=sp500_dates, y=sp500_values, name="S&P 500"), row=1, col=1)
     fig.update_yaxes(title_text="S&P 500 Value", row=1, col=1)
 
     # Линия температуры
@@ -106,7 +217,7 @@ def plot_combined_graphs(request):
 
     # Линия осадков с инверсией оси Y (чтобы осадки уходили вниз)
     fig.add_trace(go.Scatter(x=precipitation_dates, y=precipitation_data, name="Precipitation Phuket"), row=3, col=1)
-    fig.update_yaxes(range=[max(precipitation_data), 0], title_text="Precipitation (mm)", row=3, col=1)
+    fig.update_yaxes(range=[precipitation_max, 0], title_text="Precipitation (mm)", row=3, col=1)
 
     # Обновляем ось X
     fig.update_xaxes(title_text="Date", row=3, col=1)
@@ -115,7 +226,8 @@ def plot_combined_graphs(request):
     fig.update_layout(height=900)
 
     # Преобразуем график в HTML для Django
-    combined_div = fig.to_html(full_html=False)
+    # plotly.js подключается шаблоном, а не встраивается в каждый ответ
+    combined_div = fig.to_html(full_html=False, include_plotlyjs=False, div_id='combined-plot')
 
     # Отправляем объединенный график на страницу
     return render(request, 'weather/weather.html', {
@@ -124,3 +236,178 @@ def plot_combined_graphs(request):
         'end_date': end_date
     })
 
+
+
+# Переменные Open-Meteo, доступные для корреляций, и ограничения параметров запроса
+CORRELATION_FIELDS = ['temperature_2m_max', 'temperature_2m_min', 'precipitation_sum', 'wind_speed_10m_max']
+CORRELATION_MAX_LAG = 60
+CORRELATION_MAX_SERIES = 50
+
+
+def parse_location(value):
+    """'lat,lon' -> (lat, lon) или ValueError"""
+    try:
+        lat, lon = (float(part) for part in value.split(','))
+    except ValueError:
+        raise ValueError(f'Некорректная точка {value}.')
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError(f'Некорректная точка {value}.')
+    return lat, lon
+
+
+def parse_correlation_date(value):
+    try:
+        return _parse_date(value)
+    except ValueError:
+        raise ValueError(f'Некорректная дата {value}.')
+
+
+def parse_int_param(request, name, default):
+    value = request.GET.get(name, default)
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'Параметр {name} должен быть целым числом, получено {value}.')
+
+
+def get_correlation_params(request):
+    """Параметры корреляций из GET; ValueError с текстом ошибки при некорректных значениях"""
+    default_start_date, default_end_date = get_default_dates()
+    start_date = request.GET.get('start_date', default_start_date)
+    end_date = request.GET.get('end_date', default_end_date)
+    days = (parse_correlation_date(end_date) - parse_correlation_date(start_date)).days + 1
+    if days < 1:
+        raise ValueError('Начальная дата позже конечной.')
+    if days > settings.CORRELATION_MAX_DAYS:
+        raise ValueError(f'Диапазон не длиннее {settings.CORRELATION_MAX_DAYS} дней.')
+
+    # Несколько точек и тикеров: ?location=7.88,98.39&location=40.71,-74.01&ticker=^GSPC&ticker=^IXIC
+    locations = [parse_location(value) for value in request.GET.getlist('location')] or [PHUKET_LOCATION]
+    tickers = [value.strip() for value in request.GET.getlist('ticker') if value.strip()] or [SP500_SYMBOL]
+    if len(locations) + len(tickers) > CORRELATION_MAX_SERIES:
+        raise ValueError(f'Не больше {CORRELATION_MAX_SERIES} рядов в одном запросе.')
+    if len(locations) * len(tickers) > settings.CORRELATION_MAX_PAIRS:
+        raise ValueError(f'Не больше {settings.CORRELATION_MAX_PAIRS} пар точка x тикер в одном запросе.')
+
+    field = request.GET.get('field', 'temperature_2m_max')
+    if field not in CORRELATION_FIELDS:
+        raise ValueError(f'Неизвестная переменная {field}.')
+
+    max_lag = max(min(parse_int_param(request, 'max_lag', 5), CORRELATION_MAX_LAG), 0)
+    window = parse_int_param(request, 'window', 30)
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'locations': locations,
+        'tickers': tickers,
+        'field': field,
+        'max_lag': max_lag,
+        'lags': list(range(-max_lag, max_lag + 1)),
+        'window': window if window >= 2 else None,
+    }
+
+
+def compute_correlations(params):
+    """Загружает все ряды параллельно и считает корреляции сетки точки x тикеры одним вычислением"""
+    from .correlation import correlate
+
+    start_date, end_date, field = params['start_date'], params['end_date'], params['field']
+    sources = {}
+    for lat, lon in params['locations']:
+        sources[('weather', _location_key(lat, lon))] = (
+            get_weather_series, (field, start_date, end_date, lat, lon), SOURCE_TIMEOUTS['weather'])
+    for symbol in params['tickers']:
+        sources[('market', symbol)] = (get_ticker_data, (symbol, start_date, end_date), SOURCE_TIMEOUTS['sp500'])
+
+    results, errors = fetch_concurrently(sources)
+    weather_series = {label: series for (kind, label), series in results.items() if kind == 'weather' and len(series)}
+    market_series = {label: series for (kind, label), series in results.items() if kind == 'market' and len(series)}
+    missing = [label for (_, label) in errors] + [
+        label for (_, label), series in results.items() if not len(series)]
+    if not weather_series or not market_series:
+        return None, missing
+
+    return correlate(weather_series, market_series, lags=params['lags'], window=params['window']), missing
+
+
+def _json_matrix(values):
+    """NaN -> None, округление до 4 знаков"""
+    values = np.round(values, 4)
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+def correlation_api(request):
+    """
+    JSON: общие даты, метки точек и тикеров, корреляции со сдвигом [lag][location][ticker]
+    и скользящие корреляции [date][location][ticker] в окне window наблюдений.
+    """
+    try:
+        params = get_correlation_params(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e) or 'Некорректные параметры.'}, status=400)
+
+    result, missing = compute_correlations(params)
+    if result is None:
+        return JsonResponse({'error': 'Нет данных для корреляций.', 'missing': missing}, status=502)
+
+    dates = np.datetime_as_string(result['dates'], unit='D')
+    response = {
+        'field': params['field'],
+        'start_date': dates[0] if len(dates) else None,
+        'end_date': dates[-1] if len(dates) else None,
+        'observations': len(dates),
+        'locations': result['weather'],
+        'tickers': result['market'],
+        'missing': missing,
+        'lags': result['lags'],
+        'lagged': _json_matrix(result['lagged']),
+    }
+    if 'rolling' in result:
+        response['window'] = result['window']
+        response['rolling_dates'] = np.datetime_as_string(result['rolling_dates'], unit='D').tolist()
+        response['rolling'] = _json_matrix(result['rolling'])
+    return JsonResponse(response)
+
+
+def correlation_chart(request):
+    """Тепловая карта корреляций точки x тикеры без сдвига и профиль корреляции по сдвигам"""
+    import plotly.graph_objs as go
+    from plotly.subplots import make_subplots
+
+    context = {
+        'locations': '\n'.join(request.GET.getlist('location')),
+        'tickers': '\n'.join(request.GET.getlist('ticker')),
+        'fields': CORRELATION_FIELDS,
+    }
+    try:
+        params = get_correlation_params(request)
+    except ValueError as e:
+        return render(request, 'weather/correlation.html', dict(context, error=str(e) or 'Некорректные параметры.'),
+                      status=400)
+    context.update(params)
+
+    result, missing = compute_correlations(params)
+    if result is None:
+        return render(request, 'weather/correlation.html', dict(context, error='Нет данных для корреляций.'))
+
+    lag_zero = result['lags'].index(0)
+    fig = make_subplots(rows=2, cols=1, vertical_spacing=0.12, row_heights=[0.6, 0.4],
+                        subplot_titles=('Корреляция без сдвига', 'Корреляция по сдвигам (дни наблюдений)'))
+    fig.add_trace(go.Heatmap(
+        z=result['lagged'][lag_zero],
+        x=result['market'],
+        y=result['weather'],
+        zmin=-1, zmax=1, colorscale='RdBu',
+    ), row=1, col=1)
+    for i, location in enumerate(result['weather']):
+        for j, symbol in enumerate(result['market']):
+            fig.add_trace(go.Scatter(x=result['lags'], y=result['lagged'][:, i, j],
+                                     mode='lines+markers', name=f'{location} / {symbol}'), row=2, col=1)
+    fig.update_layout(height=900)
+
+    return render(request, 'weather/correlation.html', dict(
+        context,
+        missing=missing,
+        observations=len(result['dates']),
+        chart_div=fig.to_html(full_html=False, include_plotlyjs=False, div_id='correlation-plot'),
+    ))